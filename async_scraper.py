@@ -0,0 +1,338 @@
+import asyncio
+from time import monotonic
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+import requests
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.request import ACCEPT_ENCODING
+
+from extractors import PageParser
+from scheduler import AsyncJobScheduler
+from scraper import STREAM_CHUNK_SIZE, Scraper
+
+
+class AsyncScraper(Scraper):
+    """
+    An asyncio scraper for Chewy.com - runs the same search page -> food page pipeline as Scraper, but jobs are
+    serviced by coroutines on a single event loop, with up to max_in_flight requests open at once
+    """
+
+    def __init__(self, database: str, max_in_flight: int = 50, request_timeout: int = 10, **kwargs):
+        """
+        :param database: path to database configuration file, SQLite database or database url - see database_url
+        :param max_in_flight: maximum number of requests open at once - the ceiling of the concurrency controller, if
+        one is given
+        :param request_timeout: seconds before a request times out
+        :param kwargs: any other Scraper options, i.e. logger, force, rate_limiter, parse_processes
+        """
+        # leasing jobs from a shared work queue blocks, so distributed crawls are run by the threaded Scraper
+        if kwargs.get("work_queue") is not None:
+            raise Exception("AsyncScraper can't scrape from a shared work queue - use Scraper")
+        if kwargs.get("concurrency") is not None:
+            max_in_flight = kwargs["concurrency"].ceiling
+        if kwargs.get("rate_limiter") is None:
+            kwargs["rate_limiter"] = self.default_rate_limiter(max_in_flight)
+        super().__init__(database, num_threads=0, **kwargs)
+
+        # number of requests allowed to be in flight at once - one coroutine services each slot
+        self.max_in_flight: int = max_in_flight
+        self.request_timeout: int = request_timeout
+
+        # aiohttp session, opened for the duration of scrape()
+        self.http = None
+
+        # one coroutine services each slot, so worker utilization is out of max_in_flight
+        self.metrics.set_workers(max_in_flight)
+
+    def scrape(self, url: str, resume: bool = False) -> None:
+        """
+        Enqueue jobs to scrape all search pages for dog foods, which subsequently enqueue jobs to scrape food pages,
+        and run them on an event loop until there are none left
+        :param url: starting URL for search pages
+        :param resume: pick up the jobs the last scrape left unfinished in the journal, instead of starting over
+        """
+        asyncio.run(self._scrape(url, resume))
+
+    async def _scrape(self, url: str, resume: bool = False) -> None:
+        loop = asyncio.get_running_loop()
+        jobs = await loop.run_in_executor(None, self._start_jobs, url, resume)
+        if jobs is None:
+            return
+
+        # scheduler of scraping jobs - must be created on the running loop
+        self.scrape_queue = self._new_scheduler(AsyncJobScheduler)
+        self._enqueue_lazily(jobs)
+
+        self._start_journal()
+        self.metrics.start()
+        self.db_writer.start()
+        self._start_parse_pool()
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as self.http:
+            workers = [asyncio.create_task(self.worker()) for _ in range(self.max_in_flight)]
+
+            # block until scrape queue is empty, then stop workers
+            await self.scrape_queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        self.http = None
+        self._stop_parse_pool()
+        await loop.run_in_executor(None, self.db_writer.stop)
+        await loop.run_in_executor(None, self._stop_journal)
+        await loop.run_in_executor(None, self._rebuild_ingredient_index)
+        await loop.run_in_executor(None, self.metrics.stop)
+
+        self._log_scrape_stats()
+
+    async def worker(self):
+        """
+        coroutine to pull jobs off of scrape_queue and execute the job, until cancelled
+        """
+        while True:
+            job = await self.scrape_queue.get()
+            url, scrape_func = job
+            self.metrics.worker_busy()
+            try:
+                self._job_started(url)
+                await scrape_func(url)
+                self._job_finished(url)
+            except Exception as e:
+                self.logger.error("Error while processing job for URL: {}".format(url))
+                self.logger.error("ERROR: " + str(e.args))
+            finally:
+                self.metrics.worker_idle()
+                self.scrape_queue.task_done(job)
+
+    async def scrape_food_if_new(self, url: str) -> bool:
+        """
+        check if a food is already in the database - if it is not, scrape and add to the database
+        :param url: link to page containing food details
+        :return: bool representing whether the job made a request to the website or not
+        """
+        loop = asyncio.get_running_loop()
+        with self.metrics.time("dedup"):
+            known = self.known_foods.has_url(url)
+            if known is None:
+                known = await loop.run_in_executor(None, self._check_db_for_food, url)
+        if not known:
+            try:
+                food, diets = await self._scrape_food_details_async(url)
+                self._save_food(food, diets)
+            except Exception as e:
+                self.logger.error("Error while processing food at URL: {}".format(url))
+                self.logger.error("ERROR: " + str(e.args))
+                self.logger.error("Skipping food...\n")
+            finally:
+                return True
+        elif self.refresh:
+            try:
+                r = await self._fetch_food_page_async(url)
+                await loop.run_in_executor(None, self._refresh_from_response, url, r)
+            except Exception as e:
+                self.logger.error("Error while refreshing food at URL: {}".format(url))
+                self.logger.error("ERROR: " + str(e.args))
+                self.logger.error("Skipping food...\n")
+            return True
+        else:
+            self.logger.message("{} is already in the database... skipping...".format(url))
+            self.metrics.count("skips", label="known_food")
+            return False
+
+    async def scrape_search_results(self, url: str) -> bool:
+        """
+        scrape a page of search results and enqueue all foods to be scraped
+        :param url: link to one page of search results
+        :return: bool representing whether the job made a request to the website or not
+        """
+        self.logger.scrape_search_results(url)
+
+        r = await self._make_request_async(url, page="search")
+        if r.status_code != 200:
+            return True
+
+        if self._streamed(r):
+            links = self._extract("search_results", r)
+        else:
+            loop = asyncio.get_running_loop()
+            with self.metrics.time("parse"):
+                links = await loop.run_in_executor(self.parse_pool, self.extractor.search_results, r.content)
+        for link in links:
+            self._enqueue_url(urljoin(url, link), self.scrape_food_if_new)
+        return True
+
+    async def _scrape_food_details_async(self, url: str):
+        """
+        scrape page for dog food details
+        :param url: link to page containing food details
+        :return: Food object of food details, list of special diets
+        """
+        r = await self._fetch_food_page_async(url)
+        if self._streamed(r):
+            return self._food_from_details(url, self._extract("food_details", r))
+
+        loop = asyncio.get_running_loop()
+        with self.metrics.time("parse"):
+            details = await loop.run_in_executor(self.parse_pool, self.extractor.food_details, r.content)
+        return self._food_from_details(url, details)
+
+    async def _fetch_food_page_async(self, url: str) -> requests.models.Response:
+        """
+        fetch a page containing food details
+        :param url: link to page containing food details
+        :return: the response object for the page
+        """
+        self.logger.scrape_food(url)
+
+        r = await self._make_request_async(url, page="food")
+        if r.status_code != 200:
+            raise Exception("Error requesting food at URL: {}".format(url))
+        return r
+
+    async def _make_request_async(self, url: str, page: str = None) -> requests.models.Response:
+        """
+        make a request for a web page using the next useragent and a proxy chosen by the proxy manager, retrying failed
+        attempts as the retry policy allows - requests that run out of retries are added to the dead letters
+        :param url: link to web page
+        :param page: kind of page requested, "search" or "food", for streaming fetches to parse the page as it arrives
+        :return: a requests response object built from the aiohttp response, will be an empty response object if
+        request fails
+        """
+        # serve from the response cache if fresh, otherwise make the request conditional on the cached copy changing
+        cached = None
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(url)
+            if cached is not None and self._is_fresh(url, cached):
+                self.metrics.count("cache_hits")
+                return self._archived(url, self.response_cache.hit(url, cached))
+
+        self.retry_policy.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            r, error = await self._attempt_request_async(url, cached, page)
+            if error is None:
+                return self._archived(url, r)
+            self.metrics.count("request_errors", label=error)
+            if not self._retry_after_error(url, error, attempt, r):
+                return self._archived(url, r)
+            await asyncio.sleep(self.retry_policy.delay(error, attempt, r.headers.get("Retry-After")))
+
+    async def _attempt_request_async(self, url: str, cached: dict = None, page: str = None):
+        """
+        make one attempt at a request for a web page
+        :param url: link to web page
+        :param cached: cached response to make the request conditional on, if any
+        :param page: kind of page requested, "search" or "food", for streaming fetches to parse the page as it arrives
+        :return: a requests response object built from the aiohttp response (an empty response object if the attempt
+        failed without a response), and the class of error the attempt failed with, or None if it succeeded
+        """
+        proxy_manager = self.session_builder.proxy_manager
+        r = requests.models.Response()
+        headers = {"User-Agent": next(self.session_builder.useragents).strip(), "Accept-Encoding": ACCEPT_ENCODING}
+        if cached is not None:
+            headers.update(self.response_cache.conditional_headers(cached))
+        parser = self._page_parser(page)
+        proxies = proxy_manager.choose() or {}
+        proxy = self._proxy_key(proxies)
+
+        error = "unknown"
+        acquired = False
+        start = monotonic()
+        try:
+            if self.concurrency is not None:
+                await self.concurrency.acquire_async()
+                acquired = True
+            with self.metrics.time("permit_wait"):
+                await self.rate_limiter.acquire_async(proxy, urlsplit(url).netloc)
+            self.logger.make_request(url, headers["User-Agent"], proxies)
+
+            start = monotonic()
+            r, error = await self._send_request_async(url, r, headers, proxies, cached, parser, start)
+        finally:
+            if acquired:
+                self.concurrency.release(monotonic() - start, error)
+        return r, error
+
+    async def _send_request_async(self, url: str, r: requests.models.Response, headers: dict, proxies: dict,
+                                  cached: dict, parser: PageParser, start: float):
+        """
+        send a request for a web page, once permitted - see _attempt_request_async
+        :param r: empty response object, to build the response in
+        :param start: monotonic time the request was sent at
+        :return: the response object, and the class of error the request failed with, or None if it succeeded
+        """
+        proxy_manager = self.session_builder.proxy_manager
+        proxy = self._proxy_key(proxies)
+        try:
+            async with self.http.get(url, headers=headers, proxy=proxies.get("http")) as resp:
+                r.status_code = resp.status
+                if parser is not None and r.status_code == 200:
+                    await self._read_streamed_async(resp, r, parser)
+                else:
+                    r._content = await resp.read()
+                proxy_manager.record(proxy, monotonic() - start, r.status_code)
+                self._record_response(monotonic() - start, r)
+                r.headers = CaseInsensitiveDict(resp.headers)
+                r.url = str(resp.url)
+                if r.status_code == 304 and cached is not None:
+                    return self.response_cache.revalidated(url, cached), None
+                resp.raise_for_status()
+            if self.response_cache is not None:
+                self.response_cache.store(url, r)
+        except aiohttp.ClientProxyConnectionError as e:
+            proxy_manager.record(proxy)
+            self.logger.error("Proxy Error while requesting URL: {} with PROXY {}".format(url, proxies))
+            self.logger.error("PROXY ERROR: " + str(e.args))
+            return r, "proxy"
+        except asyncio.TimeoutError as e:
+            proxy_manager.record(proxy)
+            self.logger.error("Time out while requesting URL: {}".format(url))
+            self.logger.error("REQUESTS ERROR: " + str(e.args))
+            return r, "timeout"
+        except aiohttp.ClientResponseError as e:
+            self.logger.error("HTTP Error while requesting URL: {}".format(url))
+            self.logger.error("REQUESTS ERROR: " + str(e.args))
+            return r, self.retry_policy.classify_status(r.status_code)
+        except aiohttp.ClientConnectionError as e:
+            proxy_manager.record(proxy)
+            self.logger.error("Connection Error while requesting URL: {}".format(url))
+            self.logger.error("REQUESTS ERROR: " + str(e.args))
+            return r, "connection"
+        except Exception as e:
+            self.logger.error("Unknown Error while requesting URL: {}".format(url))
+            self.logger.error("ERROR: " + str(e.args))
+            return r, "unknown"
+        return r, None
+
+    async def _read_streamed_async(self, resp: aiohttp.ClientResponse, r: requests.models.Response,
+                                   parser: PageParser) -> None:
+        """
+        read an aiohttp response a chunk at a time, feeding each decoded chunk to a page parser, and stop reading as
+        soon as the parser has found everything it needs from the page - the connection is closed when the response
+        is released with the rest of the page unread. See Scraper._read_streamed
+        :param resp: aiohttp response object
+        :param r: requests response object being built from it
+        :param parser: page parser for the page
+        """
+        r.truncated = False
+        chunks = []
+        parse_seconds = 0.0
+        async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+            chunks.append(chunk)
+            start = monotonic()
+            found = parser.feed(chunk)
+            parse_seconds += monotonic() - start
+            if found and self.archive is None:
+                r.truncated = True
+                break
+        start = monotonic()
+        parser.close()
+        parse_seconds += monotonic() - start
+        r._content = b"".join(chunks)
+        r.page_parser = parser
+        self.metrics.observe("parse", parse_seconds)
+        if r.truncated:
+            self.metrics.count("early_stops")
@@ -0,0 +1,52 @@
+"""
+Compare per-page parse time of the extractor backends
+
+Usage: python -m benchmarks.bench_extractors [--iterations N] [--food PAGE ...] [--search PAGE ...]
+
+Pages default to the fixtures in fixtures/ - pass saved Chewy.com pages for more representative numbers
+"""
+import argparse
+import os
+from timeit import timeit
+
+from extractors import EXTRACTORS
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+def bench(extractor, method: str, pages: list, iterations: int) -> float:
+    """
+    :return: mean milliseconds taken by extractor.method to parse one page
+    """
+    func = getattr(extractor, method)
+    total = 0.0
+    for page in pages:
+        total += timeit(lambda: func(page), number=iterations)
+    return total / (iterations * len(pages)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-page parse time of the extractor backends")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--food", nargs="+", default=[os.path.join(FIXTURES, "food_page.html")])
+    parser.add_argument("--search", nargs="+", default=[os.path.join(FIXTURES, "search_page.html")])
+    args = parser.parse_args()
+
+    pages = {"food_details": [], "search_results": []}
+    for path in args.food:
+        with open(path, "rb") as page:
+            pages["food_details"].append(page.read())
+    for path in args.search:
+        with open(path, "rb") as page:
+            pages["search_results"].append(page.read())
+
+    print("{:<10}{:>20}{:>20}".format("extractor", "food ms/page", "search ms/page"))
+    for name, extractor_class in EXTRACTORS.items():
+        extractor = extractor_class()
+        food_ms = bench(extractor, "food_details", pages["food_details"], args.iterations)
+        search_ms = bench(extractor, "search_results", pages["search_results"], args.iterations)
+        print("{:<10}{:>20.3f}{:>20.3f}".format(name, food_ms, search_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark whole scrapes end to end against a local stand-in for Chewy.com and an SQLite database, for each mode and
+number of workers - reports pages/sec, parse ms/page, inserts/sec and peak RSS, so runs can be compared commit to
+commit
+
+Usage: python -m benchmarks.bench_scrape [--modes threads pool async] [--workers 5 10 20] [--pages 10]
+       [--latency 0.02] [--error-rate 0.01] [--throttle-rate 0.01] [--stream] [--adaptive] [--json results.json]
+       [--baseline results.json]
+
+Each scrape runs in a fresh process, so peak RSS is the scrape's own - in pool mode it is the largest of the scraping
+process and its parsing processes
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import tempfile
+from time import perf_counter
+
+from benchmarks.chewy_standin import ChewyStandIn
+
+MODES = ("threads", "pool", "async")
+
+
+def run_scrape(config: dict) -> dict:
+    """
+    scrape the stand-in once, into a new SQLite database - run in a fresh process
+    :param config: dictionary of mode, workers, parse_processes, host_rate, stream, adaptive and search_url
+    :return: dictionary of results
+    """
+    from async_scraper import AsyncScraper
+    from concurrency import ConcurrencyController
+    from metrics import ScrapeMetrics
+    from models import Base, Food
+    from rate_limiter import RateLimiter
+    from scraper import Scraper
+    from session_builder.session_builder import SessionBuilder
+
+    # run from an empty directory, so no proxies, useragents or caches are picked up - requests go straight to the
+    # stand-in
+    directory = tempfile.TemporaryDirectory()
+    os.chdir(directory.name)
+    SessionBuilder.no_proxies_acknowledged = True
+
+    metrics = ScrapeMetrics()
+    options = dict(force=True, rate_limiter=RateLimiter(host_rate=config["host_rate"]), metrics=metrics,
+                   stream=config["stream"])
+    if config["adaptive"]:
+        # the number of workers is the ceiling the controller may reach
+        options["concurrency"] = ConcurrencyController(floor=min(2, config["workers"]), ceiling=config["workers"])
+    database = os.path.join(directory.name, "bench.sqlite")
+    if config["mode"] == "async":
+        scraper = AsyncScraper(database, max_in_flight=config["workers"], **options)
+    else:
+        parse_processes = config["parse_processes"] if config["mode"] == "pool" else 0
+        scraper = Scraper(database, num_threads=config["workers"], parse_processes=parse_processes, **options)
+    Base.metadata.create_all(scraper.engine)
+
+    start = perf_counter()
+    scraper.scrape(config["search_url"])
+    elapsed = perf_counter() - start
+
+    db_session = scraper.session_factory()
+    inserted = db_session.query(Food).count()
+    db_session.close()
+    scraper.engine.dispose()
+
+    snapshot = metrics.snapshot()
+    parse = snapshot["stages"].get("parse", dict())
+    pages = snapshot["counters"].get("responses", dict()).get("200", 0)
+    return {"mode": config["mode"], "workers": config["workers"], "seconds": round(elapsed, 3),
+            "pages": pages, "pages_per_sec": round(pages / elapsed, 2),
+            "parse_ms_per_page": round(parse["mean"] * 1000, 3) if parse.get("mean") is not None else None,
+            "inserted": inserted, "inserts_per_sec": round(inserted / elapsed, 2),
+            "retries": snapshot["counters"].get("retries", 0), "peak_rss_mb": _peak_rss_mb(),
+            "concurrency": scraper.concurrency.snapshot() if scraper.concurrency is not None else None}
+
+
+def _peak_rss_mb():
+    """
+    :return: peak resident set size of this process or any of its finished children, in MB, or None if unknown
+    """
+    try:
+        import resource
+    except ImportError:
+        return None  # not available on Windows
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def _run_in_process(config: dict, results) -> None:
+    results.put(run_scrape(config))
+
+
+def bench(config: dict) -> dict:
+    """
+    scrape the stand-in once, in a fresh process
+    :param config: see run_scrape
+    :return: dictionary of results
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_in_process, args=(config, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def git_commit():
+    """
+    :return: short hash of the commit checked out, or None if it can't be found
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark whole scrapes against a local stand-in for Chewy.com")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["threads", "async"])
+    parser.add_argument("--workers", nargs="+", type=int, default=[5, 10, 20])
+    parser.add_argument("--parse-processes", type=int, default=2, help="number of parsing processes in pool mode")
+    parser.add_argument("--pages", type=int, default=10, help="number of pages of search results")
+    parser.add_argument("--foods-per-page", type=int, default=36)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.02, help="maximum random seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--host-rate", type=float, default=None, help="requests per second allowed to the stand-in")
+    parser.add_argument("--stream", action="store_true", help="stream pages, and stop reading once parsed")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="adapt the number of requests in flight, up to the number of workers")
+    parser.add_argument("--json", help="path to write the results to")
+    parser.add_argument("--baseline", help="path of results written by an earlier run, to compare against")
+    args = parser.parse_args()
+
+    standin = ChewyStandIn(pages=args.pages, foods_per_page=args.foods_per_page, latency=args.latency,
+                           jitter=args.jitter, error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    standin.start()
+
+    baseline = dict()
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            for result in json.load(baseline_file)["results"]:
+                baseline[(result["mode"], result["workers"])] = result
+
+    print("{:<8}{:>8}{:>10}{:>12}{:>10}{:>12}{:>10}{:>10}{:>10}{:>10}".format(
+        "mode", "workers", "seconds", "pages/sec", "parse ms", "inserts/sec", "retries", "MB sent", "RSS MB",
+        "vs base"))
+    results = []
+    for mode in args.modes:
+        for workers in args.workers:
+            standin.reset_counts()
+            result = bench({"mode": mode, "workers": workers, "parse_processes": args.parse_processes,
+                            "host_rate": args.host_rate, "stream": args.stream, "adaptive": args.adaptive,
+                            "search_url": standin.search_url})
+            result["responses"] = {str(status): count for status, count in sorted(standin.statuses.items())}
+            result["mb_sent"] = round(standin.bytes_sent / (1024 * 1024), 2)
+            results.append(result)
+
+            change = ""
+            base = baseline.get((mode, workers))
+            if base is not None and base["pages_per_sec"]:
+                change = "{:+.1f}%".format((result["pages_per_sec"] / base["pages_per_sec"] - 1) * 100)
+            print("{:<8}{:>8}{:>10.2f}{:>12.2f}{:>10}{:>12.2f}{:>10}{:>10.2f}{:>10}{:>10}".format(
+                mode, workers, result["seconds"], result["pages_per_sec"], str(result["parse_ms_per_page"]),
+                result["inserts_per_sec"], result["retries"], result["mb_sent"], str(result["peak_rss_mb"]), change))
+    standin.stop()
+
+    if args.json:
+        settings = {name: value for name, value in vars(args).items() if name not in ("json", "baseline")}
+        with open(args.json, "w") as json_file:
+            json.dump({"commit": git_commit(), "settings": settings, "results": results}, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+A local stand-in for Chewy.com, serving pages of search results and food pages built from the recorded pages in
+fixtures/, with configurable latency, error rate and 429 injection - for benchmarking scrapes without touching the
+real site
+
+Usage: python -m benchmarks.chewy_standin [--port 8080] [--pages 10] [--foods-per-page 36] [--latency 0.05]
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+SEARCH_PATH = "/s?rh=c%3A288%2Cc%3A332&page="  # same shape as main.SEARCH_URL
+FIRST_ITEM_NUM = 100000  # item number of the first food served
+WRITE_SIZE = 8 * 1024  # number of bytes of a body written at a time, so clients closing early are noticed
+
+
+class ChewyStandIn:
+    """
+    HTTP server on localhost serving a catalog of pages * foods_per_page foods - search page N links to foods
+    (N - 1) * foods_per_page onwards, and every food page is the recorded food page with its own item number and name
+
+    Each response is delayed by latency seconds plus up to jitter seconds, and fails with a 500 with probability
+    error_rate, or a 429 (with a Retry-After of retry_after seconds) with probability throttle_rate. Failures are
+    drawn from a seeded random number generator, so runs with the same settings fail the same share of requests.
+    Bodies are gzipped for clients that accept gzip, like the real site's, and bytes_sent only counts the part of a
+    body written before the client closed the connection. Pages carry an ETag of their content, and conditional
+    requests for pages that haven't changed are answered 304 Not Modified
+    """
+
+    def __init__(self, pages: int = 10, foods_per_page: int = 36, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: int = 1, seed: int = 0,
+                 port: int = 0):
+        """
+        :param pages: number of pages of search results
+        :param foods_per_page: number of foods on each page of search results
+        :param latency: minimum number of seconds before each response
+        :param jitter: maximum number of seconds added to latency, at random
+        :param error_rate: share of requests answered with a 500
+        :param throttle_rate: share of requests answered with a 429
+        :param retry_after: Retry-After of 429 responses, in seconds
+        :param seed: seed of the random number generator drawing delays and failures
+        :param port: port to listen on, 0 for any free port
+        """
+        self.pages: int = pages
+        self.foods_per_page: int = foods_per_page
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.error_rate: float = error_rate
+        self.throttle_rate: float = throttle_rate
+        self.retry_after: int = retry_after
+        self.port: int = port
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.statuses = Counter()  # status code -> number of responses
+        self.bytes_sent: int = 0
+
+        with open(os.path.join(FIXTURES, "search_page.html"), encoding="utf-8") as page:
+            self.search_template: str = page.read()
+        with open(os.path.join(FIXTURES, "food_page.html"), encoding="utf-8") as page:
+            self.food_template: str = page.read()
+        self.product_template: str = re.search(r"<article.*?</article>", self.search_template, re.DOTALL).group(0)
+        self.product_link: str = re.search(r"/[\w-]+/dp/\d+", self.product_template).group(0)
+        self.food_name: str = re.search(r'<div id="product-title".*?<h1>\s*(.*?)\s*</h1>', self.food_template,
+                                        re.DOTALL).group(1)
+        self.food_numbers: tuple = (re.search(r"/dp/(\d+)", self.food_template).group(1),
+                                    re.search(r'Item Number</div>\s*<div class="value">\s*(\d+)',
+                                              self.food_template).group(1))
+
+        self.server = None
+
+    @property
+    def base_url(self) -> str:
+        return "http://127.0.0.1:{}".format(self.server.server_port)
+
+    @property
+    def search_url(self) -> str:
+        """
+        :return: starting URL for search pages, to pass to Scraper.scrape
+        """
+        return self.base_url + SEARCH_PATH
+
+    @property
+    def total_foods(self) -> int:
+        return self.pages * self.foods_per_page
+
+    def start(self) -> None:
+        """
+        start serving, from a daemon thread
+        """
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), _handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="ChewyStandIn", daemon=True).start()
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def reset_counts(self) -> None:
+        with self.lock:
+            self.statuses.clear()
+            self.bytes_sent = 0
+
+    def search_page(self, page: int) -> str:
+        """
+        :param page: number of the page of search results, from 1
+        :return: html of the page, linking to the foods on it
+        """
+        first = (page - 1) * self.foods_per_page
+        last = min(first + self.foods_per_page, self.total_foods)
+        products = "\n".join(self._product(FIRST_ITEM_NUM + food) for food in range(first, last))
+        html = re.sub(r'<p class="results-count">.*?</p>',
+                      '<p class="results-count">\n        {} - {}\n        of\n        {} Results\n      </p>'.format(
+                          first + 1, last, self.total_foods), self.search_template, count=1, flags=re.DOTALL)
+        return re.sub(r'(<section class="results-products">).*?(\s*</section>\s*</main>)',
+                      lambda match: match.group(1) + "\n" + products + match.group(2), html, count=1, flags=re.DOTALL)
+
+    def _product(self, item_num: int) -> str:
+        return self.product_template.replace(self.product_link, "/standin-food-{0}/dp/{0}".format(item_num))
+
+    def food_page(self, item_num: int) -> str:
+        """
+        :param item_num: item number of the food
+        :return: html of the food's page
+        """
+        html = self.food_template.replace(self.food_name, "{} #{}".format(self.food_name, item_num))
+        for number in self.food_numbers:
+            html = html.replace(number, str(item_num))
+        return html
+
+    def respond(self, path: str):
+        """
+        :param path: path and query of a request
+        :return: tuple of status code, dictionary of headers, and body
+        """
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            draw = self.random.random()
+        time.sleep(delay)
+
+        if draw < self.error_rate:
+            return 500, dict(), b""
+        if draw < self.error_rate + self.throttle_rate:
+            return 429, {"Retry-After": str(self.retry_after)}, b""
+
+        parts = urlsplit(path)
+        body = None
+        if parts.path == "/s":
+            page = int(parse_qs(parts.query).get("page", ["1"])[0] or 1)
+            if 1 <= page <= self.pages:
+                body = self.search_page(page)
+        else:
+            match = re.fullmatch(r"/[\w-]+/dp/(\d+)", parts.path)
+            if match and 0 <= int(match.group(1)) - FIRST_ITEM_NUM < self.total_foods:
+                body = self.food_page(int(match.group(1)))
+        if body is None:
+            return 404, dict(), b""
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, body.encode("utf-8")
+
+    def _record(self, status: int, size: int) -> None:
+        with self.lock:
+            self.statuses[status] += 1
+            self.bytes_sent += size
+
+
+def _handler(standin: ChewyStandIn):
+    """
+    :return: request handler class serving the stand-in's pages
+    """
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep connections alive, like the real site
+
+        def do_GET(self):
+            status, headers, body = standin.respond(self.path)
+            if status == 200:
+                headers["ETag"] = '"{}"'.format(hashlib.sha1(body).hexdigest())
+                if self.headers.get("If-None-Match") == headers["ETag"]:
+                    status, body = 304, b""
+            if body and "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body)
+                headers["Content-Encoding"] = "gzip"
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+
+            sent = 0
+            try:
+                for start in range(0, len(body), WRITE_SIZE):
+                    self.wfile.write(body[start:start + WRITE_SIZE])
+                    sent += len(body[start:start + WRITE_SIZE])
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # the client stopped reading, i.e. a streaming fetch closed early
+            standin._record(status, sent)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for Chewy.com")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--foods-per-page", type=int, default=36)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    standin = ChewyStandIn(pages=args.pages, foods_per_page=args.foods_per_page, latency=args.latency,
+                           jitter=args.jitter, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                           port=args.port)
+    standin.start()
+    print("Serving {} foods - search from {}".format(standin.total_foods, standin.search_url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
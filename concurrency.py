@@ -0,0 +1,192 @@
+import asyncio
+import threading
+
+from scraper_logger import ScraperLogger, SilentScraperLogger
+
+# classes of request error meaning the site, or a proxy, is pushing back - see RetryPolicy.classify_status
+BACKOFF_ERRORS = ("throttled", "timeout", "banned")
+
+
+class ConcurrencyController:
+    """
+    Sets how many requests may be in flight at once, and adapts it to how the site is coping over the course of a
+    scrape, AIMD-style - the limit is raised by increase after every round of healthy responses, and cut by the
+    decrease factor straight away on a 429 / 503, a timeout or a banned proxy
+
+    A round is as many responses as the limit, so the limit grows by about increase per round trip. A round is healthy
+    if its share of other errors stays at or below max_error_rate and its mean latency stays within latency_factor of
+    the lowest mean latency seen so far - a round with too many errors is cut like a 429, and a round with high latency
+    lowers the limit by increase. The limit is only raised after rounds that used all of it. Requests already in flight
+    when the limit is cut were sent at the old limit, so their errors don't cut it again
+
+    The limit always stays between floor and ceiling, and every change is logged
+    """
+
+    def __init__(self, floor: int = 2, ceiling: int = 20, initial: int = None, increase: int = 1,
+                 decrease: float = 0.5, max_error_rate: float = 0.1, latency_factor: float = 2.0, min_round: int = 5,
+                 logger: ScraperLogger = SilentScraperLogger()):
+        """
+        :param floor: lowest limit of requests in flight
+        :param ceiling: highest limit of requests in flight - the number of workers needed to reach it
+        :param initial: limit to start at, defaults to floor
+        :param increase: number of requests the limit is raised by after a healthy round
+        :param decrease: factor the limit is multiplied by when the site pushes back
+        :param max_error_rate: share of responses in a round that may fail with other errors, i.e. 500s
+        :param latency_factor: multiple of the lowest mean latency of a round that a round's mean latency may reach
+        :param min_round: minimum number of responses in a round
+        :param logger: logger for changes of the limit
+        """
+        if not 1 <= floor <= ceiling:
+            raise Exception("Concurrency floor must be at least 1 and no higher than the ceiling")
+        self.floor: int = floor
+        self.ceiling: int = ceiling
+        self.increase: int = increase
+        self.decrease: float = decrease
+        self.max_error_rate: float = max_error_rate
+        self.latency_factor: float = latency_factor
+        self.min_round: int = min_round
+        self.logger = logger
+
+        self.lock = threading.Condition()
+        self.limit: int = min(max(initial if initial is not None else floor, floor), ceiling)
+        self.in_flight: int = 0
+        self.released = None  # asyncio.Event set whenever a slot may have come free, once awaited on
+
+        self.best_latency: float = None  # lowest mean latency of a round so far
+        self.holdover: int = 0  # number of requests still in flight from before the last cut
+        self._new_round()
+
+        # number of times the limit was raised and cut, and the lowest and highest limits reached
+        self.raises: int = 0
+        self.cuts: int = 0
+        self.lowest: int = self.limit
+        self.highest: int = self.limit
+
+    def acquire(self) -> None:
+        """
+        block the calling thread until fewer requests than the limit are in flight, and count its request in
+        """
+        with self.lock:
+            self.lock.wait_for(lambda: self.in_flight < self.limit)
+            self._take_slot()
+
+    async def acquire_async(self) -> None:
+        """
+        wait on the event loop until fewer requests than the limit are in flight, and count its request in
+        """
+        while True:
+            with self.lock:
+                if self.in_flight < self.limit:
+                    self._take_slot()
+                    return
+            if self.released is None:
+                self.released = asyncio.Event()
+            self.released.clear()
+            await self.released.wait()
+
+    def release(self, latency: float, error: str = None) -> None:
+        """
+        count a request out once it is done, and adapt the limit to its outcome
+        :param latency: number of seconds the request took
+        :param error: class of error the request failed with, or None if it succeeded - see RetryPolicy.classify_status
+        """
+        if error == "http":
+            error = None  # i.e. a 404 - the page is gone, but the site answered as usual
+        with self.lock:
+            self.in_flight -= 1
+            sent_before_cut = self.holdover > 0
+            self.holdover = max(self.holdover - 1, 0)
+            if error in BACKOFF_ERRORS:
+                if not sent_before_cut:
+                    self._cut("{} error".format(error))
+            else:
+                self._record(latency, error)
+            self._notify()
+
+    def snapshot(self) -> dict:
+        """
+        :return: dictionary of the current limit, requests in flight, lowest and highest limits, and number of raises
+        and cuts
+        """
+        with self.lock:
+            return {"limit": self.limit, "in_flight": self.in_flight, "lowest": self.lowest, "highest": self.highest,
+                    "raises": self.raises, "cuts": self.cuts}
+
+    def _take_slot(self) -> None:
+        """
+        count a request in - must hold self.lock
+        """
+        self.in_flight += 1
+        if self.in_flight >= self.limit:
+            self.saturated = True
+
+    def _new_round(self) -> None:
+        """
+        start counting the responses of a new round - must hold self.lock
+        """
+        self.responses: int = 0
+        self.errors: int = 0
+        self.latency_total: float = 0.0
+        self.saturated: bool = self.in_flight >= self.limit
+
+    def _record(self, latency: float, error: str) -> None:
+        """
+        count a response in the current round, and adapt the limit once the round is complete - must hold self.lock
+        """
+        self.responses += 1
+        if error is not None:
+            self.errors += 1
+        else:
+            self.latency_total += latency
+        if self.responses < max(self.limit, self.min_round):
+            return
+
+        error_rate = self.errors / self.responses
+        successes = self.responses - self.errors
+        mean_latency = self.latency_total / successes if successes else None
+        if mean_latency is not None and (self.best_latency is None or mean_latency < self.best_latency):
+            self.best_latency = mean_latency
+
+        if error_rate > self.max_error_rate:
+            self._cut("{:.0%} of responses failed".format(error_rate))
+        elif mean_latency is not None and mean_latency > self.best_latency * self.latency_factor:
+            self._change(self.limit - self.increase, "mean latency {:.2f}s, lowest {:.2f}s".format(
+                mean_latency, self.best_latency))
+            self._new_round()
+        elif self.saturated:
+            self._change(self.limit + self.increase, "healthy round, mean latency {:.2f}s".format(mean_latency or 0))
+            self._new_round()
+        else:
+            self._new_round()  # the limit wasn't what held requests back, so there is no telling if more would help
+
+    def _cut(self, reason: str) -> None:
+        """
+        cut the limit by the decrease factor - must hold self.lock
+        """
+        self._change(int(self.limit * self.decrease), reason)
+        self.holdover = self.in_flight
+        self._new_round()
+
+    def _change(self, limit: int, reason: str) -> None:
+        """
+        set the limit, within floor and ceiling, and log the change - must hold self.lock
+        """
+        limit = min(max(limit, self.floor), self.ceiling)
+        if limit == self.limit:
+            return
+        if limit > self.limit:
+            self.raises += 1
+        else:
+            self.cuts += 1
+        self.logger.message("Concurrency {} -> {} requests in flight: {}".format(self.limit, limit, reason))
+        self.limit = limit
+        self.lowest = min(self.lowest, limit)
+        self.highest = max(self.highest, limit)
+
+    def _notify(self) -> None:
+        """
+        wake callers waiting for a slot - must hold self.lock
+        """
+        self.lock.notify_all()
+        if self.released is not None:
+            self.released.set()
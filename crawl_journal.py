@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import threading
+from time import time
+
+
+class CrawlJournal:
+    """
+    Durable record of the jobs of a scrape in a local SQLite database, so a scrape that dies partway through can be
+    resumed from the jobs that were still pending or in flight
+
+    Records are buffered in memory and written in order, in one transaction per flush, by a background thread every
+    flush_interval seconds (or sooner once batch_size records are waiting). Because a job's own "done" record is always
+    written after the records of the jobs it enqueued, the journal on disk is consistent at every flush - a crash loses
+    at most the last flush_interval seconds of progress, which is redone on resume
+    """
+
+    PENDING = 0
+    IN_FLIGHT = 1
+    DONE = 2
+
+    def __init__(self, path: str = "cache/journal.sqlite", flush_interval: float = 1.0, batch_size: int = 500):
+        """
+        :param path: path of the SQLite database to keep the journal in
+        :param flush_interval: maximum number of seconds records are buffered before being written
+        :param batch_size: number of buffered records that triggers a flush before flush_interval is up
+        """
+        self.path: str = path
+        self.flush_interval: float = flush_interval
+        self.batch_size: int = batch_size
+
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                        "url TEXT PRIMARY KEY, "
+                        "kind TEXT NOT NULL, "
+                        "state INTEGER NOT NULL, "
+                        "updated REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+        self.db.commit()
+
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.buffer = []
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        """
+        start the thread writing buffered records to disk
+        """
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="CrawlJournal")
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        write any buffered records to disk and stop the writing thread
+        """
+        if self.thread is not None:
+            self.stopping.set()
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def run(self) -> None:
+        while not self.stopping.is_set():
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def enqueued(self, url: str, kind: str) -> None:
+        """
+        record a job enqueued
+        :param url: url of the page to scrape
+        :param kind: kind of page, i.e. "search" or "food"
+        """
+        self._record((url, kind, self.PENDING))
+
+    def started(self, url: str) -> None:
+        """
+        record a job taken by a worker
+        """
+        self._record((url, None, self.IN_FLIGHT))
+
+    def finished(self, url: str) -> None:
+        """
+        record a job completed
+        """
+        self._record((url, None, self.DONE))
+
+    def _record(self, record: tuple) -> None:
+        with self.lock:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.batch_size:
+                self.wake.set()
+
+    def flush(self) -> None:
+        """
+        write buffered records to disk, in order, in one transaction
+        """
+        with self.lock:
+            records, self.buffer = self.buffer, []
+        if not records:
+            return
+
+        now = time()
+        with self.db_lock:
+            for url, kind, state in records:
+                if kind is not None:
+                    self.db.execute("INSERT OR REPLACE INTO jobs (url, kind, state, updated) VALUES (?, ?, ?, ?)",
+                                    (url, kind, state, now))
+                else:
+                    self.db.execute("UPDATE jobs SET state = ?, updated = ? WHERE url = ?", (state, now, url))
+            self.db.commit()
+
+    def unfinished_jobs(self) -> list:
+        """
+        :return: list of (url, kind) of every job pending or in flight, in the order they were last updated
+        """
+        with self.db_lock:
+            return self.db.execute("SELECT url, kind FROM jobs WHERE state != ? ORDER BY updated",
+                                   (self.DONE,)).fetchall()
+
+    def done_jobs(self) -> list:
+        """
+        :return: list of (url, kind) of every job completed
+        """
+        with self.db_lock:
+            return self.db.execute("SELECT url, kind FROM jobs WHERE state = ?", (self.DONE,)).fetchall()
+
+    def clear(self) -> None:
+        """
+        forget every job, i.e. before starting a new scrape
+        """
+        with self.lock:
+            self.buffer = []
+        with self.db_lock:
+            self.db.execute("DELETE FROM jobs")
+            self.db.commit()
+
+    def close(self) -> None:
+        with self.db_lock:
+            self.db.close()
@@ -0,0 +1,155 @@
+import queue
+from datetime import datetime
+from threading import Thread
+from time import monotonic
+
+from models import Diet, Food, FoodFingerprint, food_fingerprint
+from scraper_logger import ScraperLogger, SilentScraperLogger
+
+
+class BatchWriter:
+    """
+    Collects foods from every worker and enters them into the database in batches, from a single writer thread
+
+    A batch is flushed once it holds batch_size foods, or flush_interval seconds after its first food arrived. Each
+    batch is inserted with one multi-row insert per table in a single transaction - if that fails, the batch is
+    retried one food at a time, so one bad row only loses that food
+
+    A fingerprint of each food's details is inserted alongside it, for later refresh runs to compare against
+    """
+
+    def __init__(self, session_factory, logger: ScraperLogger = SilentScraperLogger(), batch_size: int = 100,
+                 flush_interval: float = 5.0, on_insert=None, metrics=None):
+        """
+        :param session_factory: factory for database sessions, i.e. a sessionmaker
+        :param logger: logger for database errors
+        :param batch_size: number of foods to collect before flushing a batch
+        :param flush_interval: maximum number of seconds a food waits in a batch before the batch is flushed
+        :param on_insert: function called with the list of food rows inserted and the list of their lists of diets,
+        after each successful insert
+        :param metrics: ScrapeMetrics to record the latency of each insert transaction in, if any
+        """
+        self.session_factory = session_factory
+        self.logger = logger
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.on_insert = on_insert
+        self.metrics = metrics
+
+        self.pending = queue.Queue()
+        self.thread = None
+
+        # number of foods inserted, and number of transactions used to insert them
+        self.inserted: int = 0
+        self.transactions: int = 0
+
+    def start(self) -> None:
+        """
+        start the writer thread
+        """
+        self.thread = Thread(target=self.run, name="BatchWriter")
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        flush any foods still waiting to be written and stop the writer thread
+        """
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+            self.logger.message("Inserted {} foods in {} transactions".format(self.inserted, self.transactions))
+
+    def submit(self, food: Food, diets: list) -> None:
+        """
+        add a food to the next batch to be entered into the database
+        :param food: Food object containing food details to enter into database
+        :param diets: List of associated diets to add to the database
+        """
+        self.pending.put((self.food_row(food), list(diets)))
+
+    def run(self) -> None:
+        """
+        collect foods into batches and flush them, until stopped
+        """
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - monotonic(), 0)
+            try:
+                item = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                item = False  # flush interval elapsed
+
+            if item:
+                if not batch:
+                    deadline = monotonic() + self.flush_interval
+                batch.append(item)
+            if batch and (item is None or item is False or len(batch) >= self.batch_size):
+                self.flush(batch)
+                batch = []
+                deadline = None
+            if item is None:
+                break
+
+    def flush(self, batch: list) -> None:
+        """
+        enter a batch of foods into the database, falling back to one food at a time if the batch fails
+        :param batch: list of (food row, list of diets) tuples
+        """
+        if self._insert(batch):
+            self.inserted += len(batch)
+            return
+
+        for food in batch:
+            if self._insert([food]):
+                self.inserted += 1
+
+    def _insert(self, batch: list) -> bool:
+        """
+        insert rows of foods, and their diets and fingerprints, in one transaction
+        :param batch: list of (food row, list of diets) tuples
+        :return: True if the rows were inserted, otherwise False
+        """
+        food_rows = [food_row for food_row, diets in batch]
+        diet_rows = [{"diet": diet, "item_num_id": food_row["item_num"]} for food_row, diets in batch for diet in diets]
+        now = datetime.utcnow()
+        fingerprint_rows = [{"item_num": food_row["item_num"], "fingerprint": food_fingerprint(food_row, diets),
+                             "checked": now} for food_row, diets in batch]
+
+        db_session = self.session_factory()
+        self.transactions += 1
+        start = monotonic()
+        try:
+            db_session.execute(Food.__table__.insert(), food_rows)
+            if diet_rows:
+                db_session.execute(Diet.__table__.insert(), diet_rows)
+            db_session.execute(FoodFingerprint.__table__.insert(), fingerprint_rows)
+            db_session.commit()
+        except Exception as e:
+            db_session.rollback()
+            if len(food_rows) == 1:
+                self.logger.error("Error while inserting food {}: {}".format(food_rows[0]["item_num"], e))
+            return False
+        finally:
+            db_session.close()
+
+        if self.metrics is not None:
+            self.metrics.observe("insert_batch", monotonic() - start)
+            self.metrics.count("foods_inserted", len(food_rows))
+        if self.on_insert is not None:
+            self.on_insert(food_rows, [diets for food_row, diets in batch])
+        return True
+
+    @staticmethod
+    def food_row(food: Food) -> dict:
+        """
+        :return: dictionary of column values for a food, with column defaults filled in for unset values
+        """
+        row = dict()
+        for column in Food.__table__.columns:
+            value = getattr(food, column.name)
+            if value is None and column.default is not None:
+                value = column.default.arg
+            row[column.name] = value
+        return row
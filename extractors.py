@@ -0,0 +1,397 @@
+import re
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+BREED_SIZES = {"Extra Small & Toy Breeds": "xsm_breed",
+               "Small Breeds": "sm_breed",
+               "Medium Breeds": "md_breed",
+               "Large Breeds": "lg_breed",
+               "Giant Breeds": "xlg_breed"}
+
+
+class FoodExtractor:
+    """
+    Base Extractor class - should implement a more specific Extractor that inherits from this class
+
+    Extractors pull data out of the raw html of Chewy.com pages, and return plain python objects so they can be used
+    from any thread or process - food details are returned as a dictionary of Food column values, plus a list of
+    special diets under the "diets" key
+    """
+
+    def search_results(self, content: bytes) -> list:
+        """
+        :param content: raw html of one page of search results
+        :return: list of (relative) links to food pages
+        """
+        raise NotImplementedError
+
+    def results_count(self, content: bytes) -> tuple:
+        """
+        :param content: raw html of one page of search results
+        :return: tuple of number of results per page, total number of results
+        """
+        raise NotImplementedError
+
+    def food_details(self, content: bytes) -> dict:
+        """
+        :param content: raw html of a page containing food details
+        :return: dictionary of food details, with special diets as a list under "diets"
+        """
+        raise NotImplementedError
+
+    def page_parser(self, page: str):
+        """
+        :param page: kind of page, "search" for a page of search results or "food" for a page containing food details
+        :return: incremental PageParser for the page, or None if this extractor can only parse whole pages
+        """
+        return None
+
+    @staticmethod
+    def _parse_results_count(results: str) -> tuple:
+        results = results.split()
+        return int(results[2]), int(results[4])
+
+    @staticmethod
+    def _apply_breed_sizes(details: dict, breed_sizes: str) -> None:
+        for breed_size in breed_sizes.split(', '):
+            if breed_size in BREED_SIZES:
+                details[BREED_SIZES[breed_size]] = True
+
+
+class SoupExtractor(FoodExtractor):
+    """
+    Extract data using BeautifulSoup with the html.parser backend - slow, but lenient, kept as a fallback
+    """
+
+    def search_results(self, content: bytes) -> list:
+        soup = BeautifulSoup(content, "html.parser")
+        return [link.get("href") for link in soup.find_all("a", "product")]
+
+    def results_count(self, content: bytes) -> tuple:
+        soup = BeautifulSoup(content, "html.parser")
+        results = soup.find("p", "results-count").string
+        return self._parse_results_count(results)
+
+    def food_details(self, content: bytes) -> dict:
+        details = dict()
+        soup = BeautifulSoup(content, "html.parser")
+
+        # scrape item number
+        item_num = soup.find("div", string=re.compile("Item Number"))
+        item_num = item_num.next_sibling
+        item_num = item_num.next_sibling
+        item_num = item_num.stripped_strings
+        details["item_num"] = int(next(item_num))
+
+        # scrape food name
+        name = soup.find("div", id='product-title')
+        name = name.stripped_strings
+        details["name"] = next(name)
+
+        # scrape ingredients
+        try:
+            ingredients = soup.find("span", string=re.compile("Nutritional Info")).next_sibling.next_sibling
+            details["ingredients"] = next(ingredients.p.stripped_strings)
+        except Exception as e:
+            ingredients = soup.find("span", string=re.compile("Ingredients")).next_sibling.next_sibling
+            details["ingredients"] = next(ingredients.p.stripped_strings)
+
+        if details["ingredients"] is not None:
+            details["ingredients"] = details["ingredients"].replace('"', '')
+
+        # scrape brand
+        details["brand"] = str(soup.find("span", attrs={"itemprop": "brand"}).string)
+
+        # scrape breed sizes
+        breed_sizes = soup.find("div", string=re.compile("Breed Size"))
+        if breed_sizes:
+            breed_sizes = breed_sizes.next_sibling.next_sibling.stripped_strings
+            self._apply_breed_sizes(details, next(breed_sizes))
+
+        # scrape food form
+        food_form = soup.find("div", string=re.compile("Food Form"))
+        if food_form:
+            food_form = food_form.next_sibling.next_sibling.stripped_strings
+            details["food_form"] = next(food_form)
+
+        # scrape lifestage
+        lifestage = soup.find("div", string=re.compile("Lifestage"))
+        if lifestage:
+            lifestage = lifestage.next_sibling.next_sibling.stripped_strings
+            details["lifestage"] = next(lifestage)
+
+        # scrape special diets
+        details["diets"] = []
+        special_diet = soup.find("div", string=re.compile("Special Diet"))
+        if special_diet:
+            special_diet = special_diet.next_sibling.next_sibling.stripped_strings
+            details["diets"] = next(special_diet).split(', ')
+
+        return details
+
+
+class LxmlExtractor(FoodExtractor):
+    """
+    Extract data using lxml - each page is parsed once, and every field is collected in a single walk over the tree,
+    matching element labels against one precompiled pattern. Pages can also be parsed incrementally as they download,
+    see page_parser
+    """
+
+    # labels of the product specification list, mapped to the field their value is saved as
+    SPEC_LABELS = {"Item Number": "item_num",
+                   "Breed Size": "breed_sizes",
+                   "Food Form": "food_form",
+                   "Lifestage": "lifestage",
+                   "Special Diet": "diets"}
+    SPEC_PATTERN = re.compile("|".join(SPEC_LABELS))
+    INGREDIENTS_PATTERN = re.compile("Nutritional Info|Ingredients")
+    FIELDS = len(SPEC_LABELS) + 3  # spec labels, plus name, brand and ingredients
+
+    def __init__(self, encoding: str = "utf-8"):
+        """
+        :param encoding: encoding of pages, used when a page does not declare one
+        """
+        self.encoding: str = encoding
+
+    def _parse(self, content: bytes):
+        root = etree.fromstring(content, etree.HTMLParser(encoding=self.encoding))
+        # lxml has no document for an empty or whitespace-only page, so parse it as an empty one
+        return root if root is not None else etree.Element("html")
+
+    def search_results(self, content: bytes) -> list:
+        links = []
+        for link in self._parse(content).iter("a"):
+            if "product" in link.get("class", "").split():
+                links.append(link.get("href"))
+        return links
+
+    def results_count(self, content: bytes) -> tuple:
+        for p in self._parse(content).iter("p"):
+            if "results-count" in p.get("class", "").split():
+                return self._parse_results_count("".join(p.itertext()))
+        raise Exception("No results count found")
+
+    def food_details(self, content: bytes) -> dict:
+        found = dict()
+        fallback_ingredients = None
+        for element in self._parse(content).iter("div", "span"):
+            if element.tag == "div":
+                if element.get("id") == "product-title":
+                    found.setdefault("name", self._first_string(element))
+                elif len(element) == 0 and element.text:
+                    label = self.SPEC_PATTERN.search(element.text)
+                    field = self.SPEC_LABELS[label.group()] if label else None
+                    if field and field not in found:
+                        value = element.getnext()
+                        found[field] = self._first_string(value) if value is not None else None
+            elif element.get("itemprop") == "brand":
+                found.setdefault("brand", element.text if len(element) == 0 else self._first_string(element))
+            elif len(element) == 0 and element.text and "ingredients" not in found:
+                label = self.INGREDIENTS_PATTERN.search(element.text)
+                if label and (label.group() == "Nutritional Info" or fallback_ingredients is None):
+                    value = element.getnext()
+                    value = value.find(".//p") if value is not None else None
+                    value = self._first_string(value) if value is not None else None
+                    if label.group() == "Nutritional Info":
+                        found["ingredients"] = value
+                    else:
+                        fallback_ingredients = value
+            if len(found) == self.FIELDS:
+                break
+
+        return self._details(found, fallback_ingredients)
+
+    def page_parser(self, page: str):
+        if page == "search":
+            return LxmlSearchPageParser(self.encoding)
+        if page == "food":
+            return LxmlFoodPageParser(self.encoding)
+        return None
+
+    @classmethod
+    def _details(cls, found: dict, fallback_ingredients: str) -> dict:
+        """
+        :param found: dictionary of the first value found for each field on a food page
+        :param fallback_ingredients: ingredients found under an "Ingredients" label, if any
+        :return: dictionary of food details, with special diets as a list under "diets"
+        """
+        details = dict()
+        if found.get("item_num") is None or found.get("name") is None:
+            raise Exception("No item number or name found in food page")
+        details["item_num"] = int(found["item_num"])
+        details["name"] = found["name"]
+
+        details["ingredients"] = found.get("ingredients") or fallback_ingredients
+        if details["ingredients"] is None:
+            raise Exception("No ingredients found in food page")
+        details["ingredients"] = details["ingredients"].replace('"', '')
+
+        if "brand" not in found:
+            raise Exception("No brand found in food page")
+        details["brand"] = str(found["brand"])
+
+        if found.get("breed_sizes"):
+            cls._apply_breed_sizes(details, found["breed_sizes"])
+        if found.get("food_form"):
+            details["food_form"] = found["food_form"]
+        if found.get("lifestage"):
+            details["lifestage"] = found["lifestage"]
+        details["diets"] = found["diets"].split(', ') if found.get("diets") else []
+        return details
+
+    @staticmethod
+    def _first_string(element) -> str:
+        """
+        :return: first non-whitespace string within an element, stripped, or None if there is none
+        """
+        for text in element.itertext():
+            text = text.strip()
+            if text:
+                return text
+        return None
+
+
+class PageParser:
+    """
+    Base PageParser class - a page parser is fed a page a chunk at a time as it downloads, pulls data out of it as it
+    goes, and reports once it has found everything needed from the page, so the rest of the page can be left unread
+    """
+
+    # names of the extractor methods the parser can stand in for
+    methods = ()
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        :param chunk: next chunk of the page's raw html
+        :return: True once everything needed from the page has been found, otherwise False
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        finish parsing the page, once the last chunk has been fed or the rest of the page abandoned
+        """
+        raise NotImplementedError
+
+    def result(self, method: str):
+        """
+        :param method: name of one of the extractor methods in methods
+        :return: what the extractor method returns for the page, raising the same exceptions it would
+        """
+        raise NotImplementedError
+
+
+class LxmlPageParser(PageParser):
+    """
+    Base class of page parsers using lxml's pull parser - handle() is called with each element as soon as the element
+    and everything in it has been parsed
+    """
+
+    def __init__(self, encoding: str = "utf-8"):
+        """
+        :param encoding: encoding of the page
+        """
+        self.parser = etree.HTMLPullParser(events=("end",), encoding=encoding)
+        self.done: bool = False
+
+    def feed(self, chunk: bytes) -> bool:
+        self.parser.feed(chunk)
+        self._read_events()
+        return self.done
+
+    def close(self) -> None:
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError:
+            pass  # nothing was fed - result() reports what is missing
+        self._read_events()
+
+    def _read_events(self) -> None:
+        for event, element in self.parser.read_events():
+            if not self.done:
+                self.done = self.handle(element)
+
+    def handle(self, element) -> bool:
+        """
+        :param element: element just parsed
+        :return: True once everything needed from the page has been found, otherwise False
+        """
+        raise NotImplementedError
+
+
+class LxmlSearchPageParser(LxmlPageParser):
+    """
+    Incremental version of LxmlExtractor.search_results and results_count - done once the results count and the
+    whole grid of results have been parsed, so links to products below the grid are not included
+    """
+
+    methods = ("search_results", "results_count")
+
+    def __init__(self, encoding: str = "utf-8"):
+        super().__init__(encoding)
+        self.links = []
+        self.results_count: str = None  # text of the results count
+        self.grid_parsed: bool = False
+
+    def handle(self, element) -> bool:
+        classes = element.get("class", "").split()
+        if element.tag == "a" and "product" in classes:
+            self.links.append(element.get("href"))
+        elif element.tag == "p" and "results-count" in classes and self.results_count is None:
+            self.results_count = "".join(element.itertext())
+        elif element.tag == "section" and "results-products" in classes:
+            self.grid_parsed = True
+        return self.grid_parsed and self.results_count is not None
+
+    def result(self, method: str):
+        if method == "search_results":
+            return list(self.links)
+        if self.results_count is None:
+            raise Exception("No results count found")
+        return FoodExtractor._parse_results_count(self.results_count)
+
+
+class LxmlFoodPageParser(LxmlPageParser):
+    """
+    Incremental version of LxmlExtractor.food_details - the value of a label is taken once the element after the label
+    has been parsed, and the page is done once every field has been found
+    """
+
+    methods = ("food_details",)
+
+    def __init__(self, encoding: str = "utf-8"):
+        super().__init__(encoding)
+        self.found = dict()
+        self.fallback_ingredients: str = None
+
+    def handle(self, element) -> bool:
+        found = self.found
+        if element.tag == "div" and element.get("id") == "product-title":
+            found.setdefault("name", LxmlExtractor._first_string(element))
+        elif element.tag == "span" and element.get("itemprop") == "brand":
+            found.setdefault("brand", element.text if len(element) == 0 else LxmlExtractor._first_string(element))
+
+        label = element.getprevious()
+        if label is not None and len(label) == 0 and label.text:
+            if label.tag == "div":
+                match = LxmlExtractor.SPEC_PATTERN.search(label.text)
+                field = LxmlExtractor.SPEC_LABELS[match.group()] if match else None
+                if field and field not in found:
+                    found[field] = LxmlExtractor._first_string(element)
+            elif label.tag == "span" and "ingredients" not in found:
+                match = LxmlExtractor.INGREDIENTS_PATTERN.search(label.text)
+                if match and (match.group() == "Nutritional Info" or self.fallback_ingredients is None):
+                    value = element.find(".//p")
+                    value = LxmlExtractor._first_string(value) if value is not None else None
+                    if match.group() == "Nutritional Info":
+                        found["ingredients"] = value
+                    else:
+                        self.fallback_ingredients = value
+        return len(found) == LxmlExtractor.FIELDS
+
+    def result(self, method: str):
+        return LxmlExtractor._details(self.found, self.fallback_ingredients)
+
+
+EXTRACTORS = {"lxml": LxmlExtractor, "soup": SoupExtractor}
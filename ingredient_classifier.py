@@ -0,0 +1,128 @@
+from collections import deque
+
+# keywords marking the first vitamin or mineral in an ingredient list - every ingredient before it is a main ingredient
+VITAMIN_KEYWORDS = ("mineral", "vitamin", "zinc", "supplement", "calcium", "phosphorus", "potassium", "sodium",
+                    "magnesium", "sulfer", "sulfur", "iron", "iodine", "selenium", "copper", "salt", "chloride",
+                    "choline", "lysine", "taurine")
+
+# keywords marking legumes, pulses and potatoes among the main ingredients - a keyword ending in "$" only matches at the
+# very end of the main ingredients
+BAD_INGREDIENT_KEYWORDS = ("chickpeas", "chickpea", "peanuts", "peanut", "pea ", "peas", "pea$", " pea ", "beans",
+                           "bean", "lentils", "lentil", "potatoes", "potato", "flaxseeds", "flaxseed", "flax seed",
+                           "flax seeds", "seeds", "seed", "soy")
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton finding every occurrence of a set of keywords in one pass over a text, however many
+    keywords there are
+
+    Keywords ending in "$" are anchored, and only match at the end of the text
+    """
+
+    def __init__(self, keywords):
+        """
+        :param keywords: iterable of lowercase keywords
+        """
+        self.goto = [dict()]  # state -> {character: next state}
+        self.fail = [0]  # state -> state of the longest proper suffix that is also a keyword prefix
+        self.output = [[]]  # state -> list of (keyword length, anchored) of keywords ending in this state
+
+        for keyword in keywords:
+            anchored = keyword.endswith("$")
+            if anchored:
+                keyword = keyword[:-1]
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append((len(keyword), anchored))
+
+        # breadth-first, so the failure state of each state is built before its children's
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, child in self.goto[state].items():
+                pending.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+        self.longest: int = max((length for outputs in self.output for length, anchored in outputs), default=0)
+
+    def find_all(self, text: str):
+        """
+        :param text: lowercase text to search
+        :return: generator of (start, end) of every keyword occurrence, in order of where they end
+        """
+        end_of_text = len(text[:-1]) if text.endswith("\n") else len(text)
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, anchored in self.output[state]:
+                if not anchored or index + 1 == end_of_text or index + 1 == len(text):
+                    yield index + 1 - length, index + 1
+
+    def first(self, text: str):
+        """
+        :param text: lowercase text to search
+        :return: start of the earliest keyword occurrence in the text, or None if there is none
+        """
+        earliest = None
+        for start, end in self.find_all(text):
+            if earliest is not None and end > earliest + self.longest:
+                break  # no later occurrence can start any earlier
+            if earliest is None or start < earliest:
+                earliest = start
+        return earliest
+
+    def search(self, text: str) -> bool:
+        """
+        :param text: lowercase text to search
+        :return: True if any keyword occurs in the text, otherwise False
+        """
+        return next(self.find_all(text), None) is not None
+
+
+class IngredientClassifier:
+    """
+    Checks ingredient lists against the FDA guidelines on legumes, pulses and potatoes in dog food
+
+    The main ingredients are everything before the first vitamin or mineral keyword, and a food meets the guidelines
+    if no bad ingredient keyword occurs in them. Both keyword sets are matched by Aho-Corasick automata, so each
+    ingredient list is scanned once per keyword set rather than once per keyword
+    """
+
+    def __init__(self, vitamin_keywords=VITAMIN_KEYWORDS, bad_ingredient_keywords=BAD_INGREDIENT_KEYWORDS):
+        """
+        :param vitamin_keywords: keywords marking the first vitamin or mineral in an ingredient list
+        :param bad_ingredient_keywords: keywords marking legumes, pulses and potatoes
+        """
+        self.vitamin_keywords: tuple = tuple(keyword.lower() for keyword in vitamin_keywords)
+        self.bad_ingredient_keywords: tuple = tuple(keyword.lower() for keyword in bad_ingredient_keywords)
+        self.vitamins = KeywordMatcher(self.vitamin_keywords)
+        self.bad_ingredients = KeywordMatcher(self.bad_ingredient_keywords)
+
+    def main_ingredients(self, ingredients: str) -> str:
+        """
+        :param ingredients: ingredient list of a food
+        :return: the lowercased ingredient list up to the first vitamin or mineral
+        """
+        ingredients = ingredients.lower()
+        first_vitamin = self.vitamins.first(ingredients)
+        return ingredients if first_vitamin is None else ingredients[:first_vitamin]
+
+    def meets_fda_guidelines(self, ingredients: str) -> bool:
+        """
+        :param ingredients: ingredient list of a food
+        :return: True if none of the main ingredients are legumes, pulses or potatoes, otherwise False
+        """
+        return not self.bad_ingredients.search(self.main_ingredients(ingredients))
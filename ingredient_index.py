@@ -0,0 +1,249 @@
+import re
+import threading
+from collections import defaultdict
+
+import sqlalchemy as sa
+
+from ingredient_classifier import IngredientClassifier
+from models import BREED_SIZE_COLUMNS, Diet, Food, FoodIngredient, FoodSummary, Ingredient
+from scraper_logger import ScraperLogger, SilentScraperLogger
+
+INDEX_TABLES = (Ingredient.__table__, FoodIngredient.__table__, FoodSummary.__table__)
+
+
+def split_ingredients(ingredients: str) -> list:
+    """
+    split an ingredient list into normalized ingredient names - commas inside brackets don't split, and bracketed
+    text is dropped from names, i.e. "Chicken Meal (preserved with Mixed Tocopherols)" is "chicken meal"
+    :param ingredients: ingredient list of a food
+    :return: list of (offset of the ingredient in the list, ingredient name) tuples, in order
+    """
+    names = []
+    depth = 0
+    start = 0
+    for index, char in enumerate(ingredients):
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth = max(depth - 1, 0)
+        elif char == "," and depth == 0:
+            _add_ingredient(names, start, ingredients[start:index])
+            start = index + 1
+    _add_ingredient(names, start, ingredients[start:])  # the last ingredient, even if a bracket was left open
+    return names
+
+
+def _add_ingredient(names: list, offset: int, ingredient: str) -> None:
+    name = _normalize(ingredient)
+    if name:
+        names.append((offset + len(ingredient) - len(ingredient.lstrip()), name))
+
+
+def _normalize(ingredient: str) -> str:
+    bracketed = re.compile(r"[(\[{][^()\[\]{}]*([)\]}]|$)")
+    while bracketed.search(ingredient):
+        ingredient = bracketed.sub(" ", ingredient)  # innermost brackets first, so nested brackets come out whole
+    ingredient = " ".join(ingredient.lower().split()).strip(" .;:*")
+    return ingredient[:255]
+
+
+class IngredientIndex:
+    """
+    Maintains the tables the search app looks foods up by, without scanning free-text ingredients or joining diets
+    row by row - normalized ingredients and the position of each in every food's ingredient list, and a summary row of
+    each food's breed sizes, form, lifestage, diets and number of main ingredients
+
+    Foods are indexed incrementally as they are entered into the database, and the whole index is rebuilt in bulk at
+    the end of each scrape, in one transaction, so it also catches foods changed or deleted by other means
+    """
+
+    def __init__(self, classifier: IngredientClassifier = None, logger: ScraperLogger = SilentScraperLogger()):
+        """
+        :param classifier: classifier finding the main ingredients of a food, defaults to the current keyword lists
+        :param logger: logger for database errors
+        """
+        if classifier is None:
+            classifier = IngredientClassifier()
+        self.classifier: IngredientClassifier = classifier
+        self.logger = logger
+
+        self.lock = threading.Lock()  # one index write at a time, so new ingredient names are only inserted once
+        self.ingredient_ids = dict()  # ingredient name -> id, of ingredients known to be in the database
+
+    @staticmethod
+    def create_tables(engine) -> None:
+        """
+        create the index tables, and the index on diets, if they don't exist yet
+        :param engine: SQLAlchemy engine of the database
+        """
+        for table in INDEX_TABLES:
+            table.create(engine, checkfirst=True)
+        existing = {index["name"] for index in sa.inspect(engine).get_indexes(Diet.__tablename__)}
+        for index in Diet.__table__.indexes:
+            if index.name not in existing:
+                index.create(engine)
+
+    def food_rows(self, food_row: dict, diets: list):
+        """
+        :param food_row: dictionary of food column values
+        :param diets: list of special diets of the food
+        :return: list of ingredient names in order, list of FoodIngredient rows without ingredient ids, and the
+        FoodSummary row of the food
+        """
+        ingredients = food_row.get("ingredients") or ""
+        main_length = len(self.classifier.main_ingredients(ingredients))
+        names = []
+        ingredient_rows = []
+        for position, (offset, name) in enumerate(split_ingredients(ingredients), start=1):
+            names.append(name)
+            ingredient_rows.append({"item_num_id": food_row["item_num"], "position": position,
+                                    "main": offset < main_length})
+
+        diets = sorted({" ".join(diet.split()) for diet in diets if diet and diet.strip()})
+        summary_row = {"item_num": food_row["item_num"],
+                       "breed_sizes": sum(1 << bit for bit, column in enumerate(BREED_SIZE_COLUMNS)
+                                          if food_row.get(column)),
+                       "food_form": food_row.get("food_form"), "lifestage": food_row.get("lifestage") or "",
+                       "diets": ", ".join(diets)[:512], "diet_count": len(diets),
+                       "ingredient_count": len(ingredient_rows),
+                       "main_ingredient_count": sum(1 for row in ingredient_rows if row["main"]),
+                       "fda_guidelines": food_row.get("fda_guidelines")}
+        return names, ingredient_rows, summary_row
+
+    def index_foods(self, session_factory, food_rows: list, diets: list) -> bool:
+        """
+        index foods just entered into the database, replacing any index rows they already had, in one transaction
+        :param session_factory: factory for database sessions, i.e. a sessionmaker
+        :param food_rows: list of dictionaries of food column values
+        :param diets: list of the lists of special diets of each food, in the same order as food_rows
+        :return: True if the foods were indexed, otherwise False
+        """
+        with self.lock:
+            db_session = session_factory()
+            try:
+                item_nums = [food_row["item_num"] for food_row in food_rows]
+                db_session.execute(FoodIngredient.__table__.delete().where(
+                    FoodIngredient.item_num_id.in_(item_nums)))
+                db_session.execute(FoodSummary.__table__.delete().where(FoodSummary.item_num.in_(item_nums)))
+                new_ids = self._insert_rows(db_session, food_rows, diets)
+                db_session.commit()
+            except Exception as e:
+                db_session.rollback()
+                self.logger.error("Error while indexing ingredients of {} foods: {}".format(len(food_rows), e))
+                return False
+            finally:
+                db_session.close()
+            self.ingredient_ids.update(new_ids)
+            return True
+
+    def rebuild(self, session_factory, chunk_size: int = 1000) -> int:
+        """
+        rebuild the whole index from every food in the database, in one transaction - readers see the old index until
+        the new one is committed, and ingredients no longer listed by any food are dropped
+        :param session_factory: factory for database sessions, i.e. a sessionmaker
+        :param chunk_size: number of foods read and indexed at a time
+        :return: number of foods indexed, or None if the rebuild failed
+        """
+        with self.lock:
+            indexed = 0
+            new_ids = dict()
+            db_session = session_factory()
+            try:
+                db_session.execute(FoodIngredient.__table__.delete())
+                db_session.execute(FoodSummary.__table__.delete())
+                for food_rows in self._food_chunks(db_session, chunk_size):
+                    diets = defaultdict(list)
+                    item_nums = [food_row["item_num"] for food_row in food_rows]
+                    for item_num, diet in db_session.query(Diet.item_num_id, Diet.diet).filter(
+                            Diet.item_num_id.in_(item_nums)):
+                        diets[item_num].append(diet)
+                    new_ids.update(self._insert_rows(db_session, food_rows,
+                                                     [diets[item_num] for item_num in item_nums], new_ids))
+                    indexed += len(food_rows)
+
+                listed = sa.select([FoodIngredient.ingredient_id])
+                unlisted = [ingredient_id for (ingredient_id,) in db_session.query(Ingredient.id).filter(
+                    ~Ingredient.id.in_(listed))]
+                if unlisted:
+                    db_session.execute(Ingredient.__table__.delete().where(Ingredient.id.in_(unlisted)))
+                db_session.commit()
+            except Exception as e:
+                db_session.rollback()
+                self.logger.error("Error while rebuilding the ingredient index: {}".format(e))
+                return None
+            finally:
+                db_session.close()
+
+            self.ingredient_ids.update(new_ids)
+            unlisted = set(unlisted)
+            self.ingredient_ids = {name: ingredient_id for name, ingredient_id in self.ingredient_ids.items()
+                                   if ingredient_id not in unlisted}
+            self.logger.message("Indexed ingredients of {} foods".format(indexed))
+            return indexed
+
+    @staticmethod
+    def _food_chunks(db_session, chunk_size: int):
+        """
+        :return: generator of lists of food rows, in order of item number - each chunk is a separate query
+        """
+        columns = [Food.item_num, Food.ingredients, Food.food_form, Food.lifestage, Food.fda_guidelines] + \
+                  [getattr(Food, column) for column in BREED_SIZE_COLUMNS]
+        last_item_num = None
+        while True:
+            query = db_session.query(*columns)
+            if last_item_num is not None:
+                query = query.filter(Food.item_num > last_item_num)
+            rows = [dict(zip([column.key for column in columns], row))
+                    for row in query.order_by(Food.item_num).limit(chunk_size)]
+            if not rows:
+                return
+            yield rows
+            last_item_num = rows[-1]["item_num"]
+
+    def _insert_rows(self, db_session, food_rows: list, diets: list, pending_ids: dict = None) -> dict:
+        """
+        insert the FoodIngredient and FoodSummary rows of foods, and any ingredients not in the database yet - must
+        hold self.lock
+        :param pending_ids: ingredient ids inserted earlier in the same transaction, keyed by name
+        :return: dictionary of ingredient ids inserted, keyed by name - only safe to remember once committed
+        """
+        ingredient_rows = []
+        summary_rows = []
+        names = []
+        for food_row, food_diets in zip(food_rows, diets):
+            food_names, food_ingredient_rows, summary_row = self.food_rows(food_row, food_diets)
+            names.extend(food_names)
+            ingredient_rows.extend(zip(food_names, food_ingredient_rows))
+            summary_rows.append(summary_row)
+
+        known = dict(self.ingredient_ids)
+        known.update(pending_ids or dict())
+        new_ids = self._ingredient_ids(db_session, {name for name in names if name not in known})
+        known.update(new_ids)
+
+        rows = [dict(row, ingredient_id=known[name]) for name, row in ingredient_rows]
+        if rows:
+            db_session.execute(FoodIngredient.__table__.insert(), rows)
+        if summary_rows:
+            db_session.execute(FoodSummary.__table__.insert(), summary_rows)
+        return new_ids
+
+    @staticmethod
+    def _ingredient_ids(db_session, names: set) -> dict:
+        """
+        look up ingredient names, inserting the ones not in the database yet
+        :return: dictionary of ingredient ids, keyed by name
+        """
+        ids = dict()
+        names = sorted(names)
+        # names inserted by another writer since they were looked up are skipped by the unique name
+        insert = Ingredient.__table__.insert().prefix_with("IGNORE", dialect="mysql")
+        insert = insert.prefix_with("OR IGNORE", dialect="sqlite")
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            ids.update(db_session.query(Ingredient.name, Ingredient.id).filter(Ingredient.name.in_(chunk)))
+            missing = [name for name in chunk if name not in ids]
+            if missing:
+                db_session.execute(insert, [{"name": name} for name in missing])
+                ids.update(db_session.query(Ingredient.name, Ingredient.id).filter(Ingredient.name.in_(missing)))
+        return ids
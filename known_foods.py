@@ -0,0 +1,82 @@
+import threading
+
+from models import Food
+from scraper_logger import ScraperLogger, SilentScraperLogger
+from url_frontier import canonical_url
+
+
+class KnownFoodIndex:
+    """
+    In-memory index of the (canonical) urls and item numbers of foods already in the database
+
+    The index is bulk-loaded once when a scrape starts and kept up to date as foods are inserted, so checking whether a
+    food is new doesn't need a query per food. Until the index has been loaded, lookups answer None (unsure), and the
+    caller should fall back to checking the database
+    """
+
+    def __init__(self, logger: ScraperLogger = SilentScraperLogger()):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.urls = set()
+        self.item_nums = set()
+        self.loaded: bool = False
+
+    def load(self, session_factory, chunk_size: int = 1000) -> None:
+        """
+        load the url and item number of every food in the database, streaming rows in chunks
+        :param session_factory: factory for database sessions, i.e. a sessionmaker
+        :param chunk_size: number of rows to fetch from the database at a time
+        """
+        urls = set()
+        item_nums = set()
+        db_session = session_factory()
+        try:
+            for url, item_num in db_session.query(Food.url, Food.item_num).yield_per(chunk_size):
+                urls.add(canonical_url(url))
+                item_nums.add(item_num)
+        except Exception as e:
+            db_session.rollback()
+            self.logger.error("Error loading known foods, falling back to database checks: {}".format(e))
+            return
+        finally:
+            db_session.close()
+
+        with self.lock:
+            self.urls |= urls
+            self.item_nums |= item_nums
+            self.loaded = True
+        self.logger.message("Loaded {} known foods".format(len(item_nums)))
+
+    def add(self, url: str, item_num: int) -> None:
+        """
+        record a food inserted into the database
+        """
+        with self.lock:
+            self.urls.add(canonical_url(url))
+            self.item_nums.add(item_num)
+
+    def add_rows(self, food_rows: list) -> None:
+        """
+        record foods inserted into the database
+        :param food_rows: list of dictionaries of food column values
+        """
+        with self.lock:
+            for food_row in food_rows:
+                self.urls.add(canonical_url(food_row["url"]))
+                self.item_nums.add(food_row["item_num"])
+
+    def has_url(self, url: str):
+        """
+        :return: True or False indicating if a food with this url is in the database, or None if unsure
+        """
+        if not self.loaded:
+            return None
+        return canonical_url(url) in self.urls
+
+    def has_item_num(self, item_num: int):
+        """
+        :return: True or False indicating if a food with this item number is in the database, or None if unsure
+        """
+        if not self.loaded:
+            return None
+        return item_num in self.item_nums
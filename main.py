@@ -1,16 +1,77 @@
+from async_scraper import AsyncScraper
+from concurrency import ConcurrencyController
+from crawl_journal import CrawlJournal
+from metrics import ScrapeMetrics
+from response_archive import ResponseArchive
+from response_cache import ResponseCache
+from retry_policy import DeadLetters
 from scraper import Scraper
 from scraper_logger import *
+from session_builder.session_builder import SessionBuilder
+from work_queue import RedisWorkQueue, SqlWorkQueue
 
 THREADS = 5
+ASYNC = False  # run on an asyncio event loop instead of a pool of worker threads
+MAX_IN_FLIGHT = 50  # number of requests open at once when running on the event loop
+ADAPTIVE = False  # adapt the number of requests in flight to the site's responses, instead of THREADS / MAX_IN_FLIGHT
+CONCURRENCY_FLOOR = 2  # fewest requests in flight while adapting
+CONCURRENCY_CEILING = 20  # most requests in flight while adapting - also the number of workers
+PARSE_PROCESSES = 0  # number of processes to parse pages in, 0 to parse pages in the workers that fetched them
+STREAM = False  # parse pages as they download, and stop downloading each page once everything needed has been found
+NO_PROXY_POLICY = "ask"  # if no proxies are available - "ask", "direct" to scrape without them, or "fail" to stop
 DATABASE = "scraperdb.cnf"
 SEARCH_URL = "https://www.chewy.com/s?rh=c%3A288%2Cc%3A332&page="  # contains all dog foods
 FORCE = True
+REFRESH = False  # re-check foods already in the database, and update those that have changed
+RESPONSE_CACHE = "cache/responses.sqlite"  # path to cache responses in, or None to not cache responses
+JOURNAL = "cache/journal.sqlite"  # path to journal jobs in so an interrupted scrape can be resumed, or None
+RESUME = False  # resume the last scrape from the journal, if it was interrupted
+WORK_QUEUE = None  # "sql" or a redis:// url to share jobs with scrapers on other machines, or None to scrape alone
+WORKER = False  # work on the crawl another machine started in WORK_QUEUE, instead of starting one
+DEAD_LETTERS = "cache/dead_letters.jsonl"  # path to keep requests that ran out of retries in, or None
+ARCHIVE = None  # directory to archive every raw response in for replaying later, i.e. "archive", or None
+REPLAY = False  # re-extract foods from the responses in ARCHIVE instead of scraping the site
+LOG_JSON = False  # write the log as JSON lines instead of plain text
+METRICS_JSON = "logs/metrics.json"  # path to write a JSON snapshot of scrape metrics to, or None
+METRICS_PROMETHEUS = None  # path to write scrape metrics to in Prometheus text format, or None
+METRICS_PORT = None  # port to serve scrape metrics from on localhost, or None
 
 
 def main():
-    logger = VerboseScraperLogger()
-    scraper = Scraper(database=DATABASE, logger=logger, num_threads=THREADS, force=FORCE)
-    scraper.scrape(url=SEARCH_URL)
+    logger = QueuedScraperLogger(json_lines=LOG_JSON)
+    response_cache = ResponseCache(path=RESPONSE_CACHE) if RESPONSE_CACHE else None
+    work_queue = None
+    if WORK_QUEUE == "sql":
+        work_queue = SqlWorkQueue(DATABASE)
+    elif WORK_QUEUE:
+        work_queue = RedisWorkQueue.from_url(WORK_QUEUE)
+    # the work queue keeps the jobs of a shared crawl itself, so there is no journal
+    journal = CrawlJournal(path=JOURNAL) if JOURNAL and work_queue is None else None
+    dead_letters = DeadLetters(path=DEAD_LETTERS) if DEAD_LETTERS else None
+    archive = ResponseArchive(directory=ARCHIVE) if ARCHIVE else None
+    metrics = ScrapeMetrics(json_path=METRICS_JSON, prometheus_path=METRICS_PROMETHEUS, port=METRICS_PORT)
+    concurrency = None
+    if ADAPTIVE:
+        concurrency = ConcurrencyController(floor=CONCURRENCY_FLOOR, ceiling=CONCURRENCY_CEILING, logger=logger)
+    session_builder = SessionBuilder(no_proxy_policy=NO_PROXY_POLICY, logger=logger)
+    options = dict(database=DATABASE, logger=logger, force=FORCE, refresh=REFRESH, parse_processes=PARSE_PROCESSES,
+                   response_cache=response_cache, journal=journal, dead_letters=dead_letters, metrics=metrics,
+                   archive=None if REPLAY else archive, stream=STREAM, work_queue=work_queue,
+                   concurrency=concurrency, session_builder=session_builder)
+    if ASYNC:
+        scraper = AsyncScraper(max_in_flight=MAX_IN_FLIGHT, **options)
+    else:
+        scraper = Scraper(num_threads=THREADS, **options)
+    if REPLAY:
+        scraper.replay(archive)
+    elif WORKER:
+        scraper.work()
+    else:
+        scraper.scrape(url=SEARCH_URL, resume=RESUME)
+    if archive is not None:
+        archive.close()
+    if response_cache is not None:
+        response_cache.close()
 
 
 if __name__ == "__main__":
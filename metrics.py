@@ -0,0 +1,320 @@
+import json
+import os
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, time
+
+# upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name of the label of each labelled counter
+COUNTER_LABELS = {"responses": "status", "request_errors": "error", "skips": "reason"}
+
+
+class Histogram:
+    """
+    Counts of observed values in fixed buckets, with their total - enough to estimate quantiles without keeping every
+    value
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        :param buckets: sorted upper bounds of the buckets
+        """
+        self.buckets: tuple = tuple(buckets)
+        self.counts: list = [0] * (len(self.buckets) + 1)  # the last bucket counts values above every bound
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float):
+        """
+        :param q: quantile to estimate, between 0 and 1
+        :return: upper bound of the bucket the quantile falls in, or None if nothing has been observed - values above
+        every bound are reported as the largest bound
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "mean": round(self.sum / self.count, 6) if self.count else None,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+                "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], self.counts))}
+
+
+class ScrapeMetrics:
+    """
+    Instrumentation of a scrape - latency histograms per stage (i.e. request, parse, dedup, insert), counters (i.e.
+    bytes downloaded, responses by status, retries, skips), and gauges sampled every interval seconds (queue depth,
+    busy workers and worker utilization) with a rolling history of the samples
+
+    While started, a background thread takes the samples and writes a JSON snapshot and/or a Prometheus text file every
+    interval seconds, and can serve both over HTTP on localhost - so THREADS and the rate limits can be tuned from data
+    """
+
+    def __init__(self, interval: float = 10.0, json_path: str = None, prometheus_path: str = None, port: int = None,
+                 history: int = 360):
+        """
+        :param interval: number of seconds between samples and snapshot writes
+        :param json_path: path to write a JSON snapshot to every interval, or None
+        :param prometheus_path: path to write Prometheus text exposition format to every interval, or None - i.e. for
+        the node exporter's textfile collector
+        :param port: port to serve /metrics (Prometheus) and /metrics.json on localhost from, or None
+        :param history: number of samples to keep
+        """
+        self.interval: float = interval
+        self.json_path: str = json_path
+        self.prometheus_path: str = prometheus_path
+        self.port: int = port
+
+        self.lock = threading.Lock()
+        self.histograms = dict()  # stage -> Histogram
+        self.counters = dict()  # (name, label value) -> count
+        self.gauges = dict()  # name -> function returning the gauge's value
+
+        # worker utilization - the integral of busy workers over time, updated whenever a worker starts or finishes
+        self.workers: int = 0
+        self.busy: int = 0
+        self.busy_seconds: float = 0.0
+        self.last_change: float = monotonic()
+
+        self.samples = deque(maxlen=history)
+        self.started: float = None
+        self.last_sample = (monotonic(), 0.0)  # time and busy_seconds of the last sample
+
+        self.stopping = threading.Event()
+        self.thread = None
+        self.server = None
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        record the latency of one pass through a stage
+        """
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        """
+        record the latency of the enclosed block as one pass through a stage, whether or not it raises
+        """
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, monotonic() - start)
+
+    def count(self, name: str, amount: int = 1, label=None) -> None:
+        """
+        add to a counter
+        :param name: name of the counter
+        :param amount: amount to add
+        :param label: value of the counter's label (see COUNTER_LABELS), if it has one
+        """
+        key = (name, None if label is None else str(label))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_gauge(self, name: str, func) -> None:
+        """
+        sample a gauge every interval
+        :param name: name of the gauge
+        :param func: function taking no arguments and returning the gauge's current value
+        """
+        self.gauges[name] = func
+
+    def set_workers(self, workers: int) -> None:
+        """
+        :param workers: number of workers jobs are spread over, for worker utilization
+        """
+        self.workers = workers
+
+    def worker_busy(self) -> None:
+        """
+        record a worker starting a job
+        """
+        self._change_busy(1)
+
+    def worker_idle(self) -> None:
+        """
+        record a worker finishing a job
+        """
+        self._change_busy(-1)
+
+    def _change_busy(self, change: int) -> None:
+        now = monotonic()
+        with self.lock:
+            self.busy_seconds += self.busy * (now - self.last_change)
+            self.last_change = now
+            self.busy += change
+
+    def start(self) -> None:
+        """
+        start the thread sampling gauges and writing snapshots, and the HTTP endpoint if a port was given
+        """
+        self.started = time()
+        self.last_sample = (monotonic(), self.busy_seconds)
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="ScrapeMetrics", daemon=True)
+        self.thread.start()
+        if self.port is not None:
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.port), _handler(self))
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="ScrapeMetricsHTTP", daemon=True).start()
+
+    def stop(self) -> None:
+        """
+        take a last sample, write a last snapshot, and stop the sampling thread and the HTTP endpoint
+        """
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def run(self) -> None:
+        while not self.stopping.wait(self.interval):
+            self.sample()
+            self.write()
+        self.sample()
+        self.write()
+
+    def sample(self) -> dict:
+        """
+        sample every gauge, and the worker utilization since the last sample, into the history
+        :return: the sample
+        """
+        values = dict()
+        for name, func in list(self.gauges.items()):
+            try:
+                values[name] = func()
+            except Exception:
+                values[name] = None
+
+        now = monotonic()
+        with self.lock:
+            busy_seconds = self.busy_seconds + self.busy * (now - self.last_change)
+            busy = self.busy
+        last_time, last_busy_seconds = self.last_sample
+        self.last_sample = (now, busy_seconds)
+        capacity = self.workers * (now - last_time)
+
+        values.update(time=round(time(), 3), busy_workers=busy,
+                      utilization=round((busy_seconds - last_busy_seconds) / capacity, 4) if capacity > 0 else None)
+        self.samples.append(values)
+        return values
+
+    def snapshot(self) -> dict:
+        """
+        :return: dictionary of every histogram, counter and recent sample, ready to be dumped as JSON
+        """
+        with self.lock:
+            histograms = {stage: histogram.snapshot() for stage, histogram in sorted(self.histograms.items())}
+            counters = dict()
+            for (name, label), count in sorted(self.counters.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+                if label is None:
+                    counters[name] = count
+                else:
+                    counters.setdefault(name, dict())[label] = count
+        return {"started": self.started, "uptime": round(time() - self.started, 3) if self.started else None,
+                "workers": self.workers, "stages": histograms, "counters": counters, "samples": list(self.samples)}
+
+    def prometheus(self) -> str:
+        """
+        :return: every histogram, counter and the latest sample of every gauge, in Prometheus text exposition format
+        """
+        lines = ["# TYPE scraper_stage_seconds histogram"]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in histogram.buckets] + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append('scraper_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, bound,
+                                                                                               cumulative))
+                lines.append('scraper_stage_seconds_sum{{stage="{}"}} {}'.format(stage, histogram.sum))
+                lines.append('scraper_stage_seconds_count{{stage="{}"}} {}'.format(stage, histogram.count))
+
+            typed = set()
+            for (name, label), count in sorted(self.counters.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+                metric = "scraper_{}_total".format(name)
+                if metric not in typed:
+                    lines.append("# TYPE {} counter".format(metric))
+                    typed.add(metric)
+                if label is None:
+                    lines.append("{} {}".format(metric, count))
+                else:
+                    lines.append('{}{{{}="{}"}} {}'.format(metric, COUNTER_LABELS.get(name, "label"), label, count))
+
+        latest = self.samples[-1] if self.samples else dict()
+        for name, value in sorted(latest.items()):
+            if name != "time" and isinstance(value, (int, float)):
+                lines.append("# TYPE scraper_{} gauge".format(name))
+                lines.append("scraper_{} {}".format(name, value))
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """
+        write the JSON snapshot and Prometheus text file, if paths were given - each file is replaced atomically, so
+        readers never see half a snapshot
+        """
+        if self.json_path is not None:
+            self._write_file(self.json_path, json.dumps(self.snapshot(), indent=2))
+        if self.prometheus_path is not None:
+            self._write_file(self.prometheus_path, self.prometheus())
+
+    @staticmethod
+    def _write_file(path: str, content: str) -> None:
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + ".tmp", "w") as file:
+            file.write(content)
+        os.replace(path + ".tmp", path)
+
+
+def _handler(metrics: ScrapeMetrics):
+    """
+    :return: request handler class serving the metrics at /metrics (Prometheus) and /metrics.json
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(metrics.snapshot()), "application/json"
+            else:
+                self.send_error(404)
+                return
+            body = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keep request lines out of the scraper's output
+
+    return MetricsHandler
@@ -0,0 +1,190 @@
+import hashlib
+import json
+from collections import defaultdict
+
+import sqlalchemy as sa
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import StaticPool
+
+Base = declarative_base()
+
+
+class Food(Base):
+    """
+    SQLAlchemy model for a food
+    """
+    __tablename__ = 'food_search_food'
+    item_num = sa.Column(sa.Integer, primary_key=True)
+    url = sa.Column(sa.String, unique=True)
+    name = sa.Column(sa.String, nullable=False)
+    ingredients = sa.Column(sa.String, nullable=False)
+    brand = sa.Column(sa.String)
+    xsm_breed = sa.Column(sa.Boolean, nullable=False, default=False)
+    sm_breed = sa.Column(sa.Boolean, nullable=False, default=False)
+    md_breed = sa.Column(sa.Boolean, nullable=False, default=False)
+    lg_breed = sa.Column(sa.Boolean, nullable=False, default=False)
+    xlg_breed = sa.Column(sa.Boolean, nullable=False, default=False)
+    food_form = sa.Column(sa.String)
+    lifestage = sa.Column(sa.String, nullable=False)
+    fda_guidelines = sa.Column(sa.Boolean)
+
+
+class Diet(Base):
+    """
+    SQLAlchemy model for a special diet
+    """
+    __tablename__ = 'food_search_diet'
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    diet = sa.Column(sa.String, nullable=False)
+    item_num_id = sa.Column(sa.Integer, sa.ForeignKey(Food.item_num))
+
+    # foods with a diet are found by index lookup rather than a scan of every diet row
+    __table_args__ = (sa.Index('ix_food_search_diet_diet_item_num', 'diet', 'item_num_id'),)
+
+
+class Update(Base):
+    """
+    SQLAlchemy model for scraper update date/time
+    """
+    __tablename__ = 'food_search_scraperupdates'
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    date = sa.Column(sa.DateTime, nullable=False)
+    count = sa.Column(sa.Integer, nullable=False)
+
+
+class FoodFingerprint(Base):
+    """
+    SQLAlchemy model for a hash of the details scraped for a food, used to find foods that have changed
+    """
+    __tablename__ = 'food_search_foodfingerprint'
+    item_num = sa.Column(sa.Integer, sa.ForeignKey(Food.item_num), primary_key=True)
+    fingerprint = sa.Column(sa.String(40), nullable=False)
+    checked = sa.Column(sa.DateTime, nullable=False)
+
+
+class Ingredient(Base):
+    """
+    SQLAlchemy model for a normalized ingredient name, shared by every food listing it
+    """
+    __tablename__ = 'food_search_ingredient'
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    name = sa.Column(sa.String(255), nullable=False, unique=True)
+
+
+class FoodIngredient(Base):
+    """
+    SQLAlchemy model for an ingredient of a food, at its position in the food's ingredient list (from 1) - main
+    ingredients are the ingredients listed before the first vitamin or mineral
+    """
+    __tablename__ = 'food_search_foodingredient'
+    item_num_id = sa.Column(sa.Integer, sa.ForeignKey(Food.item_num), primary_key=True)
+    position = sa.Column(sa.Integer, primary_key=True, autoincrement=False)
+    ingredient_id = sa.Column(sa.Integer, sa.ForeignKey(Ingredient.id), nullable=False)
+    main = sa.Column(sa.Boolean, nullable=False)
+
+    # foods containing an ingredient (as a main ingredient) are found by index lookup
+    __table_args__ = (sa.Index('ix_food_search_foodingredient_ingredient', 'ingredient_id', 'main', 'item_num_id'),)
+
+
+class FoodSummary(Base):
+    """
+    SQLAlchemy model for a summary of a food's details, for filtering foods without joining their diets and ingredients
+    - breed_sizes is a bit mask of BREED_SIZE_COLUMNS, and diets lists the food's normalized diets separated by ", "
+    """
+    __tablename__ = 'food_search_foodsummary'
+    item_num = sa.Column(sa.Integer, sa.ForeignKey(Food.item_num), primary_key=True, autoincrement=False)
+    breed_sizes = sa.Column(sa.Integer, nullable=False)
+    food_form = sa.Column(sa.String(64))
+    lifestage = sa.Column(sa.String(64), nullable=False)
+    diets = sa.Column(sa.String(512), nullable=False)
+    diet_count = sa.Column(sa.Integer, nullable=False)
+    ingredient_count = sa.Column(sa.Integer, nullable=False)
+    main_ingredient_count = sa.Column(sa.Integer, nullable=False)
+    fda_guidelines = sa.Column(sa.Boolean)
+
+    __table_args__ = (sa.Index('ix_food_search_foodsummary_lifestage_form', 'lifestage', 'food_form'),
+                      sa.Index('ix_food_search_foodsummary_fda_lifestage', 'fda_guidelines', 'lifestage'))
+
+
+class QueuedJob(Base):
+    """
+    SQLAlchemy model for a job of a distributed crawl, in the work queue shared by every scraper process - state is
+    "waiting", "leased" (to owner, until lease_expires) or "done", and url_key is a hash of the job's canonical url, so
+    each page is only queued once per crawl
+    """
+    __tablename__ = 'food_search_scraperjob'
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    url_key = sa.Column(sa.String(40), nullable=False, unique=True)
+    url = sa.Column(sa.Text, nullable=False)
+    kind = sa.Column(sa.String(16), nullable=False)
+    priority = sa.Column(sa.Integer, nullable=False)
+    state = sa.Column(sa.String(8), nullable=False)
+    owner = sa.Column(sa.String(64))
+    lease_expires = sa.Column(sa.Float)
+
+    # waiting jobs are leased in order of priority, then age, and expired leases are found by index lookup
+    __table_args__ = (sa.Index('ix_food_search_scraperjob_lease', 'state', 'priority', 'id'),
+                      sa.Index('ix_food_search_scraperjob_expiry', 'state', 'lease_expires'))
+
+
+# Food columns of each breed size, in the order of their bits in FoodSummary.breed_sizes
+BREED_SIZE_COLUMNS = ("xsm_breed", "sm_breed", "md_breed", "lg_breed", "xlg_breed")
+
+# Food columns covered by a fingerprint - fda_guidelines comes from the ingredients, and the url only picks a size
+FINGERPRINT_COLUMNS = ("item_num", "name", "ingredients", "brand", "xsm_breed", "sm_breed", "md_breed", "lg_breed",
+                       "xlg_breed", "food_form", "lifestage")
+
+
+def food_fingerprint(food_row: dict, diets: list) -> str:
+    """
+    hash the details scraped for a food
+    :param food_row: dictionary of food column values
+    :param diets: list of special diets of the food
+    :return: hex digest identifying the food details
+    """
+    details = {column: food_row.get(column) for column in FINGERPRINT_COLUMNS}
+    for column in ("xsm_breed", "sm_breed", "md_breed", "lg_breed", "xlg_breed"):
+        details[column] = bool(details[column])
+    details["diets"] = sorted(diets)
+    return hashlib.sha1(json.dumps(details, sort_keys=True).encode()).hexdigest()
+
+
+def database_url(database: str) -> str:
+    """
+    build the url of the database to scrape into
+    :param database: SQLAlchemy database url, path to an SQLite database file ending in .sqlite, .sqlite3 or .db, or
+    path to a MySQL database configuration file, with "key = value" lines for user, password, host, port and database
+    :return: SQLAlchemy database url
+    """
+    if "://" in database:
+        return database
+    if database == ":memory:":
+        return "sqlite://"
+    if database.endswith((".sqlite", ".sqlite3", ".db")):
+        return "sqlite:///" + database
+
+    db_cnf_values = defaultdict()
+    with open(database) as db_cnf:
+        for line in db_cnf.readlines():
+            key, value = line.split(' = ')
+            db_cnf_values[key] = value.strip()
+    return 'mysql://{}:{}@{}:{}/{}'.format(db_cnf_values['user'],
+                                           db_cnf_values['password'],
+                                           db_cnf_values['host'],
+                                           db_cnf_values['port'],
+                                           db_cnf_values['database'])
+
+
+def database_engine(database: str):
+    """
+    create an engine for the database to scrape into - SQLite connections may be used from any thread, and an
+    in-memory SQLite database is shared by every thread rather than one per connection
+    :param database: database url, SQLite path or MySQL configuration file - see database_url
+    :return: SQLAlchemy engine
+    """
+    url = database_url(database)
+    if not url.startswith("sqlite"):
+        return sa.create_engine(url)
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        return sa.create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    return sa.create_engine(url, connect_args={"check_same_thread": False})
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+from collections import defaultdict
+from time import monotonic, sleep
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at a fixed rate, holding at most burst tokens
+
+    Permits are reserved rather than waited for, so a bucket can go into debt - the caller is told how long to wait
+    before using its permit, and later callers queue up behind it
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: tokens added to the bucket per second
+        :param burst: maximum number of tokens the bucket can hold
+        """
+        self.rate: float = rate
+        self.burst: int = burst
+        self.tokens: float = float(burst)
+        self.last: float = monotonic()
+
+    def reserve(self, now: float) -> float:
+        """
+        take one token from the bucket
+        :param now: current monotonic time
+        :return: number of seconds the caller must wait before the token may be used
+        """
+        if now > self.last:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.last) * self.rate)
+            self.last = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Hands out request permits from token buckets keyed by proxy and by target host
+
+    A request needs a permit from both the bucket for the proxy it is sent through and the bucket for the host it is
+    sent to, so total throughput grows with the number of proxies while each proxy (and each host) stays within its own
+    rate. A rate of None means requests are not limited on that key.
+
+    Requests sent without a proxy all come from this machine's own address, under the proxy key "direct" - they are
+    limited to direct_rate, which defaults to proxy_rate
+
+    The time each worker spends waiting for permits is recorded, keyed by worker name
+    """
+
+    def __init__(self, proxy_rate: float = None, proxy_burst: int = 1, host_rate: float = None, host_burst: int = 1,
+                 direct_rate: float = None):
+        """
+        :param proxy_rate: requests per second allowed through each proxy, or None for no limit
+        :param proxy_burst: number of requests each proxy may make back-to-back before being limited to proxy_rate
+        :param host_rate: requests per second allowed to each target host, or None for no limit
+        :param host_burst: number of requests each host may receive back-to-back before being limited to host_rate
+        :param direct_rate: requests per second allowed without a proxy, defaults to proxy_rate
+        """
+        self.proxy_rate: float = proxy_rate
+        self.direct_rate: float = direct_rate if direct_rate is not None else proxy_rate
+        self.proxy_burst: int = proxy_burst
+        self.host_rate: float = host_rate
+        self.host_burst: int = host_burst
+
+        self.lock = threading.Lock()
+        self.proxy_buckets = dict()
+        self.host_buckets = dict()
+
+        # total seconds spent waiting for permits, and number of permits handed out, per worker
+        self.wait_times = defaultdict(float)
+        self.permits = defaultdict(int)
+
+    def reserve(self, proxy: str, host: str) -> float:
+        """
+        reserve a permit to make a request through a proxy to a host
+        :param proxy: key identifying the proxy the request will be sent through
+        :param host: host the request will be sent to
+        :return: number of seconds to wait before making the request
+        """
+        now = monotonic()
+        delay = 0.0
+        with self.lock:
+            proxy_rate = self.direct_rate if proxy == "direct" else self.proxy_rate
+            if proxy_rate:
+                if proxy not in self.proxy_buckets:
+                    self.proxy_buckets[proxy] = TokenBucket(proxy_rate, self.proxy_burst)
+                delay = max(delay, self.proxy_buckets[proxy].reserve(now))
+            if self.host_rate:
+                if host not in self.host_buckets:
+                    self.host_buckets[host] = TokenBucket(self.host_rate, self.host_burst)
+                delay = max(delay, self.host_buckets[host].reserve(now))
+        return delay
+
+    def acquire(self, proxy: str, host: str) -> float:
+        """
+        block the calling thread until a permit to make a request through a proxy to a host is available
+        :param proxy: key identifying the proxy the request will be sent through
+        :param host: host the request will be sent to
+        :return: number of seconds spent waiting
+        """
+        delay = self.reserve(proxy, host)
+        if delay > 0:
+            sleep(delay)
+        self._record_wait(threading.current_thread().name, delay)
+        return delay
+
+    async def acquire_async(self, proxy: str, host: str) -> float:
+        """
+        wait on the event loop until a permit to make a request through a proxy to a host is available
+        :param proxy: key identifying the proxy the request will be sent through
+        :param host: host the request will be sent to
+        :return: number of seconds spent waiting
+        """
+        delay = self.reserve(proxy, host)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._record_wait(asyncio.current_task().get_name(), delay)
+        return delay
+
+    def _record_wait(self, worker: str, delay: float) -> None:
+        with self.lock:
+            self.wait_times[worker] += delay
+            self.permits[worker] += 1
+
+    def wait_time_snapshot(self) -> dict:
+        """
+        :return: dictionary of worker name to total seconds spent waiting for permits and number of permits received
+        """
+        with self.lock:
+            return {worker: {"wait_seconds": round(self.wait_times[worker], 3), "permits": self.permits[worker]}
+                    for worker in self.wait_times}
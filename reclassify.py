@@ -0,0 +1,160 @@
+"""
+Re-check the ingredients of every food in the database against the FDA guidelines, and update the foods whose result
+has changed - run after changing the keyword lists in ingredient_classifier.py, instead of scraping everything again
+
+The ingredient index is rebuilt afterwards, as the main ingredients of foods may have changed too
+
+Usage: python reclassify.py [--database scraperdb.cnf] [--chunk-size 1000] [--processes 4] [--dry-run]
+"""
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+from ingredient_classifier import IngredientClassifier
+from ingredient_index import IngredientIndex
+from models import Food, database_engine
+from scraper_logger import *
+
+DATABASE = "scraperdb.cnf"
+
+_classifier = None  # classifier of each parsing process, set by _init_process
+
+
+def _init_process(classifier: IngredientClassifier) -> None:
+    global _classifier
+    _classifier = classifier
+
+
+def classify_chunk(rows: list, classifier: IngredientClassifier = None) -> list:
+    """
+    re-check the ingredients of a chunk of foods
+    :param rows: list of (item_num, ingredients, fda_guidelines) tuples
+    :param classifier: classifier to use, defaults to the classifier the process was started with
+    :return: list of (item_num, fda_guidelines) of the foods whose result has changed
+    """
+    if classifier is None:
+        classifier = _classifier
+    changed = []
+    for item_num, ingredients, fda_guidelines in rows:
+        meets_guidelines = classifier.meets_fda_guidelines(ingredients)
+        if meets_guidelines != fda_guidelines:
+            changed.append((item_num, meets_guidelines))
+    return changed
+
+
+def food_chunks(session_factory, chunk_size: int):
+    """
+    stream the ingredients of every food out of the database, a chunk at a time in order of item number - each chunk is
+    a separate query, so no cursor is held open while changes are written back
+    :param session_factory: factory for database sessions, i.e. a sessionmaker
+    :param chunk_size: number of foods per chunk
+    :return: generator of lists of (item_num, ingredients, fda_guidelines) tuples
+    """
+    last_item_num = None
+    while True:
+        db_session = session_factory()
+        try:
+            query = db_session.query(Food.item_num, Food.ingredients, Food.fda_guidelines)
+            if last_item_num is not None:
+                query = query.filter(Food.item_num > last_item_num)
+            rows = [tuple(row) for row in query.order_by(Food.item_num).limit(chunk_size)]
+        finally:
+            db_session.close()
+        if not rows:
+            return
+        yield rows
+        last_item_num = rows[-1][0]
+
+
+def write_changes(session_factory, changed: list) -> None:
+    """
+    update the fda_guidelines of changed foods, in one transaction
+    :param session_factory: factory for database sessions, i.e. a sessionmaker
+    :param changed: list of (item_num, fda_guidelines) tuples
+    """
+    food = Food.__table__
+    statement = food.update().where(food.c.item_num == sa.bindparam("b_item_num")).values(
+        fda_guidelines=sa.bindparam("b_fda_guidelines"))
+    db_session = session_factory()
+    try:
+        db_session.execute(statement, [{"b_item_num": item_num, "b_fda_guidelines": fda_guidelines}
+                                       for item_num, fda_guidelines in changed])
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def reclassify(session_factory, classifier: IngredientClassifier = None, chunk_size: int = 1000, processes: int = 0,
+               dry_run: bool = False, logger: ScraperLogger = SilentScraperLogger()) -> tuple:
+    """
+    re-check the ingredients of every food in the database, and write back only the foods whose result has changed
+    :param session_factory: factory for database sessions, i.e. a sessionmaker
+    :param classifier: classifier to check ingredients with, defaults to the current keyword lists
+    :param chunk_size: number of foods read, classified and written back at a time
+    :param processes: number of processes to classify chunks in, 0 to classify them in this process
+    :param dry_run: count changed foods without writing them back
+    :param logger: logger for progress and errors
+    :return: tuple of number of foods checked, number of foods changed
+    """
+    if classifier is None:
+        classifier = IngredientClassifier()
+
+    checked = 0
+    changed = 0
+
+    def finish(rows: list, changes: list) -> None:
+        nonlocal checked, changed
+        checked += len(rows)
+        changed += len(changes)
+        if changes and not dry_run:
+            write_changes(session_factory, changes)
+        logger.message("Checked {} foods, {} changed".format(checked, changed))
+
+    if processes > 0:
+        # keep a few chunks ahead of the writer in the pool, but never the whole catalog
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_process, initargs=(classifier,)) as pool:
+            pending = deque()
+            for rows in food_chunks(session_factory, chunk_size):
+                pending.append((rows, pool.submit(classify_chunk, rows)))
+                if len(pending) > processes * 2:
+                    rows, future = pending.popleft()
+                    finish(rows, future.result())
+            while pending:
+                rows, future = pending.popleft()
+                finish(rows, future.result())
+    else:
+        for rows in food_chunks(session_factory, chunk_size):
+            finish(rows, classify_chunk(rows, classifier))
+
+    return checked, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-check the ingredients of every food against the FDA guidelines")
+    parser.add_argument("--database", default=DATABASE,
+                        help="path to database configuration file or SQLite database, or a database url")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true", help="count changed foods without writing them back")
+    args = parser.parse_args()
+
+    engine = database_engine(args.database)
+    session_factory = sessionmaker(bind=engine)
+    logger = VerboseScraperLogger()
+    checked, changed = reclassify(session_factory, chunk_size=args.chunk_size, processes=args.processes,
+                                  dry_run=args.dry_run, logger=logger)
+    print("Checked {} foods, {} {}".format(checked, changed, "would change" if args.dry_run else "changed"))
+    if not args.dry_run:
+        ingredient_index = IngredientIndex(logger=logger)
+        ingredient_index.create_tables(engine)
+        ingredient_index.rebuild(session_factory, chunk_size=args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import glob
+import gzip
+import json
+import os
+import threading
+from time import strftime, time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from url_frontier import canonical_url
+
+
+class ResponseArchive:
+    """
+    Append-only archive of raw responses, for re-extracting foods later without going back to the site
+
+    Every response is appended to the current segment file as its own gzip member - a JSON header line (url, status,
+    headers, time and body length) followed by the body - so a segment is a valid gzip stream at every record
+    boundary, and a crash mid-write only loses the record being written. A new segment is started once the current one
+    reaches segment_bytes, and by every new archive object, so segments from earlier runs are never rewritten
+    """
+
+    def __init__(self, directory: str = "archive", segment_bytes: int = 64 * 1024 * 1024, compression_level: int = 6):
+        """
+        :param directory: directory to keep the segment files in
+        :param segment_bytes: size at which a segment is closed and a new one started
+        :param compression_level: gzip compression level of records, 1 (fastest) to 9 (smallest)
+        """
+        self.directory: str = directory
+        self.segment_bytes: int = segment_bytes
+        self.compression_level: int = compression_level
+
+        self.lock = threading.Lock()
+        self.segment = None
+        self.segment_name: str = None
+        self.segment_number: int = 0
+        self.started: str = strftime("%Y%m%dT%H%M%S")
+
+        # number of records written, and number of truncated records found while reading
+        self.recorded: int = 0
+        self.truncated: int = 0
+
+    def record(self, url: str, r: requests.models.Response) -> None:
+        """
+        append a response to the archive
+        :param url: url the response was requested from
+        :param r: response object
+        """
+        body = r.content or b""
+        header = json.dumps({"url": url, "status": r.status_code, "headers": dict(r.headers), "time": time(),
+                             "length": len(body)})
+        # compress outside the lock, so workers archiving at once don't queue up behind each other
+        member = gzip.compress(header.encode() + b"\n" + body + b"\n", self.compression_level)
+        with self.lock:
+            if self.segment is None or self.segment.tell() >= self.segment_bytes:
+                self._next_segment()
+            self.segment.write(member)
+            self.segment.flush()
+            self.recorded += 1
+
+    def _next_segment(self) -> None:
+        """
+        close the current segment and start a new one - must hold self.lock
+        """
+        if self.segment is not None:
+            self.segment.close()
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self.segment_number += 1
+        self.segment_name = os.path.join(self.directory, "responses-{}-{:05d}.gz".format(self.started,
+                                                                                        self.segment_number))
+        self.segment = open(self.segment_name, "ab")
+
+    def close(self) -> None:
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
+
+    def segments(self) -> list:
+        """
+        :return: paths of every segment in the archive, oldest first
+        """
+        return sorted(glob.glob(os.path.join(self.directory, "responses-*.gz")))
+
+    def responses(self, select=None):
+        """
+        read every archived response, oldest first
+        :param select: function taking a url and returning True if responses from it should be read, or None for all
+        :return: generator of response objects
+        """
+        for number, meta, body in self._records(select):
+            yield self._to_response(meta, body)
+
+    def latest_responses(self, select=None):
+        """
+        read the latest archived response for each page, in the order they were archived - pages are matched by
+        canonical url
+        :param select: function taking a url and returning True if responses from it should be read, or None for all
+        :return: generator of response objects
+        """
+        latest = dict()  # canonical url -> record number of its latest response
+        for number, meta, body in self._records(select):
+            latest[canonical_url(meta["url"])] = number
+        wanted = set(latest.values())
+        for number, meta, body in self._records(select):
+            if number in wanted:
+                yield self._to_response(meta, body)
+
+    def _records(self, select=None):
+        """
+        read every record in the archive, oldest first - a truncated record ends its segment, and is counted in
+        truncated
+        :param select: function taking a url and returning True if its records should be read, or None for all
+        :return: generator of (record number, header dictionary, body) tuples - record numbers count every record,
+        selected or not
+        """
+        self.truncated = 0
+        number = 0
+        for path in self.segments():
+            with gzip.open(path, "rb") as segment:
+                while True:
+                    try:
+                        header = segment.readline()
+                        if not header:
+                            break
+                        meta = json.loads(header)
+                        body = segment.read(meta["length"] + 1)
+                        if len(body) != meta["length"] + 1:
+                            raise EOFError("record ended early")
+                    except (EOFError, OSError, ValueError):
+                        self.truncated += 1
+                        break
+                    number += 1
+                    if select is None or select(meta["url"]):
+                        yield number, meta, body[:-1]
+
+    @staticmethod
+    def _to_response(meta: dict, body: bytes) -> requests.models.Response:
+        r = requests.models.Response()
+        r.status_code = meta["status"]
+        r.headers = CaseInsensitiveDict(meta["headers"])
+        r._content = body
+        r.url = meta["url"]
+        r.archived_at = meta["time"]
+        return r
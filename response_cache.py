@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from time import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class ResponseCache:
+    """
+    Persistent, size-bounded cache of responses, keyed by url and stored compressed in a local SQLite database
+
+    A cached response younger than the time-to-live for its page type is served from disk without a request. Once it
+    is older, the request is made conditional on the ETag / Last-Modified of the cached response, and a 304 Not
+    Modified is served from disk. When the cache grows past max_bytes, the least recently used responses are evicted
+
+    The last access time of responses served from disk is written in batches of access_batch, and before anything is
+    evicted, rather than committed on every hit
+    """
+
+    # default seconds a response is served without revalidating, per page type
+    DEFAULT_TTLS = {"search": 0, "food": 24 * 60 * 60}
+
+    def __init__(self, path: str = "cache/responses.sqlite", max_bytes: int = 512 * 1024 * 1024, ttls: dict = None,
+                 compression_level: int = 6, access_batch: int = 100):
+        """
+        :param path: path of the SQLite database to store responses in
+        :param max_bytes: maximum total size of compressed responses to keep
+        :param ttls: seconds a response is served without revalidating, per page type - see page_type()
+        :param compression_level: zlib compression level for response bodies
+        :param access_batch: number of responses served from disk before their last access times are written
+        """
+        self.path: str = path
+        self.max_bytes: int = max_bytes
+        self.ttls: dict = dict(self.DEFAULT_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.compression_level: int = compression_level
+        self.access_batch: int = access_batch
+        self.accessed = dict()  # url -> last access time of responses served from disk, not yet written
+
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                        "url TEXT PRIMARY KEY, "
+                        "status INTEGER NOT NULL, "
+                        "headers TEXT NOT NULL, "
+                        "etag TEXT, "
+                        "last_modified TEXT, "
+                        "fetched_at REAL NOT NULL, "
+                        "last_access REAL NOT NULL, "
+                        "size INTEGER NOT NULL, "
+                        "body BLOB NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.db.commit()
+        self.total_bytes: int = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        # number of responses served from disk without a request, and after a 304 Not Modified
+        self.hits: int = 0
+        self.revalidations: int = 0
+
+    @staticmethod
+    def page_type(url: str) -> str:
+        """
+        :return: "food" for links to food pages, otherwise "search"
+        """
+        return "food" if "/dp/" in urlsplit(url).path else "search"
+
+    def lookup(self, url: str):
+        """
+        :param url: url of the page
+        :return: dictionary of the cached response for a url, or None if it isn't cached
+        """
+        with self.lock:
+            row = self.db.execute("SELECT status, headers, etag, last_modified, fetched_at, body FROM responses "
+                                  "WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "headers": row[1], "etag": row[2], "last_modified": row[3], "fetched_at": row[4],
+                "body": row[5]}
+
+    def is_fresh(self, url: str, entry: dict) -> bool:
+        """
+        :return: True if the cached response for a url can be served without revalidating it
+        """
+        return time() - entry["fetched_at"] < self.ttls.get(self.page_type(url), 0)
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        """
+        :return: headers to make a request conditional on the cached response having changed
+        """
+        headers = dict()
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def hit(self, url: str, entry: dict) -> requests.models.Response:
+        """
+        serve a fresh cached response
+        :return: response object rebuilt from the cached response
+        """
+        with self.lock:
+            self.hits += 1
+            self.accessed[url] = time()
+            if len(self.accessed) >= self.access_batch:
+                self._write_accessed()
+                self.db.commit()
+        return self._to_response(url, entry)
+
+    def revalidated(self, url: str, entry: dict) -> requests.models.Response:
+        """
+        serve a cached response after the site answered 304 Not Modified, and mark it as freshly fetched
+        :return: response object rebuilt from the cached response, with revalidated set
+        """
+        now = time()
+        with self.lock:
+            self.revalidations += 1
+            self.db.execute("UPDATE responses SET fetched_at = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self.db.commit()
+        r = self._to_response(url, entry)
+        r.revalidated = True
+        return r
+
+    def store(self, url: str, r: requests.models.Response) -> None:
+        """
+        cache a successful response - pages cut short by a streaming fetch are left out, since a cached copy stands in
+        for the whole page
+        :param url: url the response was requested from
+        :param r: response object
+        """
+        if r.status_code != 200 or not r.content or getattr(r, "truncated", False):
+            return
+
+        body = zlib.compress(r.content, self.compression_level)
+        headers = json.dumps({key: r.headers[key] for key in ("Content-Type", "ETag", "Last-Modified")
+                              if key in r.headers})
+        now = time()
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO responses "
+                            "(url, status, headers, etag, last_modified, fetched_at, last_access, size, body) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (url, r.status_code, headers, r.headers.get("ETag"), r.headers.get("Last-Modified"),
+                             now, now, len(body), body))
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._write_accessed()
+                self._evict()
+            self.db.commit()
+
+    def _evict(self) -> None:
+        """
+        delete least recently used responses until the cache is back under 90% of max_bytes - must hold self.lock
+        """
+        target = self.max_bytes * 0.9
+        rows = self.db.execute("SELECT url, size FROM responses ORDER BY last_access").fetchall()
+        evicted = []
+        for url, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((url,))
+            self.total_bytes -= size
+        self.db.executemany("DELETE FROM responses WHERE url = ?", evicted)
+
+    def _write_accessed(self) -> None:
+        """
+        write the last access times of responses served from disk since they were last written - must hold self.lock
+        """
+        self.db.executemany("UPDATE responses SET last_access = ? WHERE url = ?",
+                            [(accessed, url) for url, accessed in self.accessed.items()])
+        self.accessed.clear()
+
+    def close(self) -> None:
+        with self.lock:
+            self._write_accessed()
+            self.db.commit()
+            self.db.close()
+
+    def _to_response(self, url: str, entry: dict) -> requests.models.Response:
+        r = requests.models.Response()
+        r.status_code = entry["status"]
+        r.headers = CaseInsensitiveDict(json.loads(entry["headers"]))
+        r._content = zlib.decompress(entry["body"])
+        r.url = url
+        r.from_cache = True
+        return r
@@ -0,0 +1,162 @@
+import json
+import os
+import random
+import threading
+from time import time
+
+
+class RetryRule:
+    """
+    How often, and how long apart, to retry requests failing with one class of error
+    """
+
+    def __init__(self, max_attempts: int, base_delay: float = 0.0, max_delay: float = 0.0):
+        """
+        :param max_attempts: maximum number of attempts at a request, including the first
+        :param base_delay: seconds to back off before the first retry, doubled for each retry after it
+        :param max_delay: maximum seconds to back off before a retry
+        """
+        self.max_attempts: int = max_attempts
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+
+
+class RetryPolicy:
+    """
+    Decides whether, and after how long, a failed request is retried
+
+    Each class of error has its own RetryRule. Backoff is exponential with full jitter, so retries from many workers
+    don't arrive in lockstep, and a Retry-After from the site is honoured as a minimum. Retries also draw on a
+    crawl-wide budget - every request adds budget_ratio to it and every retry takes one from it - so when much of the
+    site is failing at once, retries are capped at a fraction of traffic instead of multiplying it
+    """
+
+    DEFAULT_RULES = {
+        "proxy": RetryRule(4),  # proxy failed to connect - retried at once through another proxy
+        "banned": RetryRule(3),  # 403 - the proxy has been blocked, retried at once through another proxy
+        "throttled": RetryRule(3, base_delay=5, max_delay=120),  # 429 / 503 - the site is asking us to slow down
+        "server": RetryRule(3, base_delay=2, max_delay=60),  # other 5xx
+        "timeout": RetryRule(3, base_delay=1, max_delay=30),
+        "connection": RetryRule(3, base_delay=1, max_delay=30),  # connection refused or reset
+    }
+
+    def __init__(self, rules: dict = None, budget_ratio: float = 0.2, max_budget: float = 20):
+        """
+        :param rules: RetryRules keyed by error class, overriding DEFAULT_RULES - see classify_status()
+        :param budget_ratio: retries earned per request made
+        :param max_budget: retries available when the scrape starts, and the most that can be saved up
+        """
+        self.rules: dict = dict(self.DEFAULT_RULES)
+        if rules is not None:
+            self.rules.update(rules)
+        self.budget_ratio: float = budget_ratio
+        self.max_budget: float = max_budget
+
+        self.lock = threading.Lock()
+        self.budget: float = max_budget
+
+        # number of retries made, and number refused because the retry budget ran out
+        self.retries: int = 0
+        self.budget_refusals: int = 0
+
+    @staticmethod
+    def classify_status(status_code: int):
+        """
+        :param status_code: status code of a response
+        :return: class of error the status code is retried as - "http" for errors not worth retrying, i.e. 404
+        """
+        if status_code == 403:
+            return "banned"
+        if status_code in (429, 503):
+            return "throttled"
+        if status_code >= 500:
+            return "server"
+        return "http"
+
+    def record_request(self) -> None:
+        """
+        record a request made, earning budget for retries
+        """
+        with self.lock:
+            self.budget = min(self.budget + self.budget_ratio, self.max_budget)
+
+    def should_retry(self, error: str, attempt: int) -> bool:
+        """
+        decide whether to retry a failed request, taking a retry from the budget if so
+        :param error: class of error the request failed with - errors without a rule are never retried
+        :param attempt: number of attempts made at the request so far
+        :return: True if the request should be retried, otherwise False
+        """
+        rule = self.rules.get(error)
+        if rule is None or attempt >= rule.max_attempts:
+            return False
+        with self.lock:
+            if self.budget < 1:
+                self.budget_refusals += 1
+                return False
+            self.budget -= 1
+            self.retries += 1
+        return True
+
+    def delay(self, error: str, attempt: int, retry_after: str = None) -> float:
+        """
+        :param error: class of error the request failed with
+        :param attempt: number of attempts made at the request so far
+        :param retry_after: value of the Retry-After header of the response, if any
+        :return: number of seconds to back off before the next attempt
+        """
+        rule = self.rules[error]
+        delay = random.uniform(0, min(rule.max_delay, rule.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+
+class DeadLetters:
+    """
+    Append-only file of the urls of jobs that ran out of retries, as JSON lines, for a later scrape to re-process
+    """
+
+    def __init__(self, path: str = "cache/dead_letters.jsonl"):
+        """
+        :param path: path of the file to keep dead letters in
+        """
+        self.path: str = path
+        self.lock = threading.Lock()
+        self.added: int = 0
+
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+    def add(self, url: str, error: str) -> None:
+        """
+        record a job that ran out of retries
+        :param url: url of the page the job failed to scrape
+        :param error: class of error its last attempt failed with
+        """
+        line = json.dumps({"url": url, "error": error, "time": time()})
+        with self.lock:
+            with open(self.path, "a") as dead_letter_file:
+                dead_letter_file.write(line + "\n")
+            self.added += 1
+
+    def drain(self) -> list:
+        """
+        take every dead letter out of the file, to be re-processed
+        :return: list of the urls of jobs that ran out of retries, without duplicates, in the order they failed
+        """
+        with self.lock:
+            try:
+                with open(self.path, "r") as dead_letter_file:
+                    lines = dead_letter_file.readlines()
+            except FileNotFoundError:
+                return []
+            os.remove(self.path)
+
+        urls = []
+        for line in lines:
+            try:
+                urls.append(json.loads(line)["url"])
+            except (ValueError, KeyError):
+                continue  # skip a line cut short by a crash
+        return list(dict.fromkeys(urls))
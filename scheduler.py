@@ -0,0 +1,394 @@
+import asyncio
+import queue
+import threading
+from collections import deque
+from time import monotonic, sleep
+
+_NO_JOB = object()
+
+
+class JobScheduler:
+    """
+    Thread-safe scheduler of scraping jobs, with the interface of the queue.Queue it replaces (put, get, empty,
+    task_done, join)
+
+    Every job belongs to a job class, given by classify(job). get() hands out the oldest job of the first class in
+    priorities whose in-flight cap hasn't been reached, so i.e. food pages can jump ahead of search pages
+
+    Jobs can also be added lazily from a source - an iterable drawn from only while fewer than refill_below jobs are
+    waiting - so pages are discovered as fast as the workers get through them, and the number of jobs waiting stays
+    flat instead of growing to the size of the catalog
+    """
+
+    def __init__(self, classify, priorities: list, in_flight_caps: dict = None, refill_below: int = 100):
+        """
+        :param classify: function taking a job and returning its job class
+        :param priorities: list of job classes, highest priority first
+        :param in_flight_caps: maximum number of jobs of a class handed out and not yet done, keyed by job class
+        :param refill_below: number of waiting jobs below which jobs are drawn from sources
+        """
+        self.classify = classify
+        self.priorities: list = list(priorities)
+        self.in_flight_caps: dict = dict(in_flight_caps) if in_flight_caps else dict()
+        self.refill_below: int = refill_below
+
+        self.lock = threading.Condition()
+        self.waiting = {job_class: deque() for job_class in self.priorities}  # job class -> deque of jobs
+        self.in_flight = {job_class: 0 for job_class in self.priorities}  # job class -> number of jobs handed out
+        self.handed_out = dict()  # id of a job handed out -> its job class, as classified when it was put
+        self.sources = deque()
+        self.queued: int = 0
+        self.unfinished: int = 0
+        self.stops: int = 0  # number of None sentinels put, to stop workers
+
+    def put(self, job, block: bool = True, timeout: float = None) -> None:
+        """
+        add a job to the scheduler - a None job tells one worker to stop once every job is done
+        :param job: job to add
+        :param block: unused, jobs are never refused
+        :param timeout: unused, jobs are never refused
+        """
+        with self.lock:
+            if job is None:
+                self.stops += 1
+            else:
+                self._put(job)
+            self._notify()
+
+    def put_nowait(self, job) -> None:
+        self.put(job, block=False)
+
+    def expect(self) -> None:
+        """
+        count a job that will be added later with put_expected(), i.e. once a page has been parsed - join() waits for it
+        meanwhile
+        """
+        with self.lock:
+            self.unfinished += 1
+
+    def put_expected(self, job) -> None:
+        """
+        add a job counted in advance with expect()
+        :param job: job to add
+        """
+        with self.lock:
+            self.unfinished -= 1
+            self._put(job)
+            self._notify()
+
+    def add_source(self, jobs) -> None:
+        """
+        add jobs to be drawn lazily, whenever fewer than refill_below jobs are waiting
+        :param jobs: iterable of jobs
+        """
+        with self.lock:
+            self.sources.append(iter(jobs))
+            self._notify()
+
+    def get(self, block: bool = True, timeout: float = None):
+        """
+        take the next job - the oldest job of the highest priority class that isn't at its in-flight cap
+        :param block: wait until a job is available
+        :param timeout: maximum number of seconds to wait for a job, None to wait for as long as it takes
+        :return: the job, or None if a worker has been told to stop
+        """
+        with self.lock:
+            job = self._take()
+            if job is _NO_JOB and block:
+                self.lock.wait_for(self._peek, timeout=timeout)
+                job = self._take()
+            if job is _NO_JOB:
+                raise queue.Empty
+            return job
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self) -> bool:
+        """
+        :return: True if no jobs are waiting and no sources have jobs left to draw, otherwise False
+        """
+        with self.lock:
+            self._refill()
+            return self.queued == 0
+
+    def qsize(self) -> int:
+        """
+        :return: number of jobs waiting, not counting jobs left to draw from sources
+        """
+        with self.lock:
+            return self.queued
+
+    def task_done(self, job=None) -> None:
+        """
+        record a job handed out by get() as done
+        :param job: the job done, so its class's in-flight count can be released - None if the job is unknown
+        """
+        with self.lock:
+            job_class = self.handed_out.pop(id(job), None) if job is not None else None
+            if job_class is not None:
+                self.in_flight[job_class] -= 1
+            self.unfinished -= 1
+            if self.unfinished < 0:
+                raise ValueError("task_done() called too many times")
+            self._notify()
+
+    def join(self) -> None:
+        """
+        block until every job, including jobs left to draw from sources, is done
+        """
+        with self.lock:
+            self.lock.wait_for(self._all_done)
+
+    def _all_done(self) -> bool:
+        self._refill()
+        return self.unfinished == 0 and not self.sources
+
+    def _notify(self) -> None:
+        self.lock.notify_all()
+
+    def _put(self, job) -> None:
+        """
+        add a job to the back of its class - must hold self.lock
+        """
+        self.waiting[self.classify(job)].append(job)
+        self.queued += 1
+        self.unfinished += 1
+
+    def _refill(self) -> None:
+        """
+        draw jobs from sources until refill_below jobs are waiting or the sources run dry - must hold self.lock
+        """
+        while self.sources and self.queued < self.refill_below:
+            try:
+                job = next(self.sources[0])
+            except StopIteration:
+                self.sources.popleft()
+                continue
+            self._put(job)
+
+    def _next_class(self):
+        """
+        :return: the job class the next job is taken from, or None if no job can be handed out - must hold self.lock
+        """
+        self._refill()
+        for job_class in self.priorities:
+            cap = self.in_flight_caps.get(job_class)
+            if self.waiting[job_class] and (cap is None or self.in_flight[job_class] < cap):
+                return job_class
+        return None
+
+    def _peek(self) -> bool:
+        """
+        :return: True if get() would return straight away - must hold self.lock
+        """
+        return self._next_class() is not None or (self.stops > 0 and self.unfinished == 0)
+
+    def _take(self):
+        """
+        take the next job, or a stop sentinel once every job is done - must hold self.lock
+        :return: the job, None to stop, or _NO_JOB if there is nothing to hand out
+        """
+        job_class = self._next_class()
+        if job_class is not None:
+            job = self.waiting[job_class].popleft()
+            self.queued -= 1
+            if job_class in self.in_flight_caps:
+                self.in_flight[job_class] += 1
+                self.handed_out[id(job)] = job_class
+            return job
+        if self.stops > 0 and self.unfinished == 0:
+            self.stops -= 1
+            return None
+        return _NO_JOB
+
+
+class AsyncJobScheduler(JobScheduler):
+    """
+    JobScheduler for coroutines on a single event loop - get() and join() are awaited instead of blocking, and put()
+    never blocks, so jobs can be added from inside coroutines
+    """
+
+    def __init__(self, classify, priorities: list, in_flight_caps: dict = None, refill_below: int = 100):
+        super().__init__(classify, priorities, in_flight_caps=in_flight_caps, refill_below=refill_below)
+        self.changed = asyncio.Event()
+
+    async def get(self):
+        """
+        take the next job, waiting until one is available
+        :return: the job, or None if a worker has been told to stop
+        """
+        while True:
+            with self.lock:
+                job = self._take()
+            if job is not _NO_JOB:
+                return job
+            self.changed.clear()
+            await self.changed.wait()
+
+    async def join(self) -> None:
+        """
+        wait until every job, including jobs left to draw from sources, is done
+        """
+        while True:
+            with self.lock:
+                if self._all_done():
+                    return
+            self.changed.clear()
+            await self.changed.wait()
+
+    def _notify(self) -> None:
+        self.changed.set()
+
+
+class SharedJobScheduler(JobScheduler):
+    """
+    JobScheduler for one of several scraper processes sharing a WorkQueue, i.e. on different machines - jobs of the
+    kinds in kinds are put in the work queue, and taken by whichever process leases them first, while any other jobs
+    (i.e. follow-up jobs) stay in this process
+
+    A leased job joins this process's own jobs, so in-flight caps and task_done() work as they do for local jobs -
+    a job is only leased while no local jobs are waiting. Jobs are acknowledged in the work queue by the scraper, once
+    done, and join() blocks until every process has finished every job in the work queue
+    """
+
+    def __init__(self, work_queue, kinds: dict, classify, priorities: list, in_flight_caps: dict = None,
+                 refill_below: int = 100, poll_interval: float = 1.0, recover_interval: float = 30.0):
+        """
+        :param work_queue: WorkQueue shared by every process of the crawl
+        :param kinds: function of the jobs of each kind put in the work queue, keyed by kind
+        :param classify: function taking a job and returning its job class
+        :param priorities: list of job classes, highest priority first - also the priorities of jobs in the work queue
+        :param in_flight_caps: maximum number of jobs of a class handed out and not yet done, keyed by job class
+        :param refill_below: number of waiting local jobs below which jobs are drawn from sources
+        :param poll_interval: number of seconds between looking for jobs in the work queue, while it has none waiting
+        :param recover_interval: minimum number of seconds between recovering jobs with expired leases
+        """
+        super().__init__(classify, priorities, in_flight_caps=in_flight_caps, refill_below=refill_below)
+        self.work_queue = work_queue
+        self.kinds: dict = dict(kinds)
+        self.kind_of = {func: kind for kind, func in self.kinds.items()}  # function -> kind of its jobs
+        self.poll_interval: float = poll_interval
+        self.recover_interval: float = recover_interval
+        self.last_recovery: float = None
+
+    def put(self, job, block: bool = True, timeout: float = None) -> None:
+        """
+        add a job to the scheduler - jobs of shared kinds are put in the work queue, unless already put this crawl,
+        and a None job tells one worker to stop once every job is done
+        :param job: job to add
+        :param block: unused, jobs are never refused
+        :param timeout: unused, jobs are never refused
+        """
+        if job is not None and self._shared(job):
+            self._share([job])
+        else:
+            super().put(job, block, timeout)
+
+    def add_source(self, jobs, chunk_size: int = 500) -> None:
+        """
+        put jobs of shared kinds in the work queue straight away, in chunks - it is kept outside this process, so
+        there is no backlog to keep small - and add any other jobs to be drawn lazily
+        :param jobs: iterable of jobs
+        :param chunk_size: number of jobs put in the work queue at a time
+        """
+        local = []
+        shared = []
+        for job in jobs:
+            (shared if self._shared(job) else local).append(job)
+            if len(shared) >= chunk_size:
+                self._share(shared)
+                shared = []
+        self._share(shared)
+        if local:
+            super().add_source(local)
+
+    def get(self, block: bool = True, timeout: float = None):
+        """
+        take the next job - a local job if one can be handed out, otherwise a job leased from the work queue
+        :param block: wait until a job is available
+        :param timeout: maximum number of seconds to wait for a job, None to wait for as long as it takes
+        :return: the job, or None if a worker has been told to stop
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            with self.lock:
+                job = self._take()
+                if job is not _NO_JOB:
+                    return job
+                lease = self.queued == 0  # local jobs held back by an in-flight cap go first
+            # lease outside the lock, so other workers can take local jobs meanwhile
+            if lease and self._lease():
+                continue
+            if not block or (deadline is not None and monotonic() >= deadline):
+                raise queue.Empty
+            wait = self.poll_interval if deadline is None else min(self.poll_interval, deadline - monotonic())
+            with self.lock:
+                self.lock.wait_for(self._peek, timeout=max(wait, 0))
+
+    def empty(self) -> bool:
+        """
+        :return: True if no jobs are waiting here or in the work queue, otherwise False
+        """
+        return super().empty() and self.work_queue.waiting() == 0
+
+    def qsize(self) -> int:
+        """
+        :return: number of jobs waiting here and in the work queue, not counting jobs left to draw from sources
+        """
+        return super().qsize() + self.work_queue.waiting()
+
+    def join(self) -> None:
+        """
+        block until every local job is done, and every process has finished every job in the work queue - jobs
+        whose leases expire meanwhile are recovered, to be leased again
+        """
+        while True:
+            super().join()
+            if self.work_queue.drained():
+                return
+            self._recover()
+            sleep(self.poll_interval)
+
+    def _shared(self, job) -> bool:
+        return job[1] in self.kind_of
+
+    def _share(self, jobs: list) -> None:
+        """
+        put jobs in the work queue, at the priority of their job class, and wake workers to lease them
+        """
+        if not jobs:
+            return
+        self.work_queue.put([(job[0], self.kind_of[job[1]], self.priorities.index(self.classify(job)))
+                             for job in jobs])
+        with self.lock:
+            self._notify()
+
+    def _lease(self) -> bool:
+        """
+        lease a job from the work queue, and add it to the local jobs - recovering jobs with expired leases if none
+        are waiting
+        :return: True if a job was leased, otherwise False
+        """
+        leased = self.work_queue.lease()
+        if leased is None and self._recover():
+            leased = self.work_queue.lease()
+        if leased is None:
+            return False
+        url, kind = leased
+        with self.lock:
+            self._put((url, self.kinds[kind]))
+            self._notify()
+        return True
+
+    def _recover(self) -> int:
+        """
+        recover jobs with expired leases from the work queue, at most once every recover_interval seconds
+        :return: number of jobs recovered
+        """
+        with self.lock:
+            now = monotonic()
+            if self.last_recovery is not None and now - self.last_recovery < self.recover_interval:
+                return 0
+            self.last_recovery = now
+        return self.work_queue.recover()
@@ -1,62 +1,41 @@
-import queue
-import re
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime
+from functools import partial
 from math import ceil
-from threading import Thread
-from time import sleep
+from threading import Thread, local
+from time import monotonic, sleep
+from urllib.parse import urljoin, urlsplit
 
 import requests
 import sqlalchemy as sa
-from bs4 import BeautifulSoup
-from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
 
+from concurrency import ConcurrencyController
+from crawl_journal import CrawlJournal
+from db_writer import BatchWriter
+from extractors import FoodExtractor, LxmlExtractor, PageParser
+from ingredient_classifier import IngredientClassifier
+from ingredient_index import IngredientIndex
+from known_foods import KnownFoodIndex
+from metrics import ScrapeMetrics
+from models import Diet, Food, FoodFingerprint, Update, database_engine, food_fingerprint
+from rate_limiter import RateLimiter
+from response_archive import ResponseArchive
+from response_cache import ResponseCache
+from retry_policy import DeadLetters, RetryPolicy
+from scheduler import JobScheduler, SharedJobScheduler
 from scraper_logger import ScraperLogger, SilentScraperLogger
+from session_builder.proxy_manager import ProxyManager
 from session_builder.session_builder import SessionBuilder
+from url_frontier import CrawlFrontier, canonical_url
+from work_queue import WorkQueue
 
-SLEEP_TIME: int = 5
-Base = declarative_base()
-
-
-class Food(Base):
-    """
-    SQLAlchemy model for a food
-    """
-    __tablename__ = 'food_search_food'
-    item_num = sa.Column(sa.Integer, primary_key=True)
-    url = sa.Column(sa.String, unique=True)
-    name = sa.Column(sa.String, nullable=False)
-    ingredients = sa.Column(sa.String, nullable=False)
-    brand = sa.Column(sa.String)
-    xsm_breed = sa.Column(sa.Boolean, nullable=False, default=False)
-    sm_breed = sa.Column(sa.Boolean, nullable=False, default=False)
-    md_breed = sa.Column(sa.Boolean, nullable=False, default=False)
-    lg_breed = sa.Column(sa.Boolean, nullable=False, default=False)
-    xlg_breed = sa.Column(sa.Boolean, nullable=False, default=False)
-    food_form = sa.Column(sa.String)
-    lifestage = sa.Column(sa.String, nullable=False)
-    fda_guidelines = sa.Column(sa.Boolean)
-
-
-class Diet(Base):
-    """
-    SQLAlchemy model for a special diet
-    """
-    __tablename__ = 'food_search_diet'
-    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
-    diet = sa.Column(sa.String, nullable=False)
-    item_num_id = sa.Column(sa.Integer, sa.ForeignKey(Food.item_num))
-
-
-class Update(Base):
-    """
-    SQLAlchemy model for scraper update date/time
-    """
-    __tablename__ = 'food_search_scraperupdates'
-    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
-    date = sa.Column(sa.DateTime, nullable=False)
-    count = sa.Column(sa.Integer, nullable=False)
+SLEEP_TIME: int = 5  # default minimum number of seconds between requests through the same proxy
+STREAM_CHUNK_SIZE: int = 16 * 1024  # number of bytes read from the connection at a time by streaming fetches
+# classes of scraping jobs, highest priority first - follow-up jobs finish pages already fetched, and foods not yet in
+# the database go ahead of foods that are
+JOB_PRIORITIES = ["follow_up", "search", "new_food", "known_food"]
 
 
 class Scraper:
@@ -65,15 +44,82 @@ class Scraper:
     """
 
     def __init__(self, database: str, num_threads: int = 5, logger: ScraperLogger = SilentScraperLogger(),
-                 force: bool = False):
+                 force: bool = False, rate_limiter: RateLimiter = None, extractor: FoodExtractor = None,
+                 parse_processes: int = 0, db_batch_size: int = 100, db_flush_interval: float = 5.0,
+                 response_cache: ResponseCache = None, refresh: bool = False, journal: CrawlJournal = None,
+                 retry_policy: RetryPolicy = None, dead_letters: DeadLetters = None, search_pages_in_flight: int = 2,
+                 job_backlog: int = 100, metrics: ScrapeMetrics = None, archive: ResponseArchive = None,
+                 index_ingredients: bool = True, stream: bool = False, work_queue: WorkQueue = None,
+                 concurrency: ConcurrencyController = None, session_builder: SessionBuilder = None):
         # logger
         self.logger = logger
 
+        # work queue shared with the scraper processes on other machines, if the crawl is distributed - it keeps every
+        # job of the crawl itself, so it can't be combined with a journal
+        if work_queue is not None and journal is not None:
+            raise Exception("A scraper with a shared work queue can't also keep a journal")
+        self.work_queue: WorkQueue = work_queue
+
+        # latency histograms, counters and sampled gauges of the scrape - always collected, only written out if the
+        # metrics were given paths or a port
+        if metrics is None:
+            metrics = ScrapeMetrics()
+        self.metrics: ScrapeMetrics = metrics
+
+        # extractor for pulling data out of pages
+        if extractor is None:
+            extractor = LxmlExtractor()
+        self.extractor: FoodExtractor = extractor
+
+        # number of processes to parse pages in - if 0, pages are parsed by the worker that fetched them
+        self.parse_processes: int = parse_processes
+        self.parse_pool = None
+
+        # controller adapting the number of requests in flight to the site's responses, if it should adapt - there is a
+        # worker for each request it may allow, up to its ceiling
+        self.concurrency: ConcurrencyController = concurrency
+        if concurrency is not None:
+            num_threads = concurrency.ceiling
+
+        # rate limiter handing out request permits per proxy and per host
+        if rate_limiter is None:
+            rate_limiter = self.default_rate_limiter(num_threads)
+        self.rate_limiter: RateLimiter = rate_limiter
+
+        # policy for retrying failed requests, and record of requests that ran out of retries, if they should be kept
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy: RetryPolicy = retry_policy
+        self.dead_letters: DeadLetters = dead_letters
+
+        # on-disk cache of responses, if responses should be cached
+        self.response_cache: ResponseCache = response_cache
+
+        # append-only archive of every raw response, if responses should be archived for replay() to re-extract
+        self.archive: ResponseArchive = archive
+
+        # streaming fetches - pages are decoded and parsed a chunk at a time as they download, and the connection is
+        # closed as soon as the extractor has found everything it needs from the page
+        self.stream: bool = stream
+
         # force run
         self.force: bool = force
 
-        # queue of scraping jobs
-        self.scrape_queue = queue.Queue()
+        # refresh run - re-check foods already in the database, and update those whose details have changed
+        self.refresh: bool = refresh
+        self.fingerprints = dict()  # canonical url -> fingerprint of food details in the database
+        self.stored_item_nums = dict()  # canonical url -> item number the food is stored under in the database
+
+        # scheduler of scraping jobs, and record of pages enqueued so each page is only scraped once - pages of search
+        # results are enqueued as the backlog of waiting jobs drops below job_backlog, a few at a time
+        self.search_pages_in_flight: int = search_pages_in_flight
+        self.job_backlog: int = job_backlog
+        self.scrape_queue = self._new_scheduler(JobScheduler)
+        self.frontier = CrawlFrontier()
+
+        # durable journal of the jobs of a scrape, if scrapes should be resumable
+        self.journal: CrawlJournal = journal
+        self.job_state = local()  # per-worker state of the job being executed
 
         # thread pool
         self.threads = []
@@ -81,33 +127,46 @@ class Scraper:
             self.threads.append(Thread(target=self.worker))
 
         # session helper object for making new sessions using a cycle of useragents and proxies
-        self.session_builder = SessionBuilder()
+        if session_builder is None:
+            session_builder = SessionBuilder(logger=logger)
+        self.session_builder: SessionBuilder = session_builder
 
         # open connection to the database and set up Session factory
-        db_cnf_values = defaultdict()
-        with open(database) as db_cnf:
-            for line in db_cnf.readlines():
-                key, value = line.split(' = ')
-                db_cnf_values[key] = value.strip()
-        db_url = 'mysql://{}:{}@{}:{}/{}'.format(db_cnf_values['user'],
-                                                 db_cnf_values['password'],
-                                                 db_cnf_values['host'],
-                                                 db_cnf_values['port'],
-                                                 db_cnf_values['database'])
-        self.engine = sa.create_engine(db_url)
+        self.engine = database_engine(database)
         self.session_factory = sessionmaker(bind=self.engine)
         self.Session = scoped_session(self.session_factory)
 
-        # compile regex patterns for identifying bad foods
-        self.vitamins_pattern = re.compile(
-            "(mineral|vitamin|zinc|supplement|calcium|phosphorus|potassium|sodium|" +
-            "magnesium|sulfer|sulfur|iron|iodine|selenium|copper|salt|chloride|" +
-            "choline|lysine|taurine)", flags=re.I
-        )
-        self.bad_ingredients_pattern = re.compile(
-            "(chickpeas|chickpea|peanuts|peanut|pea |peas|pea$| pea |beans|bean|" +
-            "lentils|lentil|potatoes|potato|flaxseeds|flaxseed|flax seed|flax seeds|seeds|seed|soy)",
-            flags=re.I)
+        # index of foods already in the database, loaded when scraping starts
+        self.known_foods = KnownFoodIndex(logger=logger)
+
+        # classifier checking ingredients against the fda guidelines
+        self.ingredient_classifier = IngredientClassifier()
+
+        # index of ingredients, diets and summaries of foods for the search app, if it should be maintained
+        self.ingredient_index = None
+        if index_ingredients:
+            self.ingredient_index = IngredientIndex(self.ingredient_classifier, logger=logger)
+
+        # writer entering scraped foods into the database in batches, while scraping
+        self.db_writer = BatchWriter(self.session_factory, logger=logger, batch_size=db_batch_size,
+                                     flush_interval=db_flush_interval, on_insert=self._foods_inserted,
+                                     metrics=self.metrics)
+
+        # gauges sampled while scraping
+        self.metrics.set_workers(num_threads)
+        self.metrics.add_gauge("queue_depth", lambda: self.scrape_queue.qsize())
+        self.metrics.add_gauge("db_writer_backlog", lambda: self.db_writer.pending.qsize())
+        if concurrency is not None:
+            self.metrics.add_gauge("concurrency_limit", lambda: self.concurrency.limit)
+
+    @staticmethod
+    def default_rate_limiter(workers: int) -> RateLimiter:
+        """
+        :param workers: number of workers sending requests
+        :return: rate limiter allowing a request every SLEEP_TIME seconds through each proxy - requests sent without a
+        proxy share one address, so each worker may send one every SLEEP_TIME seconds through it
+        """
+        return RateLimiter(proxy_rate=1 / SLEEP_TIME, direct_rate=max(workers, 1) / SLEEP_TIME)
 
     def worker(self):
         """
@@ -118,35 +177,61 @@ class Scraper:
             if job is None:
                 break
             url, scrape_func = job[0], job[1]
-            job_did_make_request: bool = scrape_func(url)
-            self.scrape_queue.task_done()
-            if job_did_make_request is True:
-                sleep(SLEEP_TIME)  # sleep before making the next request, if last job performed a request
+            self._job_started(url)
+            self.metrics.worker_busy()
+            try:
+                scrape_func(url)
+            except Exception as e:
+                self.logger.error("Error while processing job for URL: {}".format(url))
+                self.logger.error("ERROR: " + str(e.args))
+            finally:
+                self.metrics.worker_idle()
+                self._job_finished(url)
+                self.scrape_queue.task_done(job)
 
-    def scrape(self, url: str) -> None:
+    def scrape(self, url: str, resume: bool = False) -> None:
         """
         Enqueue jobs to scrape all search pages for dog foods, which subsequently enqueue jobs to scrape food pages
         :param url: starting URL for search pages
+        :param resume: pick up the jobs the last scrape left unfinished in the journal, instead of starting over
         """
-        # enter time of scrape in database
-        total_food_count = self._get_total_food_count(url + '1')
-        self._enter_update_time_and_count(self._get_total_food_count(url + '1'))
-
-        # quit scraper if no new foods on Chewy.com, otherwise continue
-        if self._new_total_count_greaterthan_last(total_food_count):
-            self.logger.message('New Foods Found... Beginning Scraping...')
-        elif self.force is True:
-            self.logger.message('Forcing Scrape... Beginning Scraping...')
-        else:
-            self.logger.message('No New Foods To Scrape... Exiting...')
+        jobs = self._start_jobs(url, resume)
+        if jobs is None:
             return
+        self._enqueue_lazily(jobs)
+        self._run_workers(rebuild_index=True)
+
+    def work(self, wait: float = 600.0, poll_interval: float = 5.0) -> None:
+        """
+        scrape jobs from the shared work queue of a distributed crawl, alongside the process that started the crawl
+        with scrape() and any other workers, until every job of the crawl is done
+        :param wait: maximum number of seconds to wait for a crawl to be started
+        :param poll_interval: number of seconds between checking for a crawl to be started
+        """
+        if self.work_queue is None:
+            raise Exception("A scraper needs a shared work queue to work on a distributed crawl")
+        started = monotonic()
+        while self.work_queue.drained():
+            if monotonic() - started >= wait:
+                self.logger.message('No Crawl To Work On... Exiting...')
+                return
+            sleep(poll_interval)
+        self.logger.message('Working On Shared Crawl...')
 
-        # enqueue jobs to scrape all pages of search results
-        for i in range(1, self._pages_of_results(url) + 1):
-            search_url = url + str(i)
-            self._enqueue_url(search_url, self.scrape_search_results)
+        self._prepare_scrape()
+        # the process that started the crawl rebuilds the ingredient index once it is done
+        self._run_workers(rebuild_index=False)
 
-        # start worker threads
+    def _run_workers(self, rebuild_index: bool) -> None:
+        """
+        run the worker threads until every job is done, along with everything they need while scraping
+        :param rebuild_index: rebuild the ingredient index once every job is done
+        """
+        # start journal, metrics, database writer, parsing processes and worker threads
+        self._start_journal()
+        self.metrics.start()
+        self.db_writer.start()
+        self._start_parse_pool()
         for thread in self.threads:
             thread.start()
 
@@ -158,6 +243,306 @@ class Scraper:
             self.scrape_queue.put(None)
         for thread in self.threads:
             thread.join()
+        self._stop_parse_pool()
+        self.db_writer.stop()
+        self._stop_journal()
+        if rebuild_index:
+            self._rebuild_ingredient_index()
+        self.metrics.stop()
+
+        self.session_builder.close_sessions()
+        self._log_scrape_stats()
+
+    def replay(self, archive: ResponseArchive) -> None:
+        """
+        re-extract foods from the latest archived response of every food page, without making any requests - new
+        foods are entered in the database, and foods already in it are updated if their details have changed
+        :param archive: archive of responses captured by earlier scrapes
+        """
+        self._prepare_scrape()
+        self._load_fingerprints()
+
+        # start metrics, database writer and parsing processes
+        self.metrics.start()
+        self.db_writer.start()
+        self._start_parse_pool()
+
+        replayed = 0
+        pages = (r for r in archive.latest_responses(self._is_food_url) if r.status_code == 200)
+        for url, parsed in self._parse_archived(pages):
+            replayed += 1
+            try:
+                food, diets = self._food_from_details(url, parsed.result())
+                if self._is_known_food(url):
+                    self._update_if_changed(url, food, diets)
+                else:
+                    self._save_food(food, diets)
+            except Exception as e:
+                self.logger.error("Error while replaying food at URL: {}".format(url))
+                self.logger.error("ERROR: " + str(e.args))
+                self.logger.error("Skipping food...\n")
+
+        self._stop_parse_pool()
+        self.db_writer.stop()
+        self._rebuild_ingredient_index()
+        self.metrics.stop()
+
+        self.logger.message("Replayed {} archived food pages".format(replayed))
+        if archive.truncated:
+            self.logger.error("Skipped {} truncated archive records".format(archive.truncated))
+        self._log_scrape_stats()
+
+    def _parse_archived(self, pages):
+        """
+        parse archived food pages - in the parsing processes if there are any, keeping a few pages ahead of the
+        database stage but never the whole archive, otherwise one at a time in this thread
+        :param pages: iterable of response objects of food pages
+        :return: generator of (url, future for the dictionary of food details) tuples, in the order of pages
+        """
+        if self.parse_pool is None:
+            for r in pages:
+                parsed = Future()
+                try:
+                    with self.metrics.time("parse"):
+                        parsed.set_result(self.extractor.food_details(r.content))
+                except Exception as e:
+                    parsed.set_exception(e)
+                yield r.url, parsed
+            return
+
+        pending = deque()
+        for r in pages:
+            pending.append((r.url, self._time_parse(self.parse_pool.submit(self.extractor.food_details, r.content))))
+            if len(pending) > self.parse_processes * 4:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    def _start_jobs(self, url: str, resume: bool = False):
+        """
+        decide whether scraping should go ahead, and list the jobs to start it with - the jobs left unfinished by the
+        last scrape if resuming one, otherwise a job for every food on the first page of search results and for every
+        later page - plus jobs that ran out of retries in earlier scrapes
+        :param url: starting URL for search pages
+        :param resume: resume the last scrape from the journal, if it left jobs unfinished
+        :return: list of (url, scraping method) jobs to enqueue, or None if there is nothing to scrape
+        """
+        if resume and self.journal is not None:
+            jobs = self._resume_jobs()
+            if jobs:
+                return jobs + self._dead_letter_jobs()
+            self.logger.message('No Unfinished Scrape To Resume...')
+        if resume and self.work_queue is not None:
+            if not self.work_queue.drained():
+                self.logger.message('Resuming Shared Crawl... {} Jobs Waiting...'.format(self.work_queue.waiting()))
+                self._prepare_scrape()
+                return self._dead_letter_jobs()
+            self.logger.message('No Unfinished Scrape To Resume...')
+
+        # fetch the first page of search results once, for both the food count and the foods on it
+        first_url = url + '1'
+        self.logger.scrape_search_results(first_url)
+        first_page = self._make_request(first_url, page="search")
+        if first_page.status_code != 200:
+            self.logger.error('Error requesting first page of search results at URL: {}'.format(first_url))
+            return None
+        page_size, total_food_count = self._extract("results_count", first_page)
+
+        if not self._begin_scrape(total_food_count):
+            return None
+        if self.journal is not None:
+            self.journal.clear()
+        if self.work_queue is not None:
+            self.work_queue.clear()
+        self.frontier.add(first_url)
+        jobs = [(link, self.scrape_food_if_new) for link in self._parse_search_results(first_url, first_page)]
+        jobs += [(url + str(i), self.scrape_search_results) for i in range(2, ceil(total_food_count / page_size) + 1)]
+        return jobs + self._dead_letter_jobs()
+
+    def _dead_letter_jobs(self) -> list:
+        """
+        take the jobs that ran out of retries in earlier scrapes out of the dead letters, to be re-processed
+        :return: list of (url, scraping method) jobs
+        """
+        if self.dead_letters is None:
+            return []
+        urls = self.dead_letters.drain()
+        if urls:
+            self.logger.message('Re-processing {} Dead Letters...'.format(len(urls)))
+        return [(url, self.scrape_food_if_new if self._is_food_url(url) else self.scrape_search_results)
+                for url in urls]
+
+    @staticmethod
+    def _is_food_url(url: str) -> bool:
+        """
+        :return: True if url links to a food page, False if it links to a page of search results
+        """
+        return "/dp/" in urlsplit(url).path
+
+    def _resume_jobs(self) -> list:
+        """
+        prepare to resume the last scrape from the journal - pages it completed are not scraped again, except foods it
+        completed that never reached the database, i.e. because they were still waiting in the batch writer
+        :return: list of (url, scraping method) jobs left unfinished by the last scrape
+        """
+        unfinished = self.journal.unfinished_jobs()
+        if not unfinished:
+            return []
+        self.logger.message('Resuming Scrape... {} Jobs Left Unfinished...'.format(len(unfinished)))
+
+        self._prepare_scrape()
+        funcs = self._kind_funcs()
+        jobs = [(job_url, funcs[kind]) for job_url, kind in unfinished]
+        for job_url, kind in self.journal.done_jobs():
+            if kind == "food" and not self._is_known_food(job_url):
+                jobs.append((job_url, funcs[kind]))
+            else:
+                self.frontier.add(job_url)
+        return jobs
+
+    def _kind_funcs(self) -> dict:
+        """
+        :return: scraping method of the jobs of each kind recorded in the journal or the work queue, keyed by kind
+        """
+        return {"search": self.scrape_search_results, "food": self.scrape_food_if_new}
+
+    def _journal_kind(self, func):
+        """
+        :param func: scraping method of a job
+        :return: kind of page the job is recorded as in the journal, or None if the job isn't journaled
+        """
+        if func == self.scrape_search_results:
+            return "search"
+        if func == self.scrape_food_if_new:
+            return "food"
+        return None
+
+    def _start_journal(self) -> None:
+        if self.journal is not None:
+            self.journal.start()
+
+    def _stop_journal(self) -> None:
+        if self.journal is not None:
+            self.journal.stop()
+
+    def _job_started(self, url: str) -> None:
+        """
+        record a job taken by a worker in the journal
+        """
+        self.job_state.deferred = False
+        if self.journal is not None:
+            self.journal.started(url)
+
+    def _job_finished(self, url: str) -> None:
+        """
+        record a job completed in the journal, or the shared work queue - unless it handed its page on to a follow-up
+        job, which completes it
+        """
+        if getattr(self.job_state, "deferred", False):
+            return
+        if self.journal is not None:
+            self.journal.finished(url)
+        if self.work_queue is not None and not self.work_queue.ack(url):
+            self.metrics.count("lost_leases")  # the lease expired first, so the job may be done twice
+
+    def _start_parse_pool(self) -> None:
+        """
+        start the pool of processes pages are handed to for parsing, if parsing is separated from fetching
+        """
+        if self.parse_processes > 0:
+            self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_processes)
+
+    def _stop_parse_pool(self) -> None:
+        """
+        shut down the pool of parsing processes, if there is one
+        """
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+            self.parse_pool = None
+
+    def _begin_scrape(self, total_food_count: int) -> bool:
+        """
+        enter the time and food count of this scrape in the database, and decide whether scraping should go ahead
+        :param total_food_count: total number of foods on Chewy.com, from the first page of search results
+        :return: True if there are new foods on Chewy.com or the scrape is forced, otherwise False
+        """
+        # enter time of scrape in database
+        self._enter_update_time_and_count(total_food_count)
+
+        # quit scraper if no new foods on Chewy.com, otherwise continue
+        if self._new_total_count_greaterthan_last(total_food_count):
+            self.logger.message('New Foods Found... Beginning Scraping...')
+        elif self.force is True:
+            self.logger.message('Forcing Scrape... Beginning Scraping...')
+        elif self.refresh is True:
+            self.logger.message('Refreshing Foods... Beginning Scraping...')
+        else:
+            self.logger.message('No New Foods To Scrape... Exiting...')
+            return False
+
+        self._prepare_scrape()
+        return True
+
+    def _prepare_scrape(self) -> None:
+        """
+        reset the frontier and load the foods (and fingerprints, if refreshing) already in the database
+        """
+        FoodFingerprint.__table__.create(self.engine, checkfirst=True)
+        self._create_ingredient_index()
+        self.frontier.clear()
+        self.known_foods.load(self.session_factory)
+        if self.refresh:
+            self._load_fingerprints()
+
+    def _create_ingredient_index(self) -> None:
+        """
+        create the tables of the ingredient index if they don't exist yet - if they can't be created, the index isn't
+        maintained for the rest of the scrape
+        """
+        if self.ingredient_index is None:
+            return
+        try:
+            self.ingredient_index.create_tables(self.engine)
+        except Exception as e:
+            self.logger.error("Error creating ingredient index, continuing without it: {}".format(e))
+            self.ingredient_index = None
+
+    def _rebuild_ingredient_index(self) -> None:
+        """
+        rebuild the ingredient index from every food in the database, once foods are no longer being entered
+        """
+        if self.ingredient_index is not None:
+            with self.metrics.time("index_rebuild"):
+                self.ingredient_index.rebuild(self.session_factory)
+
+    def _foods_inserted(self, food_rows: list, diets: list) -> None:
+        """
+        record foods entered into the database in the index of known foods, and index their ingredients
+        :param food_rows: list of dictionaries of food column values
+        :param diets: list of the lists of special diets of each food, in the same order as food_rows
+        """
+        self.known_foods.add_rows(food_rows)
+        if self.ingredient_index is not None:
+            with self.metrics.time("index"):
+                self.ingredient_index.index_foods(self.session_factory, food_rows, diets)
+
+    def _load_fingerprints(self) -> None:
+        """
+        load the fingerprint and item number of every food in the database, for a refresh run to compare against
+        """
+        db_session = self.Session()
+        try:
+            query = db_session.query(Food.url, Food.item_num, FoodFingerprint.fingerprint).outerjoin(
+                FoodFingerprint, FoodFingerprint.item_num == Food.item_num)
+            self.fingerprints, self.stored_item_nums = dict(), dict()
+            for url, item_num, fingerprint in query.yield_per(1000):
+                self.fingerprints[canonical_url(url)] = fingerprint
+                self.stored_item_nums[canonical_url(url)] = item_num
+        except Exception as e:
+            db_session.rollback()
+            self.logger.error("Error loading food fingerprints: {}".format(e))
+        finally:
+            db_session.close()
 
     def scrape_food_if_new(self, url: str) -> bool:
         """
@@ -166,19 +551,73 @@ class Scraper:
         :return: bool representing whether the job made a request to the website or not
         """
 
-        if not self._check_db_for_food(url):
+        if not self._is_known_food(url):
             try:
-                self._enter_in_db(*self._scrape_food_details(url))
+                r = self._fetch_food_page(url)
+                if self.parse_pool is not None and not self._streamed(r):
+                    # hand the page to the parsing processes, and enter it in the database once parsed
+                    parsed = self._time_parse(self.parse_pool.submit(self.extractor.food_details, r.content))
+                    self._enqueue_follow_up(url, partial(self._enter_parsed_food, parsed), parsed)
+                else:
+                    self._save_food(*self._parse_food_details(url, r))
             except Exception as e:
                 self.logger.error("Error while processing food at URL: {}".format(url))
                 self.logger.error("ERROR: " + str(e.args))
                 self.logger.error("Skipping food...\n")
             finally:
                 return True
+        elif self.refresh:
+            return self.refresh_food(url)
         else:
             self.logger.message("{} is already in the database... skipping...".format(url))
+            self.metrics.count("skips", label="known_food")
             return False
 
+    def refresh_food(self, url: str) -> bool:
+        """
+        re-check a food already in the database, and update it if its details have changed
+        :param url: link to page containing food details
+        :return: bool representing whether the job made a request to the website or not
+        """
+        try:
+            self._refresh_from_response(url, self._fetch_food_page(url))
+        except Exception as e:
+            self.logger.error("Error while refreshing food at URL: {}".format(url))
+            self.logger.error("ERROR: " + str(e.args))
+            self.logger.error("Skipping food...\n")
+        return True
+
+    def _refresh_from_response(self, url: str, r: requests.models.Response) -> None:
+        """
+        compare a freshly fetched food page against the fingerprint of the food in the database, and update the food
+        if it has changed - pages the site answered 304 Not Modified for are not parsed at all
+        :param url: link to page containing food details
+        :param r: response object for the page
+        """
+        stored = self.fingerprints.get(canonical_url(url))
+        if getattr(r, "revalidated", False) and stored is not None:
+            self.logger.message("{} is unchanged (cached)... skipping...".format(url))
+            self.metrics.count("skips", label="unchanged")
+            return
+
+        self._update_if_changed(url, *self._parse_food_details(url, r))
+
+    def _update_if_changed(self, url: str, food: Food, diets: list) -> None:
+        """
+        compare freshly parsed food details against the fingerprint of the food in the database, and update the food
+        if it has changed
+        :param url: link to page containing food details
+        :param food: Food object of food details
+        :param diets: list of special diets
+        """
+        fingerprint = food_fingerprint(BatchWriter.food_row(food), diets)
+        if fingerprint == self.fingerprints.get(canonical_url(url)):
+            self.logger.message("{} is unchanged... skipping...".format(url))
+            self.metrics.count("skips", label="unchanged")
+            return
+        if self._update_in_db(url, food, diets, fingerprint):
+            self.fingerprints[canonical_url(url)] = fingerprint
+
     def scrape_search_results(self, url: str) -> bool:
         """
         scrape a page of search results and enqueue all foods to be scraped
@@ -188,141 +627,395 @@ class Scraper:
 
         self.logger.scrape_search_results(url)
 
-        r = self._make_request(url)
-        if r is None:
-            return False
+        r = self._make_request(url, page="search")
+        if r.status_code != 200:
+            return True
 
-        soup = BeautifulSoup(r.content, "html.parser")
-        for link in soup.find_all("a", "product"):
-            product_link = "https://www.chewy.com" + link.get("href")
-            self._enqueue_url(product_link, self.scrape_food_if_new)
+        if self.parse_pool is not None and not self._streamed(r):
+            # hand the page to the parsing processes, and enqueue its foods once parsed
+            parsed = self._time_parse(self.parse_pool.submit(self.extractor.search_results, r.content))
+            self._enqueue_follow_up(url, partial(self._enqueue_parsed_search_results, parsed), parsed)
+        else:
+            for product_link in self._parse_search_results(url, r):
+                self._enqueue_url(product_link, self.scrape_food_if_new)
         return True
 
+    def _enqueue_parsed_search_results(self, parsed: Future, url: str) -> bool:
+        """
+        enqueue all foods found on a page of search results handed to the parsing processes
+        :param parsed: future for the list of (relative) links to food pages on the page
+        :param url: link to the page of search results
+        :return: bool representing whether the job made a request to the website or not
+        """
+        try:
+            links = parsed.result()
+        except Exception as e:
+            self.logger.error("Error while parsing search results at URL: {}".format(url))
+            self.logger.error("ERROR: " + str(e.args))
+            return False
+
+        for link in links:
+            self._enqueue_url(urljoin(url, link), self.scrape_food_if_new)
+        return False
+
+    def _parse_search_results(self, url: str, r: requests.models.Response) -> list:
+        """
+        parse a page of search results for links to food pages
+        :param url: link to the page of search results, which links are relative to
+        :param r: response object for one page of search results
+        :return: list of links to food pages
+        """
+        return [urljoin(url, link) for link in self._extract("search_results", r)]
+
+    def _time_parse(self, parsed: Future) -> Future:
+        """
+        record the latency of a page handed to the parsing processes, from being handed over to being parsed - this
+        includes any time spent waiting for a free process
+        :param parsed: future for the parsed page
+        :return: the same future
+        """
+        start = monotonic()
+        parsed.add_done_callback(lambda future: self.metrics.observe("parse", monotonic() - start))
+        return parsed
+
     def _scrape_food_details(self, url: str):
         """
         scrape page for dog food details
         :param url: link to page containing food details
         :return: Food object of food details, list of special diets
         """
+        return self._parse_food_details(url, self._fetch_food_page(url))
+
+    def _fetch_food_page(self, url: str) -> requests.models.Response:
+        """
+        fetch a page containing food details
+        :param url: link to page containing food details
+        :return: the response object for the page
+        """
         self.logger.scrape_food(url)
-        food = Food()
-        diets = []
 
-        # make request and soup
-        r = self._make_request(url)
+        # make request
+        r = self._make_request(url, page="food")
         if r.status_code != 200:
             raise Exception("Error requesting food at URL: {}".format(url))
-        soup = BeautifulSoup(r.content, "html.parser")
-
-        # add url of food being scraped
-        food.url = url
-
-        # scrape item number
-        self.logger.message("Scraping Item Number from {}".format(url))
-        item_num = soup.find("div", string=re.compile("Item Number"))
-        item_num = item_num.next_sibling
-        item_num = item_num.next_sibling
-        item_num = item_num.stripped_strings
-        food.item_num = int(next(item_num))
-
-        # scrape food name
-        name = soup.find("div", id='product-title')
-        name = name.stripped_strings
-        food.name = next(name)
-
-        # scrape ingredients
-        self.logger.message("Scraping Ingredients from {}".format(url))
+        return r
+
+    def _parse_food_details(self, url: str, r: requests.models.Response):
+        """
+        parse a food page for dog food details
+        :param url: link to page containing food details
+        :param r: response object for the page containing food details
+        :return: Food object of food details, list of special diets
+        """
+        return self._food_from_details(url, self._extract("food_details", r))
+
+    def _extract(self, method: str, r: requests.models.Response):
+        """
+        pull data out of a page with one of the extractor's methods - pages parsed while they were streamed are not
+        parsed again
+        :param method: name of the extractor method, i.e. "food_details"
+        :param r: response object for the page
+        :return: what the extractor method returns for the page
+        """
+        parser = getattr(r, "page_parser", None)
+        if parser is not None and method in parser.methods:
+            return parser.result(method)
+        with self.metrics.time("parse"):
+            return getattr(self.extractor, method)(r.content)
+
+    @staticmethod
+    def _streamed(r: requests.models.Response) -> bool:
+        """
+        :return: True if the page was parsed while it was streamed, otherwise False
+        """
+        return getattr(r, "page_parser", None) is not None
+
+    def _enter_parsed_food(self, parsed: Future, url: str) -> bool:
+        """
+        enter a food handed to the parsing processes into the database
+        :param parsed: future for the dictionary of food details
+        :param url: link to page containing food details
+        :return: bool representing whether the job made a request to the website or not
+        """
         try:
-            ingredients = soup.find("span", string=re.compile("Nutritional Info")).next_sibling.next_sibling
-            food.ingredients = next(ingredients.p.stripped_strings)
+            self._save_food(*self._food_from_details(url, parsed.result()))
         except Exception as e:
-            ingredients = soup.find("span", string=re.compile("Ingredients")).next_sibling.next_sibling
-            food.ingredients = next(ingredients.p.stripped_strings)
-
-        if food.ingredients is not None:
-            food.ingredients = food.ingredients.replace('"', '')
-
-        # scrape brand
-        self.logger.message("Scraping Brand from {}".format(url))
-        food.brand = str(soup.find("span", attrs={"itemprop": "brand"}).string)
-
-        # scrape breed sizes
-        self.logger.message("Scraping Breed Sizes from {}".format(url))
-        breed_sizes = soup.find("div", string=re.compile("Breed Size"))
-        if breed_sizes:
-            breed_sizes = breed_sizes.next_sibling.next_sibling.stripped_strings
-            breed_sizes = next(breed_sizes).split(', ')
-            if "Extra Small & Toy Breeds" in breed_sizes:
-                food.xsm_breed = True
-            if "Small Breeds" in breed_sizes:
-                food.sm_breed = True
-            if "Medium Breeds" in breed_sizes:
-                food.md_breed = True
-            if "Large Breeds" in breed_sizes:
-                food.lg_breed = True
-            if "Giant Breeds" in breed_sizes:
-                food.xlg_breed = True
-
-        # scrape food form
-        self.logger.message("Scraping Food Form from {}".format(url))
-        food_form = soup.find("div", string=re.compile("Food Form"))
-        if food_form:
-            food_form = food_form.next_sibling.next_sibling.stripped_strings
-            food.food_form = next(food_form)
-
-        # scrape lifestage
-        self.logger.message("Scraping Lifestage from {}".format(url))
-        lifestage = soup.find("div", string=re.compile("Lifestage"))
-        if lifestage:
-            lifestage = lifestage.next_sibling.next_sibling.stripped_strings
-            food.lifestage = next(lifestage)
-
-        # scrape special diets
-        self.logger.message("Scraping Special Diets from {}".format(url))
-        special_diet = soup.find("div", string=re.compile("Special Diet"))
-        if special_diet:
-            special_diet = special_diet.next_sibling.next_sibling.stripped_strings
-            diets = next(special_diet).split(', ')
+            self.logger.error("Error while processing food at URL: {}".format(url))
+            self.logger.error("ERROR: " + str(e.args))
+            self.logger.error("Skipping food...\n")
+        return False
+
+    def _food_from_details(self, url: str, details: dict):
+        """
+        build a Food from the food details pulled out of its page by the extractor
+        :param url: link to page containing food details
+        :param details: dictionary of food details, with special diets as a list under "diets"
+        :return: Food object of food details, list of special diets
+        """
+        details = dict(details)
+        diets = details.pop("diets")
+        food = Food(url=url, **details)
 
         # check ingredients for fda guidelines
         food = self._check_ingredients(food)
 
         return food, diets
 
-    def _make_request(self, url) -> requests.models.Response:
+    def _make_request(self, url, page: str = None) -> requests.models.Response:
         """
-        make a request for a web page using a new session header and proxy ip address
+        make a request for a web page using a pooled session with a proxy chosen by the proxy manager, retrying failed
+        attempts as the retry policy allows - requests that run out of retries are added to the dead letters
         :param url: link to web page
+        :param page: kind of page requested, "search" or "food", for streaming fetches to parse the page as it arrives
         :return: the response object from requests.get(), will be an empty response object if request fails
         """
-        session = self.session_builder.create_session()
-        r = requests.models.Response()
-        self.logger.make_request(url, session.headers["User-Agent"], session.proxies)
+        # serve from the response cache if fresh, otherwise make the request conditional on the cached copy changing
+        cached = None
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(url)
+            if cached is not None and self._is_fresh(url, cached):
+                self.metrics.count("cache_hits")
+                return self._archived(url, self.response_cache.hit(url, cached))
 
+        self.retry_policy.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            r, error = self._attempt_request(url, cached, page)
+            if error is None:
+                return self._archived(url, r)
+            if not self._retry_after_error(url, error, attempt, r):
+                return self._archived(url, r)
+            sleep(self.retry_policy.delay(error, attempt, r.headers.get("Retry-After")))
+
+    def _is_fresh(self, url: str, cached: dict) -> bool:
+        """
+        decide whether a cached response can be served without asking the site - never on a refresh run, which always
+        sends the conditional request so changed pages aren't missed while their cached copies are fresh
+        :param url: url of the cached response
+        :param cached: cached response
+        :return: True if the cached response can be served as it is, otherwise False
+        """
+        return not self.refresh and self.response_cache.is_fresh(url, cached)
+
+    def _archived(self, url: str, r: requests.models.Response) -> requests.models.Response:
+        """
+        append a response to the archive, if responses are being archived - empty responses of requests that failed
+        without a response are left out
+        :param url: url the response was requested from
+        :param r: response object
+        :return: the same response object
+        """
+        if self.archive is not None and r.status_code is not None:
+            try:
+                self.archive.record(url, r)
+            except Exception as e:
+                self.logger.error("Error archiving response from URL: {}: {}".format(url, e))
+        return r
+
+    def _attempt_request(self, url: str, cached: dict = None, page: str = None):
+        """
+        make one attempt at a request for a web page
+        :param url: link to web page
+        :param cached: cached response to make the request conditional on, if any
+        :param page: kind of page requested, "search" or "food", for streaming fetches to parse the page as it arrives
+        :return: the response object (an empty response object if the attempt failed without a response), and the class
+        of error the attempt failed with, or None if it succeeded
+        """
+        session = self.session_builder.checkout_session()
+        proxy_manager = self.session_builder.proxy_manager
+        proxy = self._proxy_key(session.proxies)
+        r = requests.models.Response()
+        error = None
+        parser = self._page_parser(page)
+        acquired = False
+        start = monotonic()
         try:
-            r = session.get(url, timeout=10)
+            if self.concurrency is not None:
+                self.concurrency.acquire()
+                acquired = True
+            with self.metrics.time("permit_wait"):
+                self.rate_limiter.acquire(proxy, urlsplit(url).netloc)
+            self.logger.make_request(url, session.headers["User-Agent"], session.proxies)
+
+            start = monotonic()
+            headers = self.response_cache.conditional_headers(cached) if cached is not None else None
+            r = session.get(url, timeout=10, headers=headers, stream=parser is not None)
+            if parser is not None:
+                self._read_streamed(r, parser)
+            proxy_manager.record(proxy, monotonic() - start, r.status_code)
+            self._record_response(monotonic() - start, r)
+            if r.status_code == 304 and cached is not None:
+                r = self.response_cache.revalidated(url, cached)
             r.raise_for_status()
+            if self.response_cache is not None and not getattr(r, "from_cache", False):
+                self.response_cache.store(url, r)  # a 304 is served from the cached copy, which is stored already
         except requests.exceptions.ProxyError as e:
+            proxy_manager.record(proxy)
             self.logger.error("Proxy Error while requesting URL: {} with PROXY {}".format(url, session.proxies))
             self.logger.error("PROXY ERROR: " + str(e.args))
-            self.logger.error("Retrying with new proxy...\n")
-            session.close()
-            return self._make_request(url)
+            error = "proxy"
         except requests.exceptions.Timeout as e:
+            proxy_manager.record(proxy)
             self.logger.error("Time out while requesting URL: {}".format(url))
             self.logger.error("REQUESTS ERROR: " + str(e.args))
-            self.logger.error("Skipping URL...\n")
+            error = "timeout"
+        except requests.exceptions.ConnectionError as e:
+            proxy_manager.record(proxy)
+            self.logger.error("Connection Error while requesting URL: {}".format(url))
+            self.logger.error("REQUESTS ERROR: " + str(e.args))
+            error = "connection"
         except requests.exceptions.HTTPError as e:
             self.logger.error("HTTP Error while requesting URL: {}".format(url))
             self.logger.error("REQUESTS ERROR: " + str(e.args))
-            self.logger.error("Skipping URL...\n")
+            error = self.retry_policy.classify_status(r.status_code)
         except Exception as e:
             self.logger.error("Unknown Error while requesting URL: {}".format(url))
             self.logger.error("ERROR: " + str(e.args))
-            self.logger.error("Skipping URL...\n")
+            error = "unknown"
         finally:
-            session.close()
-        return r
+            self.session_builder.checkin_session(session, discard=error in ("proxy", "connection"))
+            if acquired:
+                self.concurrency.release(monotonic() - start, error)
+        if error is not None:
+            self.metrics.count("request_errors", label=error)
+        return r, error
+
+    def _page_parser(self, page: str):
+        """
+        :param page: kind of page requested, "search" or "food", or None
+        :return: PageParser to parse the page with as it is streamed, or None if the page should be fetched whole
+        """
+        if not self.stream or page is None:
+            return None
+        return self.extractor.page_parser(page)
+
+    def _read_streamed(self, r: requests.models.Response, parser: PageParser) -> None:
+        """
+        read a streamed response a chunk at a time, feeding each decoded chunk to a page parser, and close the
+        connection as soon as the parser has found everything it needs from the page - pages are read to the end
+        while responses are being archived, so the archive keeps whole pages. The parser is kept on the response as
+        page_parser, and the part of the page read as its content
+        :param r: streamed response object
+        :param parser: page parser for the page
+        """
+        r.truncated = False
+        if r.status_code != 200:
+            return  # not parsed - read whole when its content is first used
+
+        chunks = []
+        parse_seconds = 0.0
+        try:
+            for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+                chunks.append(chunk)
+                start = monotonic()
+                found = parser.feed(chunk)
+                parse_seconds += monotonic() - start
+                if found and self.archive is None:
+                    r.truncated = True
+                    break
+            start = monotonic()
+            parser.close()
+            parse_seconds += monotonic() - start
+        finally:
+            r.close()  # drops the connection if the rest of the page was left unread
+        r._content = b"".join(chunks)
+        r._content_consumed = True
+        r.page_parser = parser
+        self.metrics.observe("parse", parse_seconds)
+        if r.truncated:
+            self.metrics.count("early_stops")
+
+    def _record_response(self, latency: float, r: requests.models.Response) -> None:
+        """
+        record the latency, status and size of a response received from the website
+        :param latency: number of seconds the request took
+        :param r: response object received
+        """
+        self.metrics.observe("request", latency)
+        self.metrics.count("responses", label=r.status_code)
+        self.metrics.count("bytes_downloaded", len(r.content or b""))
+        if hasattr(r.raw, "tell"):
+            self.metrics.count("bytes_received", r.raw.tell())  # read off the connection, before decoding
+
+    def _retry_after_error(self, url: str, error: str, attempt: int, r: requests.models.Response) -> bool:
+        """
+        decide whether to retry a failed request, and log the decision - a request that can't be retried is added to
+        the dead letters if its error would otherwise have been retried
+        :param url: link to web page
+        :param error: class of error the last attempt failed with
+        :param attempt: number of attempts made at the request so far
+        :param r: response object of the last attempt
+        :return: True if the request should be retried, otherwise False
+        """
+        if self.retry_policy.should_retry(error, attempt):
+            self.logger.error("Retrying URL: {} after {} error (attempt {})...\n".format(url, error, attempt))
+            self.metrics.count("retries")
+            return True
+
+        self.logger.error("Skipping URL...\n")
+        self.metrics.count("skips", label="failed_request")
+        if self.dead_letters is not None and error in self.retry_policy.rules:
+            self.dead_letters.add(url, error)
+            self.metrics.count("dead_letters")
+        return False
+
+    @staticmethod
+    def _proxy_key(proxies: dict) -> str:
+        """
+        :param proxies: requests-style proxies dictionary used for a request
+        :return: key identifying the proxy for rate limiting, "direct" if no proxy is used
+        """
+        return ProxyManager.proxy_key(proxies)
+
+    def _log_scrape_stats(self) -> None:
+        """
+        log duplicate pages skipped, responses served from cache, how long each worker spent waiting for request
+        permits, retries made, how the concurrency limit moved, and the health of each proxy
+        """
+        self.logger.message("Skipped {} duplicate links to pages already enqueued".format(self.frontier.duplicates))
+        if self.response_cache is not None:
+            self.logger.message("Served {} responses from cache, {} after revalidating".format(
+                self.response_cache.hits + self.response_cache.revalidations, self.response_cache.revalidations))
+        for worker, waits in sorted(self.rate_limiter.wait_time_snapshot().items()):
+            self.logger.message("{} waited {}s for {} request permits".format(worker, waits["wait_seconds"],
+                                                                               waits["permits"]))
+        self.logger.message("Retried {} requests, {} retries refused by the retry budget".format(
+            self.retry_policy.retries, self.retry_policy.budget_refusals))
+        if self.work_queue is not None:
+            self.logger.message("Recovered {} jobs with expired leases, {} leases lost before jobs were done".format(
+                self.work_queue.recovered, self.metrics.snapshot()["counters"].get("lost_leases", 0)))
+        if self.dead_letters is not None and self.dead_letters.added:
+            self.logger.message("Added {} requests that ran out of retries to the dead letters".format(
+                self.dead_letters.added))
+        if self.concurrency is not None:
+            stats = self.concurrency.snapshot()
+            self.logger.message("Ended at {} requests in flight, between {} and {} - raised {} times, cut {} times"
+                                .format(stats["limit"], stats["lowest"], stats["highest"], stats["raises"],
+                                        stats["cuts"]))
+        for proxy, stats in sorted(self.session_builder.proxy_manager.snapshot().items()):
+            self.logger.message("Proxy {}: {} requests, {} errors, {} bans, {}s average latency, quarantined {} times"
+                                .format(proxy, stats["requests"], stats["errors"], stats["bans"], stats["latency"],
+                                        stats["quarantines"]))
+        for stage, stats in self.metrics.snapshot()["stages"].items():
+            self.logger.message("Stage {}: {} passes, {}s mean, p50 <= {}s, p99 <= {}s".format(
+                stage, stats["count"], stats["mean"], stats["p50"], stats["p99"]))
+
+    def _save_food(self, food: Food, diets: list) -> None:
+        """
+        enter a food item into the database - through the batch writer while it is running, otherwise directly
+        :param food: Food object containing food details to enter into database
+        :param diets: List of associated diets to add to the database
+        """
+        if self.known_foods.has_item_num(food.item_num):
+            self.logger.message("Item {} at {} is already in the database... skipping...".format(food.item_num,
+                                                                                                 food.url))
+            self.metrics.count("skips", label="known_item")
+        elif self.db_writer.thread is not None:
+            self.logger.enter_in_db(food.url)
+            self.db_writer.submit(food, diets)
+        else:
+            self._enter_in_db(food, diets)
 
     def _enter_in_db(self, food: Food, diets: list) -> None:
         """
@@ -331,28 +1024,160 @@ class Scraper:
         :param diets: List of associated diets to add to the database
         """
         self.logger.enter_in_db(food.url)
+        food_row = BatchWriter.food_row(food)
         db_session = self.Session()
         try:
-            db_session.add(food)
-            db_session.commit()
-            for diet in diets:
-                db_session.add(Diet(diet=diet, item_num_id=food.item_num))
-            db_session.commit()
+            with self.metrics.time("insert"):
+                db_session.add(food)
+                db_session.commit()
+                for diet in diets:
+                    db_session.add(Diet(diet=diet, item_num_id=food_row["item_num"]))
+                db_session.commit()
+            self.metrics.count("foods_inserted")
         except Exception as e:
             db_session.rollback()
-            self.logger.error("Error while inserting food {}: {}".format(food.item_num, e))
+            self.logger.error("Error while inserting food {}: {}".format(food_row["item_num"], e))
+            return
         finally:
             db_session.close()
+        self._foods_inserted([food_row], [diets])
 
-    def _enqueue_url(self, url: str, func) -> None:
+    def _update_in_db(self, url: str, food: Food, diets: list, fingerprint: str) -> bool:
+        """
+        update a food item already in the database, replacing its diets and fingerprint - the food is updated under the
+        item number and url it is stored with, since the page may now show a different size of it
+        :param url: link to page containing food details
+        :param food: Food object containing food details to update in database
+        :param diets: List of associated diets to replace the food's diets with
+        :param fingerprint: fingerprint of the food details
+        :return: True if the food was updated, otherwise False
+        """
+        self.logger.enter_in_db(food.url)
+        food_row = BatchWriter.food_row(food)
+        db_session = self.Session()
+        try:
+            with self.metrics.time("update"):
+                item_num = self._stored_item_num(db_session, url)
+                if item_num is None:
+                    raise Exception("no food stored for {}".format(canonical_url(url)))
+                food_row["item_num"] = item_num
+                food_row["url"] = db_session.query(Food.url).filter_by(item_num=item_num).scalar()
+                values = {column: value for column, value in food_row.items() if column not in ("item_num", "url")}
+                if db_session.query(Food).filter_by(item_num=item_num).update(values) != 1:
+                    raise Exception("food {} is no longer in the database".format(item_num))
+                db_session.query(Diet).filter_by(item_num_id=item_num).delete()
+                for diet in diets:
+                    db_session.add(Diet(diet=diet, item_num_id=item_num))
+                db_session.merge(FoodFingerprint(item_num=item_num, fingerprint=fingerprint, checked=datetime.utcnow()))
+                db_session.commit()
+            self.metrics.count("foods_updated")
+            self.logger.message("Updated changed food {}".format(item_num))
+        except Exception as e:
+            db_session.rollback()
+            self.logger.error("Error while updating food at URL: {}: {}".format(url, e))
+            return False
+        finally:
+            db_session.close()
+        if self.ingredient_index is not None:
+            self.ingredient_index.index_foods(self.session_factory, [food_row], [diets])
+        return True
+
+    def _stored_item_num(self, db_session, url: str):
+        """
+        :param db_session: database session to look the food up in, if it wasn't loaded with the fingerprints
+        :param url: link to page containing food details
+        :return: item number of the food stored for the page, or None if there is none
+        """
+        item_num = self.stored_item_nums.get(canonical_url(url))
+        if item_num is None:
+            item_num = db_session.query(Food.item_num).filter_by(url=url).scalar()
+        return item_num
+
+    def _enqueue_url(self, url: str, func, dedupe: bool = True) -> None:
         """
         enqueue url to be scraped and scraper function in the scraper queue, for threads to start from
         :param url: url of page to scrape
         :param func: scraping method to use on url when job is executed - i.e. search page or food page
+        :param dedupe: drop the job if a job for the same page has already been enqueued during this scrape
         """
+        if self._admit_job(url, func, dedupe):
+            job = (url, func)
+            self.scrape_queue.put(job)
+
+    def _admit_job(self, url: str, func, dedupe: bool = True) -> bool:
+        """
+        record a job about to be enqueued in the frontier, the log and the journal
+        :param url: url of page to scrape
+        :param func: scraping method to use on url when job is executed
+        :param dedupe: drop the job if a job for the same page has already been enqueued during this scrape
+        :return: True if the job should be enqueued, False if it is a duplicate
+        """
+        if dedupe and not self.frontier.add(url):
+            self.metrics.count("skips", label="duplicate")
+            return False
         self.logger.enqueue(url, func)
-        job = (url, func)
-        self.scrape_queue.put(job)
+        kind = self._journal_kind(func)
+        if self.journal is not None and kind is not None:
+            self.journal.enqueued(url, kind)
+        return True
+
+    def _enqueue_lazily(self, jobs: list) -> None:
+        """
+        hand jobs to the scheduler to enqueue as the backlog of waiting jobs drains, rather than all at once - they are
+        recorded in the frontier and the journal straight away, so a resumed scrape still finds the ones never enqueued
+        :param jobs: list of (url, scraping method) jobs
+        """
+        self.scrape_queue.add_source([job for job in jobs if self._admit_job(*job)])
+
+    def _new_scheduler(self, scheduler_class):
+        """
+        :param scheduler_class: JobScheduler or a subclass of it, for jobs kept in this process
+        :return: a scheduler for this scraper's jobs - a SharedJobScheduler if the scraper has a shared work queue
+        """
+        options = dict(in_flight_caps={"search": self.search_pages_in_flight}, refill_below=self.job_backlog)
+        if self.work_queue is not None:
+            return SharedJobScheduler(self.work_queue, self._kind_funcs(), self._job_class, JOB_PRIORITIES, **options)
+        return scheduler_class(self._job_class, JOB_PRIORITIES, **options)
+
+    def _job_class(self, job: tuple) -> str:
+        """
+        :param job: (url, scraping method) job
+        :return: class of the job for the scheduler - see JOB_PRIORITIES
+        """
+        url, func = job
+        kind = self._journal_kind(func)
+        if kind is None:
+            return "follow_up"
+        if kind == "food":
+            return "known_food" if self.known_foods.has_url(url) else "new_food"
+        return kind
+
+    def _enqueue_follow_up(self, url: str, func, parsed: Future) -> None:
+        """
+        enqueue a job to finish the current job's page once it has been parsed - the job is only handed to a worker
+        once the page is parsed, so no worker waits on the parsing processes, and the current job is only recorded as
+        completed in the journal when its follow-up job is
+        :param url: url of the page being scraped
+        :param func: method to finish the page with
+        :param parsed: future for the parsed page
+        """
+        self.job_state.deferred = True
+        if self._admit_job(url, func, dedupe=False):
+            self.scrape_queue.expect()
+            parsed.add_done_callback(lambda future: self.scrape_queue.put_expected((url, func)))
+
+    def _is_known_food(self, url: str) -> bool:
+        """
+        check the index of known foods to see if details about a food already exist, falling back to the database if
+        the index is unsure
+        :param url: link to page to check if details already exists in database
+        :return: boolean True or False indicating if food at specified url is already in the database
+        """
+        with self.metrics.time("dedup"):
+            known = self.known_foods.has_url(url)
+            if known is None:
+                known = self._check_db_for_food(url)
+        return known
 
     def _check_db_for_food(self, url: str) -> bool:
         """
@@ -378,20 +1203,14 @@ class Scraper:
 
     def _check_ingredients(self, food: Food) -> Food:
         """
-        use regex to check for bad ingredients in a food
+        use the ingredient classifier to check for bad ingredients in a food
         :param food: dictionary containing details about food
         :return: new dictionary containing details about food, updated to reflect if it meets fda guidelines
         """
         self.logger.check_ingredients(food.url)
 
-        # find "main ingredients" - all ingredients before appearance of first vitamin or mineral
-        main_ingredients = self.vitamins_pattern.split(food.ingredients.lower(), maxsplit=1)[0]
-        results = self.bad_ingredients_pattern.findall(main_ingredients)
-
-        if not results:
-            food.fda_guidelines = True
-        else:
-            food.fda_guidelines = False
+        # "main ingredients" are all ingredients before appearance of first vitamin or mineral
+        food.fda_guidelines = self.ingredient_classifier.meets_fda_guidelines(food.ingredients)
 
         return food
 
@@ -413,11 +1232,9 @@ class Scraper:
         """
         enter the total food count on chewy.com when the scraper is starting into the database
         """
-        r = self._make_request(url)
-        soup = BeautifulSoup(r.content, "html.parser")
-        results = soup.find("p", "results-count").string
-        results = re.sub('\s+', ' ', results).split()
-        return int(results[4])
+        r = self._make_request(url, page="search")
+        page_size, total_results = self._extract("results_count", r)
+        return total_results
 
     def _pages_of_results(self, url: str) -> int:
         """
@@ -425,12 +1242,8 @@ class Scraper:
         :param url: the url of the initial (or any) search page
         :return: the number of pages of results
         """
-        r = self._make_request(url)
-        soup = BeautifulSoup(r.content, "html.parser")
-        results = soup.find("p", "results-count").string
-        results = re.sub('\s+', ' ', results).split()
-        page_size = int(results[2])
-        total_results = int(results[4])
+        r = self._make_request(url, page="search")
+        page_size, total_results = self._extract("results_count", r)
         return ceil(total_results / page_size)
 
     def _new_total_count_greaterthan_last(self, new_total: int) -> bool:
@@ -1,6 +1,29 @@
+import atexit
+import json
 import os
+import queue
+import threading
 import time
 
+# (second, date, time) of the last timestamp formatted - log lines within the same second reuse its strings
+_clock = (None, "", "")
+
+
+def _timestamp(now: float = None) -> tuple:
+    """
+    :param now: seconds since the epoch, defaults to the current time
+    :return: tuple of the local date and time at now, formatted as in ScraperLogger.get_date() / get_time()
+    """
+    global _clock
+    second = int(time.time() if now is None else now)
+    clock = _clock
+    if clock[0] != second:
+        local = time.localtime(second)
+        clock = (second, "{}-{}-{}".format(local[0], local[1], local[2]),
+                 "{}:{}:{}".format(local[3], local[4], local[5]))
+        _clock = clock
+    return clock[1], clock[2]
+
 
 class ScraperLogger:
     """
@@ -14,16 +37,14 @@ class ScraperLogger:
         """
         :return: current date
         """
-        c_date: str = str(time.localtime()[0]) + "-" + str(time.localtime()[1]) + "-" + str(time.localtime()[2])
-        return c_date
+        return _timestamp()[0]
 
     @staticmethod
     def get_time():
         """
         :return: current time
         """
-        c_time: str = str(time.localtime()[3]) + ":" + str(time.localtime()[4]) + ":" + str(time.localtime()[5])
-        return c_time
+        return _timestamp()[1]
 
     def scrape_food(self, url: str):
         pass
@@ -120,3 +141,172 @@ class VerboseScraperLogger(ErrorScraperLogger):
 
     def message(self, msg: str):
         self.logfile.write(msg + '\n')
+
+
+class QueuedScraperLogger(ScraperLogger):
+    """
+    Log events to a log file from a single background thread - logging only puts a record on a queue, so workers never
+    wait on file I/O, and lines from different threads are never interleaved
+
+    Records are written in batches, flushed every flush_interval seconds. Lines are either plain text, as written by
+    VerboseScraperLogger, or JSON objects one per line. When the log file grows past max_bytes it is rotated - renamed
+    with a .1 suffix (shifting older files up to backup_count) and a new file started
+    """
+
+    # plain text line format of each event, as written by VerboseScraperLogger / ErrorScraperLogger
+    TEXT_FORMATS = {
+        "scrape_food": "{} - Scraping food details from URL: {}\n\n",
+        "scrape_search_results": "{} - Scraping search results from URL: {}\n\n",
+        "enter_in_db": "{} - Entering food: {} into database...\n\n",
+        "enqueue": "{} - Enqueuing URL: {} with FUNC: {}\n\n",
+        "food_in_db": "{} - Checking DB for entry with URL: {}\n\n",
+        "check_ingredients": "{} - Checking ingredients in food: {}\n\n",
+        "error": "{} - {}\n",
+    }
+
+    # names of the arguments of each event, for JSON lines
+    JSON_FIELDS = {
+        "scrape_food": ("url",),
+        "scrape_search_results": ("url",),
+        "enter_in_db": ("food",),
+        "enqueue": ("url", "func"),
+        "food_in_db": ("url",),
+        "check_ingredients": ("food",),
+        "make_request": ("url", "agent", "proxies"),
+        "error": ("msg",),
+        "message": ("msg",),
+    }
+
+    def __init__(self, verbose: bool = True, json_lines: bool = False, directory: str = "logs",
+                 max_bytes: int = 50 * 1024 * 1024, backup_count: int = 5, flush_interval: float = 1.0,
+                 batch_size: int = 1000):
+        """
+        :param verbose: log all events, otherwise only errors and messages
+        :param json_lines: write each record as a JSON object on its own line, instead of plain text
+        :param directory: directory to write log files in
+        :param max_bytes: size a log file may grow to before it is rotated, or 0 to never rotate
+        :param backup_count: number of rotated log files to keep
+        :param flush_interval: maximum number of seconds a record waits before being written
+        :param batch_size: number of records that are written without waiting for flush_interval
+        """
+        super().__init__()
+        self.verbose: bool = verbose
+        self.json_lines: bool = json_lines
+        self.max_bytes: int = max_bytes
+        self.backup_count: int = backup_count
+        self.flush_interval: float = flush_interval
+        self.batch_size: int = batch_size
+
+        # make directory for logs if it doesn't exist, and start log file named using the current date/time
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        c_date, c_time = _timestamp()
+        extension = "jsonl" if json_lines else "txt"
+        self.logfile_name: str = os.path.join(directory, "{}_{}_logfile.{}".format(c_date, c_time, extension))
+        self.logfile = open(self.logfile_name, "a")
+        if not json_lines:
+            self.logfile.write("LOG FILE STARTED: {}\n\n".format(time.asctime()))
+
+        self.records = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name="QueuedScraperLogger", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def scrape_food(self, url: str):
+        if self.verbose:
+            self.records.put((time.time(), "scrape_food", url))
+
+    def scrape_search_results(self, url: str):
+        if self.verbose:
+            self.records.put((time.time(), "scrape_search_results", url))
+
+    def enqueue(self, url: str, func):
+        if self.verbose:
+            self.records.put((time.time(), "enqueue", url, func))
+
+    def food_in_db(self, url: str):
+        if self.verbose:
+            self.records.put((time.time(), "food_in_db", url))
+
+    def enter_in_db(self, food: str):
+        if self.verbose:
+            self.records.put((time.time(), "enter_in_db", food))
+
+    def check_ingredients(self, food: str):
+        if self.verbose:
+            self.records.put((time.time(), "check_ingredients", food))
+
+    def make_request(self, url: str, agent: str, proxies: dict):
+        if self.verbose:
+            self.records.put((time.time(), "make_request", url, agent, proxies))
+
+    def error(self, msg: str):
+        self.records.put((time.time(), "error", msg))
+
+    def message(self, msg: str):
+        self.records.put((time.time(), "message", msg))
+
+    def close(self) -> None:
+        """
+        write any records still queued and close the log file
+        """
+        if self.thread is not None:
+            self.records.put(None)
+            self.thread.join()
+            self.thread = None
+            self.logfile.close()
+
+    def run(self) -> None:
+        """
+        write queued records to the log file in batches, until closed
+        """
+        while True:
+            # collect records until the first has waited flush_interval seconds, or the batch is full
+            batch = [self.records.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            self.logfile.write("".join(self.format(record) for record in batch if record is not None))
+            self.logfile.flush()
+            if batch[-1] is None:
+                return
+            if self.max_bytes and self.logfile.tell() >= self.max_bytes:
+                self.rotate()
+
+    def format(self, record: tuple) -> str:
+        """
+        :param record: tuple of time, event, and the arguments the event was logged with
+        :return: line(s) of the log file for the record
+        """
+        now, event, args = record[0], record[1], record[2:]
+        c_time = _timestamp(now)[1]
+        if self.json_lines:
+            fields = {"time": round(now, 3), "event": event}
+            for name, value in zip(self.JSON_FIELDS[event], args):
+                fields[name] = value if isinstance(value, (str, dict)) or value is None else str(value)
+            return json.dumps(fields) + "\n"
+        if event == "message":
+            return args[0] + "\n"
+        if event == "make_request":
+            url, agent, proxies = args
+            return "{} - Using PROXY: {} to make request for URL: {} using USER AGENT: {}\n\n".format(c_time, proxies,
+                                                                                                       url, agent)
+        return self.TEXT_FORMATS[event].format(c_time, *args)
+
+    def rotate(self) -> None:
+        """
+        rename the log file (and older rotated log files) and start a new one
+        """
+        self.logfile.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists("{}.{}".format(self.logfile_name, i)):
+                os.replace("{}.{}".format(self.logfile_name, i), "{}.{}".format(self.logfile_name, i + 1))
+        if self.backup_count > 0:
+            os.replace(self.logfile_name, self.logfile_name + ".1")
+        else:
+            os.remove(self.logfile_name)
+        self.logfile = open(self.logfile_name, "a")
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+from time import time
+
+import requests
+
+from scraper_logger import ScraperLogger, SilentScraperLogger
+
+
+class ProxyInventory:
+    """
+    The list of proxies of a ProxyBonanza account, cached on disk so a SessionBuilder can start from it without waiting
+    on the ProxyBonanza API
+
+    The cached list is kept for max_age seconds. Refreshes run on a background thread - each fetched list is written to
+    the cache file in one step, so a crash mid-write never leaves a torn file, and is handed to every function in
+    on_refresh to swap into the live pool. A refresh that fails is retried after retry_seconds, and the last list
+    fetched stays in use meanwhile
+
+    The cache file holds proxy credentials, so it is only readable by its owner
+    """
+
+    def __init__(self, api_data: dict, path: str = "cache/proxies.json", max_age: float = 3600.0,
+                 retry_seconds: float = 60.0, timeout: float = 30.0, logger: ScraperLogger = SilentScraperLogger()):
+        """
+        :param api_data: dictionary of the "api-url" and "api-key" of the ProxyBonanza account, or None if there is none
+        :param path: path of the cache file
+        :param max_age: number of seconds a fetched list is used before it is refreshed
+        :param retry_seconds: number of seconds after a failed refresh before it is retried
+        :param timeout: seconds before a request to the ProxyBonanza API times out
+        :param logger: logger for refreshes and their errors
+        """
+        self.api_data: dict = api_data
+        self.path: str = path
+        self.max_age: float = max_age
+        self.retry_seconds: float = retry_seconds
+        self.timeout: float = timeout
+        self.logger = logger
+
+        self.lock = threading.Lock()
+        self.proxies: list = None  # latest list of proxies, None until one is loaded or fetched
+        self.fetched_at: float = None  # time the latest list was fetched from the API
+        self.on_refresh = []  # functions taking each newly fetched list of proxies
+
+        self.refreshed = threading.Event()  # set once a refresh has been attempted, whether or not it succeeded
+        self.stopping = threading.Event()
+        self.thread = None
+
+    @property
+    def configured(self) -> bool:
+        """
+        :return: True if there is a ProxyBonanza account to fetch proxies from, otherwise False
+        """
+        return self.api_data is not None
+
+    def load(self) -> list:
+        """
+        load the cached list of proxies, however old - a missing or unreadable cache file is ignored
+        :return: list of cached proxies, or None if there are none
+        """
+        try:
+            with open(self.path, "r") as cache_file:
+                cached = json.load(cache_file)
+            proxies, fetched_at = cached["proxies"], float(cached["fetched_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        with self.lock:
+            self.proxies = proxies
+            self.fetched_at = fetched_at
+        return proxies
+
+    def is_stale(self) -> bool:
+        """
+        :return: True if no list has been loaded or fetched, or the latest one is older than max_age, otherwise False
+        """
+        with self.lock:
+            return self.fetched_at is None or time() - self.fetched_at >= self.max_age
+
+    def fetch(self) -> list:
+        """
+        Get a list of proxies from proxybonanza using an api-key and an api-url, if supplied
+        :return: list of proxies from proxybonanza, or None if there is no api data or the proxy package has expired
+        """
+        proxies = None
+
+        if self.api_data is not None:
+            response = requests.get(self.api_data["api-url"], headers={"Authorization": self.api_data["api-key"]},
+                                    timeout=self.timeout)
+            if not response.ok:
+                response.raise_for_status()
+            else:
+                proxy_data = json.loads(response.content)["data"]
+                if proxy_data['expiration_date_human'] != 'Expired':
+                    login: str = proxy_data["login"]
+                    password: str = proxy_data["password"]
+                    proxies = []
+                    for proxy in proxy_data["ippacks"]:
+                        ip: str = proxy["ip"]
+                        port: str = str(proxy["port_http"])
+                        full_proxy_string = "http://{}:{}@{}:{}".format(login, password, ip, port)
+                        proxies.append({"http": full_proxy_string, "https": full_proxy_string})
+        return proxies
+
+    def refresh(self) -> bool:
+        """
+        fetch the list of proxies, cache it on disk and hand it to every function in on_refresh
+        :return: True if a list was fetched, otherwise False
+        """
+        try:
+            return self._refresh()
+        finally:
+            self.refreshed.set()
+
+    def _refresh(self) -> bool:
+        try:
+            proxies = self.fetch()
+        except Exception as e:
+            self.logger.error("Error fetching proxies from ProxyBonanza: {}".format(e))
+            return False
+        if proxies is None:
+            self.logger.error("No proxies available from ProxyBonanza")
+            return False
+
+        fetched_at = time()
+        try:
+            self._write(proxies, fetched_at)
+        except OSError as e:
+            self.logger.error("Error caching proxies at {}: {}".format(self.path, e))
+        with self.lock:
+            self.proxies = proxies
+            self.fetched_at = fetched_at
+        for func in self.on_refresh:
+            func(proxies)
+        self.logger.message("Refreshed {} proxies from ProxyBonanza".format(len(proxies)))
+        return True
+
+    def _write(self, proxies: list, fetched_at: float) -> None:
+        """
+        write a list of proxies to the cache file, replacing it in one step
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = "{}.{}.tmp".format(self.path, threading.get_ident())
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as temp_file:
+            json.dump({"fetched_at": fetched_at, "proxies": proxies}, temp_file)
+        os.replace(temp_path, self.path)
+
+    def start(self) -> None:
+        """
+        start refreshing the list of proxies on a background thread - straight away if it is stale, then whenever it
+        reaches max_age
+        """
+        if not self.configured or self.thread is not None:
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="ProxyInventory", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        stop refreshing the list of proxies
+        """
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+
+    def run(self) -> None:
+        """
+        refresh the list of proxies whenever it is stale, until stopped
+        """
+        while not self.stopping.is_set():
+            wait = self.retry_seconds
+            if not self.is_stale() or self.refresh():
+                with self.lock:
+                    wait = max(self.fetched_at + self.max_age - time(), 0)
+            self.stopping.wait(wait)
@@ -0,0 +1,171 @@
+import random
+import threading
+from collections import defaultdict
+from time import monotonic
+from urllib.parse import urlsplit
+
+
+class ProxyStats:
+    """
+    Running health statistics of one proxy
+    """
+
+    def __init__(self, initial_latency: float):
+        self.latency: float = initial_latency  # exponentially weighted moving average of request latency, in seconds
+        self.requests: int = 0
+        self.errors: int = 0  # requests that failed without a response, or with a 5xx response
+        self.bans: int = 0  # responses signalling the proxy is blocked or throttled, i.e. 403 / 429
+        self.consecutive_failures: int = 0
+        self.quarantined_until: float = 0
+        self.quarantines: int = 0
+        self.quarantine_seconds: float = 0  # length of the last quarantine, doubled each time the proxy fails again
+
+    def success_rate(self) -> float:
+        """
+        :return: smoothed fraction of requests through the proxy that succeeded
+        """
+        return (self.requests - self.errors - self.bans + 1) / (self.requests + 2)
+
+
+class ProxyManager:
+    """
+    Tracks the latency, error rate and ban signals of every proxy, and chooses proxies for requests weighted toward
+    fast, healthy ones
+
+    Each proxy has a circuit breaker - after failure_threshold failures in a row it is quarantined for
+    quarantine_seconds, and not chosen until the quarantine is up. The first request after a quarantine is a trial: if
+    it fails, the proxy goes straight back into quarantine for twice as long (up to max_quarantine_seconds), and if it
+    succeeds the proxy is healthy again. If every proxy is quarantined, the one due out soonest is chosen
+    """
+
+    BAN_STATUS_CODES = (403, 429)
+
+    def __init__(self, proxies: list = None, failure_threshold: int = 3, quarantine_seconds: float = 30,
+                 max_quarantine_seconds: float = 600, latency_weight: float = 0.3, initial_latency: float = 1.0):
+        """
+        :param proxies: list of requests-style proxies dictionaries to choose from, None or empty to use no proxies
+        :param failure_threshold: number of failures in a row that quarantines a proxy
+        :param quarantine_seconds: number of seconds a proxy is first quarantined for
+        :param max_quarantine_seconds: maximum number of seconds a proxy is quarantined for
+        :param latency_weight: weight of the latest request in a proxy's moving average latency
+        :param initial_latency: latency assumed for proxies that haven't made a request yet, in seconds
+        """
+        self.proxies: list = list(proxies) if proxies else []
+        self.failure_threshold: int = failure_threshold
+        self.quarantine_seconds: float = quarantine_seconds
+        self.max_quarantine_seconds: float = max_quarantine_seconds
+        self.latency_weight: float = latency_weight
+
+        self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: ProxyStats(initial_latency))  # proxy -> ProxyStats
+
+    def set_proxies(self, proxies: list) -> None:
+        """
+        swap in a new list of proxies to choose from - the statistics of proxies in both lists are kept
+        :param proxies: list of requests-style proxies dictionaries, None or empty to use no proxies
+        """
+        proxies = list(proxies) if proxies else []
+        with self.lock:
+            self.proxies = proxies
+
+    @staticmethod
+    def proxy_key(proxies: dict) -> str:
+        """
+        :param proxies: requests-style proxies dictionary
+        :return: key identifying the proxy, "direct" if no proxy is used
+        """
+        if not proxies:
+            return "direct"
+        return proxies.get("https") or proxies.get("http")
+
+    def choose(self) -> dict:
+        """
+        choose a proxy for a request, at random weighted by speed and success rate, skipping quarantined proxies
+        :return: requests-style proxies dictionary, or None if there are no proxies
+        """
+        now = monotonic()
+        with self.lock:
+            if not self.proxies:
+                return None
+            available = []
+            weights = []
+            for proxies in self.proxies:
+                stats = self.stats[self.proxy_key(proxies)]
+                if stats.quarantined_until <= now:
+                    available.append(proxies)
+                    weights.append(stats.success_rate() ** 2 / max(stats.latency, 0.01))
+            if not available:
+                return min(self.proxies, key=lambda p: self.stats[self.proxy_key(p)].quarantined_until)
+        return random.choices(available, weights=weights)[0]
+
+    def record(self, proxy: str, latency: float = None, status_code: int = None) -> None:
+        """
+        record the outcome of a request through a proxy
+        :param proxy: key of the proxy, see proxy_key()
+        :param latency: seconds the request took, if it got a response
+        :param status_code: status code of the response, or None if the request failed without a response
+        """
+        banned = status_code in self.BAN_STATUS_CODES
+        failed = status_code is None or status_code >= 500
+
+        with self.lock:
+            stats = self.stats[proxy]
+            stats.requests += 1
+            if latency is not None:
+                stats.latency += self.latency_weight * (latency - stats.latency)
+            if banned:
+                stats.bans += 1
+            elif failed:
+                stats.errors += 1
+
+            if not banned and not failed:
+                stats.consecutive_failures = 0
+                stats.quarantine_seconds = 0
+                return
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= self.failure_threshold:
+                # open the circuit - back off harder each time the proxy fails again after a quarantine
+                stats.quarantine_seconds = min(max(stats.quarantine_seconds * 2, self.quarantine_seconds),
+                                               self.max_quarantine_seconds)
+                stats.quarantined_until = monotonic() + stats.quarantine_seconds
+                stats.quarantines += 1
+
+    def is_quarantined(self, proxy: str) -> bool:
+        """
+        :param proxy: key of the proxy, see proxy_key()
+        :return: True if the proxy is quarantined, otherwise False
+        """
+        with self.lock:
+            return proxy in self.stats and self.stats[proxy].quarantined_until > monotonic()
+
+    def snapshot(self) -> dict:
+        """
+        :return: dictionary of the statistics of every proxy that has made a request, keyed by proxy host and port
+        (without credentials)
+        """
+        now = monotonic()
+        snapshot = dict()
+        with self.lock:
+            for proxy, stats in self.stats.items():
+                if not stats.requests:
+                    continue
+                snapshot[self.display_name(proxy)] = {
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "bans": stats.bans,
+                    "latency": round(stats.latency, 3),
+                    "success_rate": round(stats.success_rate(), 3),
+                    "quarantines": stats.quarantines,
+                    "quarantined_for": round(max(stats.quarantined_until - now, 0), 1),
+                }
+        return snapshot
+
+    @staticmethod
+    def display_name(proxy: str) -> str:
+        """
+        :return: host and port of a proxy url, so proxy credentials aren't logged
+        """
+        if proxy == "direct":
+            return proxy
+        parts = urlsplit(proxy)
+        return "{}:{}".format(parts.hostname, parts.port) if parts.port else parts.hostname
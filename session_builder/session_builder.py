@@ -1,8 +1,18 @@
 import json
-import random
+import threading
+from collections import defaultdict
 from itertools import cycle
+from time import monotonic
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from scraper_logger import ScraperLogger, SilentScraperLogger
+from session_builder.proxy_inventory import ProxyInventory
+from session_builder.proxy_manager import ProxyManager
+
+NO_PROXY_POLICIES = ("ask", "direct", "fail")
 
 
 class SessionBuilder:
@@ -10,19 +20,55 @@ class SessionBuilder:
     The SessionBuilder class is used to create and return request.session objects using different useragents and
     proxies on a per-session basis
 
-    Proxies are obtained using an API key from ProxyBonanza
+    Proxies are obtained using an API key from ProxyBonanza, through a ProxyInventory cached on disk - the builder
+    starts from the cached list, however old, and the inventory refreshes it in the background and swaps each new list
+    into the proxy manager, so building never waits on the ProxyBonanza API once a list has been cached
 
     If no useragents are supplied, a default Firefox useragent is used
 
-    If no API data is supplied for ProxyBonanza, no proxies are used
+    If no proxies are available, no_proxy_policy decides what happens - "ask" asks whether to continue without proxies,
+    "direct" continues without them (using proxies as soon as a background refresh finds some) and "fail" raises an
+    exception. Only a first run with API data and nothing cached waits for ProxyBonanza, and only under "ask" or "fail"
+
+    Long-lived sessions are kept in a pool, one per (proxy, useragent) pair, so connections to a site are kept alive
+    and reused across requests - sessions are checked out for a request and checked back in afterwards, and sessions
+    left idle for longer than idle_timeout seconds are closed
+
+    Proxies are chosen by a ProxyManager, weighted toward fast, healthy proxies - request outcomes should be reported
+    to self.proxy_manager so it can keep score, and quarantine failing proxies
     """
 
     no_proxies_acknowledged = False
 
-    def __init__(self):
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 4, idle_timeout: float = 60,
+                 no_proxy_policy: str = None, inventory: ProxyInventory = None,
+                 logger: ScraperLogger = SilentScraperLogger()):
         """
-        set up cycle of useragents and list of proxies
+        set up cycle of useragents, list of proxies and pool of sessions
+        :param pool_connections: number of hosts each pooled session keeps connections open to
+        :param pool_maxsize: maximum number of connections each pooled session keeps open per host
+        :param idle_timeout: number of seconds a pooled session may sit unused before it is closed
+        :param no_proxy_policy: "ask", "direct" or "fail" - see above - defaults to "direct" once no proxies have been
+        acknowledged, otherwise "ask"
+        :param inventory: inventory of proxies, defaults to the ProxyBonanza account in session_builder/api_data.json
+        :param logger: logger for proxy refreshes
         """
+        if no_proxy_policy is None:
+            no_proxy_policy = "direct" if SessionBuilder.no_proxies_acknowledged else "ask"
+        if no_proxy_policy not in NO_PROXY_POLICIES:
+            raise Exception("No proxy policy must be one of {}".format(", ".join(NO_PROXY_POLICIES)))
+        self.no_proxy_policy: str = no_proxy_policy
+
+        # set up session pool
+        self.pool_connections: int = pool_connections
+        self.pool_maxsize: int = pool_maxsize
+        self.idle_timeout: float = idle_timeout
+        self.pool_lock = threading.Lock()
+        self.idle_sessions = defaultdict(list)  # (proxy, useragent) -> list of (idle since, session)
+        self.proxy_useragents = dict()  # proxy -> useragent always used with that proxy
+        self.last_eviction: float = monotonic()
+        self.listed_proxies = None  # proxies listed by the latest refresh, once the inventory has been refreshed
+
         # set up useragents
         try:
             with open("useragents.txt", "r") as useragent_file:
@@ -33,16 +79,25 @@ class SessionBuilder:
         except FileNotFoundError:
             self.useragents = cycle(["Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:15.0) Gecko/20100101 Firefox/15.0.1"])
 
-        # set up proxies from proxybonanza, if credentials supplied
-        try:
-            with open("session_builder/api_data.json", "r") as api_data_file:
-                self.api_data = json.load(api_data_file)
-        except FileNotFoundError:
-            self.api_data = None
-        self.proxies = self.get_proxies_from_proxybonanza()
+        # set up proxies from the cached proxybonanza inventory, if credentials supplied, refreshed in the background
+        if inventory is None:
+            try:
+                with open("session_builder/api_data.json", "r") as api_data_file:
+                    api_data = json.load(api_data_file)
+            except FileNotFoundError:
+                api_data = None
+            inventory = ProxyInventory(api_data, logger=logger)
+        self.inventory: ProxyInventory = inventory
+        self.api_data = inventory.api_data
+        self.proxies = inventory.load()
+        self.proxy_manager = ProxyManager(self.proxies)
+        inventory.on_refresh.append(self._swap_proxies)
+        inventory.start()
 
-        # if no proxies available, seek acknowledgement to continue without proxies
-        if self.proxies is None and not SessionBuilder.no_proxies_acknowledged:
+        # if no proxies available, follow the no proxy policy
+        if self.proxies is None and inventory.configured and no_proxy_policy != "direct":
+            inventory.refreshed.wait()  # nothing cached yet - wait for the first list
+        if self.proxies is None and no_proxy_policy == "ask" and not SessionBuilder.no_proxies_acknowledged:
             ack = str()
             while ack.upper() not in ['Y', 'N']:
                 ack = input("No proxies available. Continue without proxies? (Y/N): ")
@@ -50,39 +105,104 @@ class SessionBuilder:
                 SessionBuilder.no_proxies_acknowledged = True
             else:
                 raise Exception('No proxies available, ending...')
+        if self.proxies is None and no_proxy_policy == "fail":
+            inventory.stop()
+            raise Exception('No proxies available, ending...')
 
     def get_proxies_from_proxybonanza(self) -> list:
         """
-        Get a list of proxies from proxybonanza using an api-key and an api-url, if supplied
+        Get a list of proxies from proxybonanza using an api-key and an api-url, if supplied - straight from the API,
+        bypassing the cached inventory
         :return: list of proxies from proxybonanza, or None if no api data supplied to SessionHelper object
         """
-        proxies = None
+        return self.inventory.fetch()
 
-        if self.api_data is not None:
-            response = requests.get(self.api_data["api-url"], headers={"Authorization": self.api_data["api-key"]})
-            if not response.ok:
-                response.raise_for_status()
-            else:
-                proxy_data = json.loads(response.content)["data"]
-                if proxy_data['expiration_date_human'] != 'Expired':
-                    login: str = proxy_data["login"]
-                    password: str = proxy_data["password"]
-                    proxies = []
-                    for proxy in proxy_data["ippacks"]:
-                        ip: str = proxy["ip"]
-                        port: str = str(proxy["port_http"])
-                        full_proxy_string = "http://{}:{}@{}:{}".format(login, password, ip, port)
-                        proxies.append({"http": full_proxy_string, "https": full_proxy_string})
-        return proxies
+    def _swap_proxies(self, proxies: list) -> None:
+        """
+        swap a list of proxies fetched by the inventory into the live pool - sessions of proxies no longer listed are
+        closed as they are checked in
+        :param proxies: list of requests-style proxies dictionaries
+        """
+        listed = {proxy["https"] for proxy in proxies}
+        closing = []
+        with self.pool_lock:
+            self.listed_proxies = listed
+            for key in list(self.idle_sessions):
+                if key[0] is not None and key[0] not in listed:
+                    closing.extend(session for since, session in self.idle_sessions.pop(key))
+        self.proxy_manager.set_proxies(proxies)
+        self.proxies = proxies
+        for session in closing:
+            session.close()
 
     def create_session(self) -> requests.session:
         """
-        Create and return a new session using a new useragent and a random proxy from the list
+        Create and return a new session using a new useragent and a proxy chosen by the proxy manager
         Use own ip if no proxies specified, or default to Firefox/15.0.1 useragent if no useragents were specified
-        :return: requests.session object using the useragent and a random proxy
+        :return: requests.session object using the useragent and a proxy
         """
         session = requests.Session()
-        session.headers = {"User-Agent": next(self.useragents)}
+        session.headers = {"User-Agent": next(self.useragents), "Accept-Encoding": ACCEPT_ENCODING}
         if self.proxies is not None:
-            session.proxies = random.choice(self.proxies)
+            session.proxies = self.proxy_manager.choose()
+        return session
+
+    def checkout_session(self) -> requests.Session:
+        """
+        Take a session from the pool for a proxy chosen by the proxy manager, creating one if none are idle
+        Each proxy is always paired with the same useragent, so its sessions (and their connections) can be reused
+        :return: requests.Session object using a proxy and its useragent, to be returned with checkin_session()
+        """
+        proxies = self.proxy_manager.choose()
+        proxy = proxies["https"] if proxies is not None else None
+
+        with self.pool_lock:
+            if proxy not in self.proxy_useragents:
+                self.proxy_useragents[proxy] = next(self.useragents).strip()
+            key = (proxy, self.proxy_useragents[proxy])
+            if self.idle_sessions[key]:
+                return self.idle_sessions[key].pop()[1]
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers = {"User-Agent": key[1], "Accept-Encoding": ACCEPT_ENCODING}
+        if proxies is not None:
+            session.proxies = proxies
+        session.pool_key = key
         return session
+
+    def checkin_session(self, session: requests.Session, discard: bool = False) -> None:
+        """
+        Return a session taken with checkout_session() to the pool, and close any sessions that have been idle too long
+        :param session: session to return to the pool
+        :param discard: close the session instead of returning it to the pool, i.e. if its proxy failed
+        """
+        now = monotonic()
+        expired = []
+        with self.pool_lock:
+            proxy = session.pool_key[0]
+            if proxy is not None and self.listed_proxies is not None and proxy not in self.listed_proxies:
+                discard = True  # the proxy was dropped from the inventory while the session was checked out
+            if not discard:
+                self.idle_sessions[session.pool_key].append((now, session))
+            if now - self.last_eviction > self.idle_timeout / 2:
+                self.last_eviction = now
+                for key, idle in self.idle_sessions.items():
+                    expired.extend(s for since, s in idle if now - since > self.idle_timeout)
+                    idle[:] = [(since, s) for since, s in idle if now - since <= self.idle_timeout]
+        if discard:
+            session.close()
+        for expired_session in expired:
+            expired_session.close()
+
+    def close_sessions(self) -> None:
+        """
+        Close all idle sessions in the pool
+        """
+        with self.pool_lock:
+            sessions = [s for idle in self.idle_sessions.values() for since, s in idle]
+            self.idle_sessions.clear()
+        for session in sessions:
+            session.close()
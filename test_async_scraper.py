@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+import aiohttp
+
+from async_scraper import AsyncScraper
+from benchmarks.chewy_standin import FIRST_ITEM_NUM
+from concurrency import ConcurrencyController
+from retry_policy import RetryPolicy, RetryRule
+from test_scraper_standin import FailingRateLimiter, StandInScrapeTest
+
+
+class TestAsyncScraper(StandInScrapeTest):
+
+    standin_options = dict(pages=2, foods_per_page=4)
+    scraper_class = AsyncScraper
+    scraper_options = dict(max_in_flight=4)
+
+    def test_scrape(self):
+        scraper = self.new_scraper()
+        scraper.scrape(self.standin.search_url)
+        self.assertEqual(self.item_nums(), sorted(self.names(scraper)))
+        self.assertEqual(len(self.item_nums()), len({item_num for item_num, diet in self.diet_items(scraper)}))
+        self.assertEqual(len(self.item_nums()), self.counter(scraper, "foods_inserted"))
+
+    def test_cached_responses(self):
+        self.new_scraper(response_cache=self.new_cache()).scrape(self.standin.search_url)
+        self.standin.reset_counts()
+
+        # food pages are served from the cache, and pages of search results are revalidated
+        scraper = self.new_scraper(database=os.path.join(self.dir.name, "cached.sqlite"),
+                                   response_cache=self.new_cache())
+        scraper.scrape(self.standin.search_url)
+        self.assertEqual(self.item_nums(), sorted(self.names(scraper)))
+        self.assertEqual(len(self.item_nums()), self.counter(scraper, "cache_hits"))
+        self.assertEqual({304}, set(self.standin.statuses))
+
+    def test_slot_released_when_permit_fails(self):
+        scraper = self.new_scraper(concurrency=ConcurrencyController(floor=1, ceiling=1),
+                                   rate_limiter=FailingRateLimiter())
+        url = self.food_url(FIRST_ITEM_NUM)
+
+        async def attempts():
+            async with aiohttp.ClientSession() as scraper.http:
+                with self.assertRaises(Exception):
+                    await scraper._attempt_request_async(url)
+                self.assertEqual(0, scraper.concurrency.in_flight)
+                return await scraper._attempt_request_async(url)
+
+        r, error = asyncio.run(asyncio.wait_for(attempts(), 5))
+        self.assertIsNone(error)
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(0, scraper.concurrency.in_flight)
+
+
+class TestAsyncScraperRetries(StandInScrapeTest):
+
+    standin_options = dict(pages=2, foods_per_page=4, error_rate=0.15, throttle_rate=0.15, retry_after=0, seed=3)
+    scraper_class = AsyncScraper
+    scraper_options = dict(max_in_flight=4)
+
+    def test_retries_errors_and_429s(self):
+        retry_policy = RetryPolicy(rules={"throttled": RetryRule(10), "server": RetryRule(10)}, max_budget=100)
+        scraper = self.new_scraper(retry_policy=retry_policy)
+        scraper.scrape(self.standin.search_url)
+
+        # every failed request is retried until it gets through
+        self.assertEqual(self.item_nums(), sorted(self.names(scraper)))
+        self.assertGreater(self.standin.statuses[429], 0)
+        self.assertGreater(self.standin.statuses[500], 0)
+        self.assertEqual(self.standin.statuses[429] + self.standin.statuses[500], self.counter(scraper, "retries"))
+        errors = self.counter(scraper, "request_errors")
+        self.assertEqual(self.standin.statuses[429], errors["throttled"])
+        self.assertEqual(self.standin.statuses[500], errors["server"])
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from unittest import TestCase
+
+from concurrency import ConcurrencyController
+from scraper_logger import SilentScraperLogger
+
+
+class ListLogger(SilentScraperLogger):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def message(self, msg: str):
+        self.messages.append(msg)
+
+
+class TestConcurrencyController(TestCase):
+
+    def setUp(self) -> None:
+        self.logger = ListLogger()
+
+    def run_round(self, controller, latency=0.1, error=None):
+        """
+        send a full round of requests at the current limit, then finish them all
+        """
+        in_flight = controller.limit
+        for _ in range(in_flight):
+            controller.acquire()
+        for _ in range(in_flight):
+            controller.release(latency, error)
+
+    def test_raises_and_cuts(self):
+        controller = ConcurrencyController(floor=2, ceiling=6, min_round=1, logger=self.logger)
+        self.assertEqual(2, controller.limit)
+        for limit in (3, 4, 5, 6, 6):
+            self.run_round(controller)
+            self.assertEqual(limit, controller.limit)
+
+        # a 429 halves the limit once - the other requests sent at the old limit don't cut it again
+        for _ in range(6):
+            controller.acquire()
+        for _ in range(6):
+            controller.release(0.1, "throttled")
+        self.assertEqual(3, controller.limit)
+        controller.acquire()
+        controller.release(0.1, "timeout")
+        self.assertEqual(2, controller.limit)
+
+        # never below the floor, and every change is logged
+        self.run_round(controller, error="banned")
+        self.assertEqual(2, controller.limit)
+        self.assertEqual(6, len(self.logger.messages))
+        self.assertIn("Concurrency 6 -> 3", self.logger.messages[4])
+        self.assertEqual({"limit": 2, "in_flight": 0, "lowest": 2, "highest": 6, "raises": 4, "cuts": 2},
+                         controller.snapshot())
+
+    def test_round_health(self):
+        controller = ConcurrencyController(floor=1, ceiling=10, initial=4, min_round=1, logger=self.logger)
+        self.run_round(controller, latency=0.1)
+        self.assertEqual(5, controller.limit)
+
+        # latency well above the best round steps the limit down, 404s don't count as errors
+        self.run_round(controller, latency=0.5)
+        self.assertEqual(4, controller.limit)
+        self.run_round(controller, latency=0.1, error="http")
+        self.assertEqual(5, controller.limit)
+
+        # too many server errors in a round cut like a 429
+        self.run_round(controller, error="server")
+        self.assertEqual(2, controller.limit)
+
+        # a round that never used the whole limit doesn't raise it
+        for _ in range(4):
+            controller.acquire()
+            controller.release(0.1)
+        self.assertEqual(2, controller.limit)
+
+    def test_acquire_blocks_at_limit(self):
+        controller = ConcurrencyController(floor=1, ceiling=1)
+        controller.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        controller.release(0.1)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    def test_acquire_async(self):
+        controller = ConcurrencyController(floor=2, ceiling=2)
+
+        async def request(order, name):
+            await controller.acquire_async()
+            order.append(name)
+            await asyncio.sleep(0.01)
+            controller.release(0.01)
+
+        async def run():
+            order = []
+            await asyncio.gather(*[request(order, i) for i in range(5)])
+            return order
+
+        self.assertEqual([0, 1, 2, 3, 4], asyncio.run(run()))
+        self.assertEqual(0, controller.in_flight)
@@ -0,0 +1,48 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from crawl_journal import CrawlJournal
+
+
+class TestCrawlJournal(TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "journal.sqlite")
+        self.journal = CrawlJournal(self.path)
+
+    def tearDown(self) -> None:
+        self.journal.close()
+        self.dir.cleanup()
+
+    def test_job_states(self):
+        search_url = "https://www.chewy.com/s?rh=c%3A288%2Cc%3A332&page=1"
+        food_url = "https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152233"
+        self.journal.enqueued(search_url, "search")
+        self.journal.started(search_url)
+        self.journal.enqueued(food_url, "food")
+        self.journal.finished(search_url)
+        self.journal.started(food_url)
+
+        # nothing reaches disk until flushed
+        self.assertEqual([], self.journal.unfinished_jobs())
+        self.journal.flush()
+        self.assertEqual([(food_url, "food")], self.journal.unfinished_jobs())
+        self.assertEqual([(search_url, "search")], self.journal.done_jobs())
+
+        # jobs survive reopening the journal
+        self.journal.close()
+        self.journal = CrawlJournal(self.path)
+        self.assertEqual([(food_url, "food")], self.journal.unfinished_jobs())
+
+        self.journal.clear()
+        self.assertEqual([], self.journal.unfinished_jobs())
+        self.assertEqual([], self.journal.done_jobs())
+
+    def test_background_flush(self):
+        self.journal.start()
+        for i in range(3):
+            self.journal.enqueued("https://www.chewy.com/s?page={}".format(i), "search")
+        self.journal.stop()
+        self.assertEqual(3, len(self.journal.unfinished_jobs()))
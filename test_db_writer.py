@@ -0,0 +1,71 @@
+from time import sleep
+from unittest import TestCase
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from db_writer import BatchWriter
+from models import Base, Diet, Food, FoodFingerprint
+
+
+class TestBatchWriter(TestCase):
+
+    def setUp(self) -> None:
+        self.engine = sa.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.session_factory = sessionmaker(bind=self.engine)
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    @staticmethod
+    def make_food(item_num: int) -> Food:
+        return Food(item_num=item_num, url="www.test.com/{}".format(item_num), name=str(item_num),
+                    ingredients="chicken", lifestage="Adult", sm_breed=True)
+
+    def count(self, model) -> int:
+        db_session = self.session_factory()
+        try:
+            return db_session.query(model).count()
+        finally:
+            db_session.close()
+
+    def test_flush_on_batch_size(self):
+        writer = BatchWriter(self.session_factory, batch_size=3, flush_interval=60)
+        writer.start()
+        for item_num in range(1, 7):
+            writer.submit(self.make_food(item_num), ["Grain-Free", "Gluten Free"])
+        writer.stop()
+
+        self.assertEqual(6, self.count(Food))
+        self.assertEqual(12, self.count(Diet))
+        self.assertEqual(6, self.count(FoodFingerprint))
+        self.assertEqual(6, writer.inserted)
+        self.assertEqual(2, writer.transactions)
+
+    def test_flush_on_interval(self):
+        writer = BatchWriter(self.session_factory, batch_size=100, flush_interval=0.05)
+        writer.start()
+        writer.submit(self.make_food(1), [])
+        sleep(0.5)
+        self.assertEqual(1, self.count(Food))
+        writer.stop()
+
+    def test_bad_row_is_isolated(self):
+        writer = BatchWriter(self.session_factory, batch_size=10, flush_interval=60)
+        writer.start()
+        writer.submit(self.make_food(1), ["Grain-Free"])
+        writer.submit(self.make_food(1), ["Grain-Free"])  # duplicate item number
+        writer.submit(self.make_food(2), ["Grain-Free"])
+        writer.stop()
+
+        self.assertEqual(2, self.count(Food))
+        self.assertEqual(2, self.count(Diet))
+        self.assertEqual(2, writer.inserted)
+
+    def test_column_defaults(self):
+        row = BatchWriter.food_row(self.make_food(1))
+        self.assertEqual(False, row["xsm_breed"])
+        self.assertEqual(True, row["sm_breed"])
+        self.assertEqual(None, row["fda_guidelines"])
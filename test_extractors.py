@@ -0,0 +1,76 @@
+import os
+from unittest import TestCase
+
+from extractors import LxmlExtractor, SoupExtractor
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class TestExtractors(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        with open(os.path.join(FIXTURES, "food_page.html"), "rb") as page:
+            cls.food_page = page.read()
+        with open(os.path.join(FIXTURES, "search_page.html"), "rb") as page:
+            cls.search_page = page.read()
+        cls.extractors = [LxmlExtractor(), SoupExtractor()]
+
+    def test_search_results(self):
+        expected_links = ["/adirondack-30-high-fat-puppy/dp/152233",
+                          "/adirondack-26-adult-active-recipe-dry/dp/152235",
+                          "/adirondack-large-breed-recipe-dry-dog/dp/152237",
+                          "/adirondack-21-adult-everyday-recipe/dp/152239"]
+        for extractor in self.extractors:
+            self.assertEqual(expected_links, extractor.search_results(self.search_page))
+
+    def test_results_count(self):
+        for extractor in self.extractors:
+            self.assertEqual((4, 4), extractor.results_count(self.search_page))
+
+    def test_food_details(self):
+        for extractor in self.extractors:
+            details = extractor.food_details(self.food_page)
+            self.assertEqual(51256, details["item_num"])
+            self.assertEqual("Earthborn Holistic Great Plains Feast Grain-Free Natural Dry Dog Food", details["name"])
+            self.assertTrue(details["ingredients"].startswith("Bison Meal, Peas, Pea Protein, Tapioca"))
+            self.assertTrue(details["ingredients"].endswith("Dried Lactobacillus Acidophilus Fermentation Product."))
+            self.assertEqual("Earthborn Holistic", details["brand"])
+            self.assertNotIn("xsm_breed", details)
+            self.assertEqual(True, details["sm_breed"])
+            self.assertEqual(True, details["md_breed"])
+            self.assertEqual(True, details["lg_breed"])
+            self.assertNotIn("xlg_breed", details)
+            self.assertEqual("Dry Food", details["food_form"])
+            self.assertEqual("Adult", details["lifestage"])
+            self.assertEqual(["Grain-Free", "Gluten Free"], details["diets"])
+
+    def test_empty_pages(self):
+        for extractor in self.extractors:
+            for content in (b"", b"  \n"):
+                self.assertEqual([], extractor.search_results(content))
+                self.assertRaises(Exception, extractor.results_count, content)
+                self.assertRaises(Exception, extractor.food_details, content)
+
+    def test_extractors_agree(self):
+        lxml_extractor, soup_extractor = self.extractors
+        self.assertEqual(soup_extractor.food_details(self.food_page), lxml_extractor.food_details(self.food_page))
+
+    def test_page_parsers(self):
+        lxml_extractor, soup_extractor = self.extractors
+        self.assertIsNone(soup_extractor.page_parser("food"))
+        for page, content in (("food", self.food_page), ("search", self.search_page)):
+            parser = lxml_extractor.page_parser(page)
+            for start in range(0, len(content), 512):
+                if parser.feed(content[start:start + 512]):
+                    break
+            parser.close()
+            for method in parser.methods:
+                self.assertEqual(getattr(lxml_extractor, method)(content), parser.result(method))
+            if page == "food":
+                self.assertLess(start, len(content) // 2)  # every field comes before the second half of the page
+
+        parser = lxml_extractor.page_parser("food")
+        parser.feed(self.food_page[:10000])
+        parser.close()
+        self.assertRaises(Exception, parser.result, "food_details")
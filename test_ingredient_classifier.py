@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ingredient_classifier import IngredientClassifier, KeywordMatcher
+from models import Base, Food
+from reclassify import reclassify
+
+
+class TestKeywordMatcher(TestCase):
+
+    def test_find_all(self):
+        matcher = KeywordMatcher(["he", "she", "his", "hers"])
+        self.assertEqual([(1, 4), (2, 4), (2, 6)], list(matcher.find_all("ushers")))
+        self.assertEqual(1, matcher.first("ushers"))
+        self.assertIsNone(matcher.first("xyz"))
+
+    def test_anchored_keywords(self):
+        matcher = KeywordMatcher(["pea$"])
+        self.assertTrue(matcher.search("chicken, pea"))
+        self.assertTrue(matcher.search("chicken, pea\n"))
+        self.assertFalse(matcher.search("chicken, pea, rice"))
+
+
+class TestIngredientClassifier(TestCase):
+
+    def test_meets_fda_guidelines(self):
+        classifier = IngredientClassifier()
+        self.assertFalse(classifier.meets_fda_guidelines("chicken, lentils, potatoes - this one's bad"))
+        self.assertTrue(classifier.meets_fda_guidelines("just chicken in this food - its good!"))
+        self.assertTrue(classifier.meets_fda_guidelines(
+            "this food has good ingredients, vitamins and minerals, then sweet potatoes - ok!"))
+
+        # matches the original patterns exactly, i.e. "pea" only counts followed by a space or at the end
+        self.assertTrue(classifier.meets_fda_guidelines("Chicken, Pea, Rice"))
+        self.assertFalse(classifier.meets_fda_guidelines("Chicken, Pea Protein, Rice"))
+        self.assertFalse(classifier.meets_fda_guidelines("Chicken, Rice, Pea"))
+        self.assertTrue(classifier.meets_fda_guidelines("Chicken, Salt, Dried Peas"))
+
+    def test_reclassify(self):
+        engine = sa.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+        db_session = session_factory()
+        for item_num, ingredients in enumerate(["chicken, rice", "chicken, oats", "beef, barley", "lamb, rice"]):
+            db_session.add(Food(item_num=item_num, url=str(item_num), name=str(item_num), ingredients=ingredients,
+                                lifestage="Adult", fda_guidelines=True))
+        db_session.commit()
+        db_session.close()
+
+        # rice added to the bad ingredients
+        classifier = IngredientClassifier(bad_ingredient_keywords=("rice",))
+        self.assertEqual((4, 2), reclassify(session_factory, classifier, chunk_size=3))
+        db_session = session_factory()
+        self.assertEqual([0, 3], [food.item_num for food in db_session.query(Food).filter_by(fda_guidelines=False)])
+        db_session.close()
+        self.assertEqual((4, 0), reclassify(session_factory, classifier, chunk_size=3))
+        engine.dispose()
@@ -0,0 +1,128 @@
+from unittest import TestCase
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ingredient_index import IngredientIndex, split_ingredients
+from models import Diet, Food, FoodIngredient, FoodSummary, Ingredient
+
+
+class TestSplitIngredients(TestCase):
+
+    def test_split(self):
+        ingredients = "Deboned Chicken, Chicken Meal (preserved with Mixed Tocopherols, a source of Vitamin E), " \
+                      "Peas, Vitamins [Vitamin E Supplement, Niacin (Vitamin B3)], Salt."
+        self.assertEqual(["deboned chicken", "chicken meal", "peas", "vitamins", "salt"],
+                         [name for offset, name in split_ingredients(ingredients)])
+        self.assertEqual(ingredients.index("Peas"), split_ingredients(ingredients)[2][0])
+        self.assertEqual([(0, "chicken"), (9, "rice")], split_ingredients("Chicken, Rice (brown"))
+
+
+class RacingSession:
+    """
+    database session whose first lookup misses ingredients another writer enters straight after it
+    """
+
+    def __init__(self, db_session, names: list):
+        self.db_session = db_session
+        self.names: list = names
+
+    def query(self, *entities):
+        if not self.names:
+            return self.db_session.query(*entities)
+        self.db_session.execute(Ingredient.__table__.insert(), [{"name": name} for name in self.names])
+        self.names = []
+        return self.db_session.query(*entities).filter(sa.false())
+
+    def execute(self, *args, **kwargs):
+        return self.db_session.execute(*args, **kwargs)
+
+
+class TestIngredientIndex(TestCase):
+
+    def setUp(self) -> None:
+        self.engine = sa.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        # a database from before the index - no index tables, and no index on diets
+        Food.__table__.create(self.engine)
+        Diet.__table__.create(self.engine)
+        for index in Diet.__table__.indexes:
+            index.drop(self.engine)
+        self.session_factory = sessionmaker(bind=self.engine)
+        self.index = IngredientIndex()
+        self.index.create_tables(self.engine)
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    @staticmethod
+    def food_row(item_num: int, ingredients: str) -> dict:
+        return {"item_num": item_num, "url": str(item_num), "name": str(item_num), "ingredients": ingredients,
+                "brand": None, "xsm_breed": False, "sm_breed": True, "md_breed": True, "lg_breed": False,
+                "xlg_breed": False, "food_form": "Dry Food", "lifestage": "Adult", "fda_guidelines": True}
+
+    def insert(self, food_rows: list, diets: list) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(Food.__table__.insert(), food_rows)
+            for food_row, food_diets in zip(food_rows, diets):
+                for diet in food_diets:
+                    connection.execute(Diet.__table__.insert(), {"diet": diet, "item_num_id": food_row["item_num"]})
+
+    def query(self, *columns, **filters) -> list:
+        db_session = self.session_factory()
+        try:
+            return [tuple(row) for row in db_session.query(*columns).filter_by(**filters)]
+        finally:
+            db_session.close()
+
+    def ingredients_of(self, item_num: int) -> list:
+        db_session = self.session_factory()
+        try:
+            return [tuple(row) for row in db_session.query(FoodIngredient.position, Ingredient.name,
+                                                           FoodIngredient.main).join(Ingredient).filter(
+                FoodIngredient.item_num_id == item_num).order_by(FoodIngredient.position)]
+        finally:
+            db_session.close()
+
+    def test_create_tables(self):
+        indexes = {index["name"] for index in sa.inspect(self.engine).get_indexes(Diet.__tablename__)}
+        self.assertIn("ix_food_search_diet_diet_item_num", indexes)
+        self.index.create_tables(self.engine)  # nothing left to create
+
+    def test_index_foods(self):
+        food_rows = [self.food_row(1, "Chicken, Peas, Zinc Sulfate, Salt"), self.food_row(2, "Beef, Peas")]
+        self.insert(food_rows, [["Grain-Free", "Gluten Free"], []])
+        self.assertTrue(self.index.index_foods(self.session_factory, food_rows, [["Grain-Free", "Gluten Free"], []]))
+
+        self.assertEqual([(1, "chicken", True), (2, "peas", True), (3, "zinc sulfate", False), (4, "salt", False)],
+                         self.ingredients_of(1))
+        self.assertEqual([(1, 0b110, "Gluten Free, Grain-Free", 2, 4, 2), (2, 0b110, "", 0, 2, 2)],
+                         sorted(self.query(FoodSummary.item_num, FoodSummary.breed_sizes, FoodSummary.diets,
+                                           FoodSummary.diet_count, FoodSummary.ingredient_count,
+                                           FoodSummary.main_ingredient_count)))
+
+        # indexing a food again replaces its rows, and reuses known ingredients
+        food_rows[0]["ingredients"] = "Chicken, Rice"
+        self.assertTrue(self.index.index_foods(self.session_factory, food_rows[:1], [[]]))
+        self.assertEqual([(1, "chicken", True), (2, "rice", True)], self.ingredients_of(1))
+        self.assertEqual(1, len(self.query(Ingredient.id, name="chicken")))
+
+    def test_rebuild(self):
+        food_rows = [self.food_row(item_num, "Chicken, Oats") for item_num in range(5)]
+        self.insert(food_rows, [["Grain-Free"]] * 5)
+        self.index.index_foods(self.session_factory, [self.food_row(99, "Lamb")], [[]])  # not in the database
+
+        self.assertEqual(5, self.index.rebuild(self.session_factory, chunk_size=2))
+        self.assertEqual(10, len(self.query(FoodIngredient.position)))
+        self.assertEqual([("Grain-Free",)] * 5, self.query(FoodSummary.diets))
+        self.assertEqual([], self.query(Ingredient.id, name="lamb"))  # no longer listed by any food
+
+    def test_ingredients_entered_meanwhile(self):
+        db_session = self.session_factory()
+        try:
+            ids = IngredientIndex._ingredient_ids(RacingSession(db_session, ["peas"]), {"chicken", "peas"})
+            db_session.commit()
+        finally:
+            db_session.close()
+        self.assertEqual({"chicken", "peas"}, set(ids))
+        self.assertEqual(sorted(ids.values()), sorted(row[0] for row in self.query(Ingredient.id)))
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from known_foods import KnownFoodIndex
+from models import Food
+
+FOOD_URL = "https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152233"
+OTHER_FOOD_URL = "https://www.chewy.com/blue-buffalo-life-protection/dp/32132"
+
+
+class TestKnownFoodIndex(TestCase):
+
+    def setUp(self) -> None:
+        self.engine = sa.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        self.session_factory = sessionmaker(bind=self.engine)
+        self.index = KnownFoodIndex()
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def insert_food(self, item_num: int, url: str) -> None:
+        db_session = self.session_factory()
+        db_session.add(Food(item_num=item_num, url=url, name=str(item_num), ingredients="Chicken", lifestage="Adult",
+                            food_form="Dry"))
+        db_session.commit()
+        db_session.close()
+
+    def test_load(self):
+        Food.__table__.create(self.engine)
+        for item_num in range(5):
+            self.insert_food(item_num, "https://www.chewy.com/food-{0}/dp/{0}".format(item_num))
+        self.index.load(self.session_factory, chunk_size=2)
+
+        self.assertTrue(self.index.loaded)
+        self.assertTrue(all(self.index.has_item_num(item_num) for item_num in range(5)))
+        self.assertFalse(self.index.has_item_num(5))
+        self.assertTrue(self.index.has_url("https://www.chewy.com/food-4/dp/4"))
+        self.assertFalse(self.index.has_url("https://www.chewy.com/food-5/dp/5"))
+
+    def test_urls_are_canonical(self):
+        Food.__table__.create(self.engine)
+        self.insert_food(152233, FOOD_URL)
+        self.index.load(self.session_factory)
+
+        # any size of a food, with or without a query, is the same food
+        self.assertTrue(self.index.has_url(FOOD_URL))
+        self.assertTrue(self.index.has_url("https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152234"))
+        self.assertTrue(self.index.has_url(FOOD_URL + "?utm_source=x"))
+        self.assertFalse(self.index.has_url(OTHER_FOOD_URL))
+
+    def test_add_rows(self):
+        Food.__table__.create(self.engine)
+        self.index.load(self.session_factory)
+        self.assertFalse(self.index.has_url(OTHER_FOOD_URL))
+
+        # foods entered while scraping are known straight away
+        self.index.add_rows([{"url": OTHER_FOOD_URL, "item_num": 32132}])
+        self.assertTrue(self.index.has_url(OTHER_FOOD_URL + "?size=25"))
+        self.assertTrue(self.index.has_item_num(32132))
+
+    def test_unsure_until_loaded(self):
+        self.assertIsNone(self.index.has_url(FOOD_URL))
+        self.assertIsNone(self.index.has_item_num(152233))
+
+        # foods added before loading don't make the index sure of foods it hasn't seen
+        self.index.add_rows([{"url": OTHER_FOOD_URL, "item_num": 32132}])
+        self.assertIsNone(self.index.has_url(FOOD_URL))
+
+        # a failed load leaves the index unsure, so callers keep checking the database
+        self.index.load(self.session_factory)  # no food table
+        self.assertFalse(self.index.loaded)
+        self.assertIsNone(self.index.has_url(FOOD_URL))
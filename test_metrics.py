@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from metrics import Histogram, ScrapeMetrics
+
+
+class TestHistogram(TestCase):
+
+    def test_quantiles(self):
+        histogram = Histogram(buckets=(0.1, 1.0, 10.0))
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in (0.05, 0.5, 0.5, 5.0, 50.0):
+            histogram.observe(value)
+        self.assertEqual([1, 2, 1, 1], histogram.counts)
+        self.assertEqual(1.0, histogram.quantile(0.5))
+        self.assertEqual(10.0, histogram.quantile(0.99))
+        self.assertAlmostEqual(56.05, histogram.sum)
+
+
+class TestScrapeMetrics(TestCase):
+
+    def test_snapshot_and_prometheus(self):
+        metrics = ScrapeMetrics()
+        metrics.observe("request", 0.2)
+        with metrics.time("parse"):
+            pass
+        metrics.count("bytes_downloaded", 1000)
+        metrics.count("responses", label=200)
+        metrics.count("responses", label=200)
+        metrics.count("responses", label=404)
+        metrics.add_gauge("queue_depth", lambda: 7)
+        metrics.sample()
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(1, snapshot["stages"]["request"]["count"])
+        self.assertEqual(1, snapshot["stages"]["parse"]["count"])
+        self.assertEqual({"bytes_downloaded": 1000, "responses": {"200": 2, "404": 1}}, snapshot["counters"])
+        self.assertEqual(7, snapshot["samples"][-1]["queue_depth"])
+
+        text = metrics.prometheus()
+        self.assertIn('scraper_stage_seconds_bucket{stage="request",le="0.25"} 1\n', text)
+        self.assertIn('scraper_stage_seconds_bucket{stage="request",le="+Inf"} 1\n', text)
+        self.assertIn('scraper_responses_total{status="200"} 2\n', text)
+        self.assertIn("scraper_bytes_downloaded_total 1000\n", text)
+        self.assertIn("scraper_queue_depth 7\n", text)
+
+    def test_worker_utilization(self):
+        metrics = ScrapeMetrics()
+        metrics.set_workers(2)
+        metrics.sample()
+        metrics.worker_busy()
+        metrics.worker_busy()
+        self.assertEqual(2, metrics.sample()["busy_workers"])
+        metrics.worker_idle()
+        metrics.worker_idle()
+        sample = metrics.sample()
+        self.assertEqual(0, sample["busy_workers"])
+        self.assertGreater(sample["utilization"], 0)
+        self.assertLessEqual(sample["utilization"], 1)
+        self.assertEqual(0, metrics.sample()["utilization"])
+
+    def test_writes_files_on_stop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, "metrics.json")
+            prometheus_path = os.path.join(directory, "metrics.prom")
+            metrics = ScrapeMetrics(interval=60, json_path=json_path, prometheus_path=prometheus_path)
+            metrics.start()
+            metrics.count("retries")
+            metrics.stop()
+
+            with open(json_path) as file:
+                self.assertEqual({"retries": 1}, json.load(file)["counters"])
+            with open(prometheus_path) as file:
+                self.assertIn("scraper_retries_total 1\n", file.read())
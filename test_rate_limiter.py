@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from rate_limiter import RateLimiter, TokenBucket
+
+
+class TestTokenBucket(TestCase):
+
+    def test_reserve(self):
+        bucket = TokenBucket(rate=2, burst=2)
+        now = bucket.last
+
+        # burst is handed out immediately, later permits queue up behind it at 1 / rate seconds apart
+        self.assertEqual(0.0, bucket.reserve(now))
+        self.assertEqual(0.0, bucket.reserve(now))
+        self.assertAlmostEqual(0.5, bucket.reserve(now))
+        self.assertAlmostEqual(1.0, bucket.reserve(now))
+
+        # tokens refill over time, up to the burst size
+        self.assertEqual(0.0, bucket.reserve(now + 10))
+        self.assertEqual(0.0, bucket.reserve(now + 10))
+        self.assertAlmostEqual(0.5, bucket.reserve(now + 10))
+
+
+class TestRateLimiter(TestCase):
+
+    def test_reserve_per_proxy(self):
+        limiter = RateLimiter(proxy_rate=1)
+
+        # each proxy has its own bucket
+        self.assertEqual(0.0, limiter.reserve("proxy1", "www.chewy.com"))
+        self.assertEqual(0.0, limiter.reserve("proxy2", "www.chewy.com"))
+        self.assertGreater(limiter.reserve("proxy1", "www.chewy.com"), 0.9)
+
+    def test_reserve_per_host(self):
+        limiter = RateLimiter(host_rate=1)
+
+        # the host bucket limits requests through every proxy
+        self.assertEqual(0.0, limiter.reserve("proxy1", "www.chewy.com"))
+        self.assertGreater(limiter.reserve("proxy2", "www.chewy.com"), 0.9)
+        self.assertEqual(0.0, limiter.reserve("proxy1", "www.google.com"))
+
+    def test_reserve_direct(self):
+        limiter = RateLimiter(proxy_rate=1, direct_rate=2)
+
+        # requests without a proxy are limited to their own rate
+        self.assertEqual(0.0, limiter.reserve("direct", "www.chewy.com"))
+        self.assertAlmostEqual(0.5, limiter.reserve("direct", "www.chewy.com"), places=2)
+        self.assertEqual(0.0, limiter.reserve("proxy1", "www.chewy.com"))
+        self.assertGreater(limiter.reserve("proxy1", "www.chewy.com"), 0.9)
+
+        # and to proxy_rate by default
+        limiter = RateLimiter(proxy_rate=1)
+        limiter.reserve("direct", "www.chewy.com")
+        self.assertGreater(limiter.reserve("direct", "www.chewy.com"), 0.9)
+
+    def test_wait_time_snapshot(self):
+        limiter = RateLimiter(proxy_rate=100)
+        limiter.acquire("proxy1", "www.chewy.com")
+        limiter.acquire("proxy1", "www.chewy.com")
+
+        waits = list(limiter.wait_time_snapshot().values())
+        self.assertEqual(1, len(waits))
+        self.assertEqual(2, waits[0]["permits"])
+        self.assertGreater(waits[0]["wait_seconds"], 0)
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import requests
+
+from response_archive import ResponseArchive
+
+
+class TestResponseArchive(TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.archive = ResponseArchive(self.dir.name, segment_bytes=200)
+
+    def tearDown(self) -> None:
+        self.archive.close()
+        self.dir.cleanup()
+
+    @staticmethod
+    def make_response(content: bytes, status_code: int = 200) -> requests.models.Response:
+        r = requests.models.Response()
+        r.status_code = status_code
+        r._content = content
+        r.headers["Content-Type"] = "text/html"
+        return r
+
+    def test_record_and_read(self):
+        url = "https://www.chewy.com/earthborn-holistic-great-plains-feast/dp/36412"
+        self.archive.record(url, self.make_response(b"<html>first\n</html>"))
+        self.archive.record(url + "?size=25", self.make_response(b"<html>second</html>"))
+        self.archive.record("https://www.chewy.com/s?page=1", self.make_response(b"", status_code=429))
+        self.archive.close()
+
+        responses = list(self.archive.responses())
+        self.assertEqual([200, 200, 429], [r.status_code for r in responses])
+        self.assertEqual(b"<html>first\n</html>", responses[0].content)
+        self.assertEqual("text/html", responses[0].headers["content-type"])
+        self.assertEqual(2, len(self.archive.segments()))  # rolled over once the first segment passed 200 bytes
+
+        # only the latest response of each page, matched by canonical url
+        latest = list(self.archive.latest_responses(lambda url: "/dp/" in url))
+        self.assertEqual([b"<html>second</html>"], [r.content for r in latest])
+
+    def test_truncated_record(self):
+        self.archive.segment_bytes = 1024 * 1024
+        for i in range(3):
+            self.archive.record("https://www.chewy.com/food/dp/{}".format(i), self.make_response(os.urandom(100)))
+        self.archive.close()
+
+        segment = self.archive.segments()[0]
+        with open(segment, "rb") as file:
+            data = file.read()
+        with open(segment, "wb") as file:
+            file.write(data[:-20])
+
+        self.assertEqual(2, len(list(self.archive.responses())))
+        self.assertEqual(1, self.archive.truncated)
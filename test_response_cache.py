@@ -0,0 +1,87 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import requests
+
+from response_cache import ResponseCache
+
+
+class TestResponseCache(TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.dir.name, "responses.sqlite"), ttls={"search": 0, "food": 60})
+
+    def tearDown(self) -> None:
+        self.cache.close()
+        self.dir.cleanup()
+
+    @staticmethod
+    def make_response(content: bytes, etag: str = None) -> requests.models.Response:
+        r = requests.models.Response()
+        r.status_code = 200
+        r._content = content
+        if etag is not None:
+            r.headers["ETag"] = etag
+        return r
+
+    def test_store_and_lookup(self):
+        url = "https://www.chewy.com/earthborn-holistic-great-plains-feast/dp/36412"
+        self.assertIsNone(self.cache.lookup(url))
+
+        self.cache.store(url, self.make_response(b"<html>food</html>", etag='"abc"'))
+        cached = self.cache.lookup(url)
+        self.assertTrue(self.cache.is_fresh(url, cached))
+        self.assertEqual({"If-None-Match": '"abc"'}, self.cache.conditional_headers(cached))
+
+        r = self.cache.hit(url, cached)
+        self.assertEqual(b"<html>food</html>", r.content)
+        self.assertEqual(200, r.status_code)
+        self.assertTrue(r.from_cache)
+
+    def test_truncated_not_stored(self):
+        url = "https://www.chewy.com/earthborn-holistic-great-plains-feast/dp/36412"
+        r = self.make_response(b"<html>fo")
+        r.truncated = True
+        self.cache.store(url, r)
+        self.assertIsNone(self.cache.lookup(url))
+
+    def test_ttl_per_page_type(self):
+        url = "https://www.chewy.com/s?rh=c%3A288%2Cc%3A332&page=1"
+        self.cache.store(url, self.make_response(b"<html>search</html>"))
+        self.assertFalse(self.cache.is_fresh(url, self.cache.lookup(url)))
+
+    def test_lru_eviction(self):
+        self.cache.max_bytes = 100
+        for i in range(5):
+            self.cache.store("https://www.chewy.com/food-{}/dp/1".format(i), self.make_response(os.urandom(40)))
+        self.assertLessEqual(self.cache.total_bytes, 100)
+        self.assertIsNotNone(self.cache.lookup("https://www.chewy.com/food-4/dp/1"))
+        self.assertIsNone(self.cache.lookup("https://www.chewy.com/food-0/dp/1"))
+
+    def test_access_times_batched(self):
+        self.cache.access_batch = 3
+        urls = ["https://www.chewy.com/food-{}/dp/1".format(i) for i in range(3)]
+        for url in urls:
+            self.cache.store(url, self.make_response(b"<html></html>"))
+        stored = {url: self.last_access(url) for url in urls}
+
+        # hits are written once access_batch of them have been served
+        for url in urls[:2]:
+            self.cache.hit(url, self.cache.lookup(url))
+        self.assertEqual(stored, {url: self.last_access(url) for url in urls})
+        self.cache.hit(urls[2], self.cache.lookup(urls[2]))
+        self.assertTrue(all(self.last_access(url) > stored[url] for url in urls))
+        self.assertEqual(3, self.cache.hits)
+
+        # and before anything is evicted, so the response just served is kept
+        self.cache.hit(urls[0], self.cache.lookup(urls[0]))
+        self.cache.max_bytes = self.cache.total_bytes
+        self.cache.store("https://www.chewy.com/food-3/dp/1", self.make_response(b"<html></html>"))
+        self.assertIsNotNone(self.cache.lookup(urls[0]))
+        self.assertIsNone(self.cache.lookup(urls[1]))
+
+    def last_access(self, url: str) -> float:
+        with self.cache.lock:
+            return self.cache.db.execute("SELECT last_access FROM responses WHERE url = ?", (url,)).fetchone()[0]
@@ -0,0 +1,59 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from retry_policy import DeadLetters, RetryPolicy, RetryRule
+
+
+class TestRetryPolicy(TestCase):
+
+    def test_classify_status(self):
+        self.assertEqual("banned", RetryPolicy.classify_status(403))
+        self.assertEqual("throttled", RetryPolicy.classify_status(429))
+        self.assertEqual("throttled", RetryPolicy.classify_status(503))
+        self.assertEqual("server", RetryPolicy.classify_status(502))
+        self.assertEqual("http", RetryPolicy.classify_status(404))
+
+    def test_should_retry(self):
+        policy = RetryPolicy(rules={"timeout": RetryRule(3)})
+        self.assertTrue(policy.should_retry("timeout", 1))
+        self.assertTrue(policy.should_retry("timeout", 2))
+        self.assertFalse(policy.should_retry("timeout", 3))
+        self.assertFalse(policy.should_retry("http", 1))
+        self.assertEqual(2, policy.retries)
+
+    def test_retry_budget(self):
+        policy = RetryPolicy(budget_ratio=0.5, max_budget=2)
+        self.assertTrue(policy.should_retry("timeout", 1))
+        self.assertTrue(policy.should_retry("timeout", 1))
+        self.assertFalse(policy.should_retry("timeout", 1))
+        self.assertEqual(1, policy.budget_refusals)
+
+        # retries are earned back by requests, up to the maximum budget
+        policy.record_request()
+        policy.record_request()
+        self.assertTrue(policy.should_retry("timeout", 1))
+        for _ in range(10):
+            policy.record_request()
+        self.assertEqual(2, policy.budget)
+
+    def test_delay(self):
+        policy = RetryPolicy(rules={"server": RetryRule(5, base_delay=1, max_delay=3)})
+        for attempt in range(1, 5):
+            self.assertLessEqual(policy.delay("server", attempt), min(3, 2 ** (attempt - 1)))
+        self.assertEqual(10, policy.delay("server", 1, retry_after="10"))
+
+
+class TestDeadLetters(TestCase):
+
+    def test_add_and_drain(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dead_letters = DeadLetters(os.path.join(directory, "dead_letters.jsonl"))
+            self.assertEqual([], dead_letters.drain())
+
+            dead_letters.add("https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152233", "timeout")
+            dead_letters.add("https://www.chewy.com/s?rh=c%3A288%2Cc%3A332&page=2", "server")
+            dead_letters.add("https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152233", "timeout")
+            self.assertEqual(["https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152233",
+                              "https://www.chewy.com/s?rh=c%3A288%2Cc%3A332&page=2"], dead_letters.drain())
+            self.assertEqual([], dead_letters.drain())
@@ -0,0 +1,83 @@
+import queue
+import threading
+from unittest import TestCase
+
+from scheduler import JobScheduler
+
+
+class TestJobScheduler(TestCase):
+
+    @staticmethod
+    def make_scheduler(**kwargs) -> JobScheduler:
+        return JobScheduler(lambda job: job[0], ["follow_up", "search", "food"], **kwargs)
+
+    def test_priorities(self):
+        scheduler = self.make_scheduler()
+        scheduler.put(("food", 1))
+        scheduler.put(("search", 1))
+        scheduler.put(("food", 2))
+        scheduler.put(("follow_up", 1))
+        self.assertEqual([("follow_up", 1), ("search", 1), ("food", 1), ("food", 2)],
+                         [scheduler.get() for _ in range(4)])
+        self.assertTrue(scheduler.empty())
+
+    def test_in_flight_caps(self):
+        scheduler = self.make_scheduler(in_flight_caps={"search": 1})
+        scheduler.put(("search", 1))
+        scheduler.put(("search", 2))
+        scheduler.put(("food", 1))
+
+        # the second search page waits for the first to be done
+        search = scheduler.get()
+        self.assertEqual(("food", 1), scheduler.get())
+        self.assertRaises(queue.Empty, scheduler.get, block=False)
+        scheduler.task_done(search)
+        self.assertEqual(("search", 2), scheduler.get())
+
+    def test_sources_are_drawn_lazily(self):
+        scheduler = self.make_scheduler(refill_below=2)
+        drawn = []
+
+        def source():
+            for page in range(1, 6):
+                drawn.append(page)
+                yield "search", page
+
+        scheduler.add_source(source())
+        self.assertEqual(("search", 1), scheduler.get())
+        self.assertEqual([1, 2], drawn)
+        self.assertFalse(scheduler.empty())
+
+    def test_join_and_stop(self):
+        scheduler = self.make_scheduler(refill_below=1)
+        scheduler.add_source([("search", 1), ("search", 2)])
+        for _ in range(2):
+            job = scheduler.get()
+            scheduler.task_done(job)
+        scheduler.join()
+
+        # stop sentinels are only handed out once every job is done
+        scheduler.put(None)
+        self.assertIsNone(scheduler.get())
+
+    def test_expected_jobs(self):
+        scheduler = self.make_scheduler()
+        scheduler.put(("search", 1))
+        job = scheduler.get()
+
+        # the job's follow-up is counted before it is added, so join waits for it
+        scheduler.expect()
+        scheduler.put(None)
+        scheduler.task_done(job)
+        joined = threading.Event()
+        thread = threading.Thread(target=lambda: (scheduler.join(), joined.set()))
+        thread.start()
+        self.assertFalse(joined.wait(0.05))
+        self.assertRaises(queue.Empty, scheduler.get, block=False)
+
+        scheduler.put_expected(("follow_up", 1))
+        self.assertEqual(("follow_up", 1), scheduler.get())
+        scheduler.task_done()
+        thread.join(1)
+        self.assertTrue(joined.is_set())
+        self.assertIsNone(scheduler.get())
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from scraper_logger import QueuedScraperLogger, ScraperLogger
+
+
+class TestScraperLogger(TestCase):
+
+    def test_timestamps(self):
+        local = time.localtime()
+        self.assertEqual("{}-{}-{}".format(local[0], local[1], local[2]), ScraperLogger.get_date())
+        self.assertRegex(ScraperLogger.get_time(), r"^\d{1,2}:\d{1,2}:\d{1,2}$")
+
+
+class TestQueuedScraperLogger(TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def read_log(self, logger: QueuedScraperLogger) -> str:
+        with open(logger.logfile_name) as logfile:
+            return logfile.read()
+
+    def test_text_lines(self):
+        logger = QueuedScraperLogger(directory=self.dir.name)
+        logger.scrape_food("https://www.chewy.com/earthborn-holistic-great-plains-feast/dp/36412")
+        logger.error("Error checking food")
+        logger.message("Inserted 1 foods in 1 transactions")
+        logger.close()
+
+        log = self.read_log(logger)
+        self.assertIn(" - Scraping food details from URL: "
+                      "https://www.chewy.com/earthborn-holistic-great-plains-feast/dp/36412\n\n", log)
+        self.assertIn(" - Error checking food\n", log)
+        self.assertTrue(log.endswith("Inserted 1 foods in 1 transactions\n"))
+
+    def test_json_lines(self):
+        logger = QueuedScraperLogger(directory=self.dir.name, json_lines=True, verbose=False)
+        logger.scrape_food("https://www.chewy.com/earthborn-holistic-great-plains-feast/dp/36412")
+        logger.make_request("https://www.chewy.com/", "Mozilla/5.0", {})
+        logger.error("Error checking food")
+        logger.close()
+
+        records = [json.loads(line) for line in self.read_log(logger).splitlines()]
+        self.assertEqual([{"event": "error", "msg": "Error checking food"}],
+                         [{key: value for key, value in record.items() if key != "time"} for record in records])
+
+    def test_rotation(self):
+        logger = QueuedScraperLogger(directory=self.dir.name, max_bytes=100, backup_count=2, flush_interval=0)
+        for i in range(20):
+            logger.message("message {} padded out to be a fairly long line".format(i))
+            time.sleep(0.01)
+        logger.close()
+
+        self.assertTrue(os.path.exists(logger.logfile_name + ".1"))
+        self.assertTrue(os.path.exists(logger.logfile_name + ".2"))
+        self.assertFalse(os.path.exists(logger.logfile_name + ".3"))
+        # the newest messages are in the log file, or the most recent backup if the last write filled it
+        with open(logger.logfile_name + ".1") as backup:
+            self.assertIn("message 19", self.read_log(logger) + backup.read())
@@ -0,0 +1,317 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+from benchmarks.chewy_standin import ChewyStandIn, FIRST_ITEM_NUM
+from concurrency import ConcurrencyController
+from models import Base, Diet, Food, FoodFingerprint
+from rate_limiter import RateLimiter
+from response_archive import ResponseArchive
+from response_cache import ResponseCache
+from scraper import Scraper, canonical_url
+from session_builder.proxy_inventory import ProxyInventory
+from session_builder.session_builder import SessionBuilder
+
+
+class ChangingStandIn(ChewyStandIn):
+    """
+    stand-in whose foods can be renamed, and search pages emptied, between scrapes
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.renamed = dict()  # item number -> new name
+        self.emptied = set()  # numbers of search pages served with an empty body
+
+    def search_page(self, page: int) -> str:
+        return "" if page in self.emptied else super().search_page(page)
+
+    def food_page(self, item_num: int) -> str:
+        html = super().food_page(item_num)
+        if item_num in self.renamed:
+            html = html.replace("{} #{}".format(self.food_name, item_num), self.renamed[item_num])
+        return html
+
+
+class StandInScrapeTest(TestCase):
+    """
+    scrapes of a local stand-in for Chewy.com into an SQLite database, without proxies or rate limits
+    """
+
+    standin_options = dict(pages=1, foods_per_page=4)
+    scraper_class = Scraper
+    scraper_options = dict(num_threads=2)
+
+    def setUp(self) -> None:
+        self.standin = ChangingStandIn(**self.standin_options)
+        self.standin.start()
+        self.dir = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.dir.name, "standin.sqlite")
+        self.scrapers = []
+
+    def tearDown(self) -> None:
+        for scraper in self.scrapers:
+            scraper.engine.dispose()
+            if scraper.response_cache is not None:
+                scraper.response_cache.close()
+        self.standin.stop()
+        self.dir.cleanup()
+
+    def new_scraper(self, database=None, **kwargs):
+        session_builder = SessionBuilder(no_proxy_policy="direct",
+                                         inventory=ProxyInventory(None, path=os.path.join(self.dir.name, "proxies")))
+        options = dict(force=True, rate_limiter=RateLimiter(), session_builder=session_builder, **self.scraper_options)
+        options.update(kwargs)
+        scraper = self.scraper_class(database or self.database, **options)
+        Base.metadata.create_all(scraper.engine)
+        self.scrapers.append(scraper)
+        return scraper
+
+    def new_cache(self, **kwargs):
+        return ResponseCache(os.path.join(self.dir.name, "responses.sqlite"), **kwargs)
+
+    def food_url(self, item_num: int, size: int = None) -> str:
+        """
+        :param size: item number of the size of the food shown on its page, defaults to the food's own
+        """
+        return "{}/standin-food-{}/dp/{}".format(self.standin.base_url, item_num, size or item_num)
+
+    def item_nums(self) -> list:
+        return list(range(FIRST_ITEM_NUM, FIRST_ITEM_NUM + self.standin.total_foods))
+
+    def rows(self, scraper, model) -> list:
+        db_session = scraper.session_factory()
+        try:
+            return db_session.query(model).all()
+        finally:
+            db_session.close()
+
+    def names(self, scraper) -> dict:
+        return {food.item_num: food.name for food in self.rows(scraper, Food)}
+
+    def diet_items(self, scraper) -> set:
+        return {(diet.item_num_id, diet.diet) for diet in self.rows(scraper, Diet)}
+
+    def counter(self, scraper, name: str):
+        return scraper.metrics.snapshot()["counters"].get(name, 0)
+
+
+class TestRefresh(StandInScrapeTest):
+
+    def test_refresh_updates_changed_foods(self):
+        self.new_scraper().scrape(self.standin.search_url)
+        self.assertEqual(self.item_nums(), sorted(self.names(self.scrapers[0])))
+        diets = self.diet_items(self.scrapers[0])
+
+        self.standin.renamed[FIRST_ITEM_NUM + 1] = "Renamed Recipe"
+        scraper = self.new_scraper(force=False, refresh=True)
+        scraper.scrape(self.standin.search_url)
+        names = self.names(scraper)
+        self.assertEqual("Renamed Recipe", names[FIRST_ITEM_NUM + 1])
+        self.assertEqual(1, self.counter(scraper, "foods_updated"))
+        self.assertEqual(3, self.counter(scraper, "skips")["unchanged"])
+        self.assertEqual(diets, self.diet_items(scraper))
+
+    def test_refresh_revalidates_fresh_cached_pages(self):
+        self.new_scraper(response_cache=self.new_cache()).scrape(self.standin.search_url)
+
+        # the cached food pages are still fresh, but a refresh run asks the site anyway, and only parses changed pages
+        self.standin.renamed[FIRST_ITEM_NUM] = "Renamed Recipe"
+        self.standin.reset_counts()
+        scraper = self.new_scraper(force=False, refresh=True, response_cache=self.new_cache())
+        scraper.scrape(self.standin.search_url)
+        self.assertEqual("Renamed Recipe", self.names(scraper)[FIRST_ITEM_NUM])
+        self.assertEqual(1, self.counter(scraper, "foods_updated"))
+        self.assertEqual(0, self.counter(scraper, "cache_hits"))
+        self.assertEqual(3 + 1, self.standin.statuses[304])  # unchanged foods, and the first page of search results
+        self.assertEqual(3, self.counter(scraper, "skips")["unchanged"])
+
+    def test_refresh_from_fresh_cache_hit_is_parsed(self):
+        self.new_scraper().scrape(self.standin.search_url)
+        scraper = self.new_scraper(refresh=True, response_cache=self.new_cache())
+        scraper._prepare_scrape()
+
+        # a cached copy served without asking the site may be out of date, so it is compared like a fetched page
+        url = self.food_url(FIRST_ITEM_NUM)
+        self.standin.renamed[FIRST_ITEM_NUM] = "Renamed Recipe"
+        scraper.response_cache.store(url, scraper._make_request(url))
+        hit = scraper.response_cache.hit(url, scraper.response_cache.lookup(url))
+        scraper._refresh_from_response(url, hit)
+        self.assertEqual("Renamed Recipe", self.names(scraper)[FIRST_ITEM_NUM])
+
+        revalidated = scraper.response_cache.revalidated(url, scraper.response_cache.lookup(url))
+        scraper._refresh_from_response(url, revalidated)
+        self.assertEqual(1, self.counter(scraper, "foods_updated"))
+        self.assertEqual(1, self.counter(scraper, "skips")["unchanged"])
+
+    def test_other_size_updates_stored_food(self):
+        self.new_scraper().scrape(self.standin.search_url)
+        scraper = self.new_scraper(refresh=True)
+        scraper._prepare_scrape()
+        fingerprints = {row.item_num: row.fingerprint for row in self.rows(scraper, FoodFingerprint)}
+
+        diets = self.diet_items(scraper)
+
+        # the page now shows another size of the food, with the item number of another food in the database - the
+        # food stored for the page is updated, and the other food is left alone
+        other_size = FIRST_ITEM_NUM + 3
+        self.standin.renamed[other_size] = "Renamed Recipe"
+        self.assertTrue(scraper.refresh_food(self.food_url(FIRST_ITEM_NUM, size=other_size)))
+        names = self.names(scraper)
+        self.assertEqual(self.item_nums(), sorted(names))
+        self.assertEqual("Renamed Recipe", names[FIRST_ITEM_NUM])
+        self.assertNotEqual("Renamed Recipe", names[other_size])
+        self.assertEqual(diets, self.diet_items(scraper))
+        updated = {row.item_num: row.fingerprint for row in self.rows(scraper, FoodFingerprint)}
+        self.assertEqual(sorted(fingerprints), sorted(updated))
+        self.assertNotEqual(fingerprints[FIRST_ITEM_NUM], updated[FIRST_ITEM_NUM])
+        self.assertEqual(fingerprints[other_size], updated[other_size])
+        self.assertEqual(updated[FIRST_ITEM_NUM], scraper.fingerprints[canonical_url(self.food_url(FIRST_ITEM_NUM))])
+        self.assertEqual(self.food_url(FIRST_ITEM_NUM),
+                         [food.url for food in self.rows(scraper, Food) if food.item_num == FIRST_ITEM_NUM][0])
+
+    def test_update_of_missing_food_rolls_back(self):
+        self.new_scraper().scrape(self.standin.search_url)
+        scraper = self.new_scraper(refresh=True)
+        scraper._prepare_scrape()
+        diets = self.diet_items(scraper)
+
+        # the food changed, and was deleted from the database since the fingerprints were loaded
+        url = self.food_url(FIRST_ITEM_NUM)
+        fingerprint = scraper.fingerprints[canonical_url(url)]
+        self.standin.renamed[FIRST_ITEM_NUM] = "Renamed Recipe"
+        food, food_diets = scraper._scrape_food_details(url)
+        db_session = scraper.session_factory()
+        db_session.query(Diet).filter_by(item_num_id=FIRST_ITEM_NUM).delete()
+        db_session.query(FoodFingerprint).filter_by(item_num=FIRST_ITEM_NUM).delete()
+        db_session.query(Food).filter_by(item_num=FIRST_ITEM_NUM).delete()
+        db_session.commit()
+        db_session.close()
+
+        self.assertFalse(scraper._update_in_db(url, food, food_diets, "0" * 40))
+        self.assertNotIn(FIRST_ITEM_NUM, self.names(scraper))
+        self.assertEqual({row for row in diets if row[0] != FIRST_ITEM_NUM}, self.diet_items(scraper))
+        self.assertNotIn(FIRST_ITEM_NUM, [row.item_num for row in self.rows(scraper, FoodFingerprint)])
+        self.assertEqual(0, self.counter(scraper, "foods_updated"))
+
+        # and a failed update leaves the fingerprint to compare against as it was
+        scraper._update_if_changed(url, food, food_diets)
+        self.assertEqual(fingerprint, scraper.fingerprints[canonical_url(url)])
+
+
+class TestReplay(StandInScrapeTest):
+
+    def test_replay(self):
+        archive = ResponseArchive(os.path.join(self.dir.name, "archive"))
+        scraped = self.new_scraper(archive=archive)
+        scraped.scrape(self.standin.search_url)
+        archive.close()
+        self.standin.reset_counts()
+
+        # into a new database, every archived food is entered
+        replayed = self.new_scraper(database=os.path.join(self.dir.name, "replayed.sqlite"))
+        replayed.replay(ResponseArchive(os.path.join(self.dir.name, "archive")))
+        self.assertEqual(self.names(scraped), self.names(replayed))
+        self.assertEqual(self.diet_items(scraped), self.diet_items(replayed))
+        self.assertEqual(len(self.item_nums()), len(self.rows(replayed, FoodFingerprint)))
+        self.assertEqual(len(self.item_nums()), self.counter(replayed, "foods_inserted"))
+
+        # into the database it was scraped into, every food is unchanged
+        diets = self.diet_items(scraped)
+        replayed = self.new_scraper()
+        replayed.replay(ResponseArchive(os.path.join(self.dir.name, "archive")))
+        self.assertEqual(self.names(scraped), self.names(replayed))
+        self.assertEqual(diets, self.diet_items(replayed))
+        self.assertEqual(0, self.counter(replayed, "foods_inserted"))
+        self.assertEqual(0, self.counter(replayed, "foods_updated"))
+        self.assertEqual(len(self.item_nums()), self.counter(replayed, "skips")["unchanged"])
+
+        # without making any requests
+        self.assertEqual(0, sum(self.standin.statuses.values()))
+
+
+class TestParsePool(StandInScrapeTest):
+
+    standin_options = dict(pages=2, foods_per_page=4)
+
+    def test_scrape_with_parse_processes(self):
+        scraped = self.new_scraper()
+        scraped.scrape(self.standin.search_url)
+
+        pooled = self.new_scraper(database=os.path.join(self.dir.name, "pooled.sqlite"), parse_processes=2)
+        pooled.scrape(self.standin.search_url)
+        self.assertIsNone(pooled.parse_pool)
+        self.assertEqual(self.names(scraped), self.names(pooled))
+        self.assertEqual(self.diet_items(scraped), self.diet_items(pooled))
+        self.assertEqual(0, pooled.scrape_queue.unfinished)
+
+
+class TestStreaming(StandInScrapeTest):
+
+    standin_options = dict(pages=2, foods_per_page=4)
+
+    def test_stream_stops_early(self):
+        scraped = self.new_scraper()
+        scraped.scrape(self.standin.search_url)
+
+        # pages are parsed as they download, and cut short once everything needed has been found
+        cache = self.new_cache()
+        streamed = self.new_scraper(database=os.path.join(self.dir.name, "streamed.sqlite"), stream=True,
+                                    response_cache=cache)
+        streamed.scrape(self.standin.search_url)
+        self.assertEqual(self.names(scraped), self.names(streamed))
+        self.assertEqual(self.diet_items(scraped), self.diet_items(streamed))
+        self.assertGreaterEqual(self.counter(streamed, "early_stops"), len(self.item_nums()))
+        self.assertLess(self.counter(streamed, "bytes_downloaded"), self.counter(scraped, "bytes_downloaded"))
+
+        # pages cut short aren't cached
+        for item_num in self.item_nums():
+            self.assertIsNone(cache.lookup(self.food_url(item_num)))
+
+
+class TestEmptyPages(StandInScrapeTest):
+
+    standin_options = dict(pages=2, foods_per_page=4)
+
+    def test_empty_search_page(self):
+        self.standin.emptied.add(2)
+        scraper = self.new_scraper()
+        scrape = threading.Thread(target=scraper.scrape, args=(self.standin.search_url,), daemon=True)
+        scrape.start()
+        scrape.join(timeout=30)
+
+        # an empty page has no results, and the scrape finishes with the foods of the other pages
+        self.assertFalse(scrape.is_alive())
+        self.assertEqual(self.item_nums()[:4], sorted(self.names(scraper)))
+        self.assertEqual(0, scraper.scrape_queue.unfinished)
+
+
+class FailingRateLimiter(RateLimiter):
+    """
+    rate limiter failing to hand out its first permit
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    def reserve(self, proxy: str, host: str) -> float:
+        if self.failures:
+            self.failures -= 1
+            raise Exception("no permit")
+        return super().reserve(proxy, host)
+
+
+class TestConcurrencySlots(StandInScrapeTest):
+
+    def test_slot_released_when_permit_fails(self):
+        scraper = self.new_scraper(concurrency=ConcurrencyController(floor=1, ceiling=1),
+                                   rate_limiter=FailingRateLimiter())
+        url = self.food_url(FIRST_ITEM_NUM)
+        self.assertEqual("unknown", scraper._attempt_request(url)[1])
+        self.assertEqual(0, scraper.concurrency.in_flight)
+        r, error = scraper._attempt_request(url)
+        self.assertIsNone(error)
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(0, scraper.concurrency.in_flight)
@@ -0,0 +1,28 @@
+from unittest import TestCase
+
+from url_frontier import CrawlFrontier, canonical_url
+
+
+class TestUrlFrontier(TestCase):
+
+    def test_canonical_url(self):
+        # the number after /dp/ selects a size of the product, so links to different sizes are the same food
+        self.assertEqual("https://www.chewy.com/adirondack-30-high-fat-puppy/dp",
+                         canonical_url("https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152233"))
+        self.assertEqual("https://www.chewy.com/adirondack-30-high-fat-puppy/dp",
+                         canonical_url("HTTPS://WWW.Chewy.com/adirondack-30-high-fat-puppy/dp/152234?utm=1#reviews"))
+
+        # search pages keep their query string
+        self.assertEqual("https://www.chewy.com/s?rh=c%3A288%2Cc%3A332&page=2",
+                         canonical_url("https://www.chewy.com/s?rh=c%3A288%2Cc%3A332&page=2"))
+
+    def test_add(self):
+        frontier = CrawlFrontier()
+        self.assertTrue(frontier.add("https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152233"))
+        self.assertFalse(frontier.add("https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152234"))
+        self.assertTrue(frontier.add("https://www.chewy.com/adirondack-21-adult-everyday-recipe/dp/152239"))
+        self.assertEqual(1, frontier.duplicates)
+
+        frontier.clear()
+        self.assertTrue(frontier.add("https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152233"))
+        self.assertEqual(0, frontier.duplicates)
@@ -0,0 +1,263 @@
+import os
+import queue
+import tempfile
+import threading
+from time import monotonic, sleep
+from unittest import TestCase
+
+from scheduler import SharedJobScheduler
+from work_queue import RedisWorkQueue, SqlWorkQueue
+
+SEARCH_URL = "https://www.chewy.com/s?rh=c%3A288%2Cc%3A332&page=2"
+FOOD_URL = "https://www.chewy.com/adirondack-30-high-fat-puppy/dp/152233"
+OTHER_FOOD_URL = "https://www.chewy.com/blue-buffalo-life-protection/dp/32132"
+
+
+class FakeRedis:
+    """
+    stand-in for the few Redis commands RedisWorkQueue uses, with expiring keys
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = dict()
+        self.expires = dict()
+
+    def _get(self, key, default):
+        if key in self.expires and self.expires[key] <= monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key)
+        return self.data.setdefault(key, default) if default is not None else self.data.get(key)
+
+    def sadd(self, key, member):
+        with self.lock:
+            members = self._get(key, set())
+            added = member not in members
+            members.add(member)
+            return int(added)
+
+    def lpush(self, key, value):
+        with self.lock:
+            self._get(key, []).insert(0, value)
+
+    def rpush(self, key, value):
+        with self.lock:
+            self._get(key, []).append(value)
+
+    def rpoplpush(self, source, destination):
+        with self.lock:
+            values = self._get(source, [])
+            if not values:
+                return None
+            value = values.pop()
+            self._get(destination, []).insert(0, value)
+            return value
+
+    def lrem(self, key, count, value):
+        with self.lock:
+            values = self._get(key, [])
+            if value in values:
+                values.remove(value)
+                return 1
+            return 0
+
+    def lrange(self, key, start, end):
+        with self.lock:
+            return list(self._get(key, []))
+
+    def llen(self, key):
+        with self.lock:
+            return len(self._get(key, []))
+
+    def set(self, key, value, px=None):
+        with self.lock:
+            self.data[key] = value
+            self.expires.pop(key, None)
+            if px is not None:
+                self.expires[key] = monotonic() + px / 1000
+
+    def get(self, key):
+        with self.lock:
+            return self._get(key, None)
+
+    def exists(self, key):
+        with self.lock:
+            return int(self._get(key, None) is not None)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+                self.expires.pop(key, None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def llen(self, key):
+        self.commands.append(key)
+
+    def execute(self):
+        with self.client.lock:
+            return [self.client.llen(key) for key in self.commands]
+
+
+class WorkQueueTests:
+    """
+    tests run against every kind of work queue - new_queue(owner, lease_seconds) returns a queue on the same store
+    """
+
+    def test_dedupe_and_priority(self):
+        work_queue = self.new_queue("a")
+        self.assertEqual(2, work_queue.put([(SEARCH_URL, "search", 1), (FOOD_URL, "food", 2)]))
+        # pages already queued this crawl aren't queued again, by any process
+        self.assertEqual(1, self.new_queue("b").put([(FOOD_URL + "?utm_source=x", "food", 2),
+                                                      (OTHER_FOOD_URL, "food", 0)]))
+        self.assertEqual(3, work_queue.waiting())
+
+        self.assertEqual((OTHER_FOOD_URL, "food"), work_queue.lease())
+        self.assertEqual((SEARCH_URL, "search"), work_queue.lease())
+        self.assertEqual((FOOD_URL, "food"), work_queue.lease())
+        self.assertIsNone(work_queue.lease())
+
+        # the crawl is only drained once every leased job is done
+        self.assertFalse(work_queue.drained())
+        for url in (OTHER_FOOD_URL, SEARCH_URL, FOOD_URL):
+            self.assertTrue(work_queue.ack(url))
+        self.assertTrue(work_queue.drained())
+        self.assertEqual(0, work_queue.put([(FOOD_URL, "food", 2)]))
+
+        # a new crawl forgets every page queued
+        work_queue.clear()
+        self.assertEqual(1, work_queue.put([(FOOD_URL, "food", 2)]))
+
+    def test_expired_leases_are_recovered(self):
+        dead = self.new_queue("dead", lease_seconds=0.05)
+        live = self.new_queue("live")
+        dead.put([(FOOD_URL, "food", 2)])
+        self.assertEqual((FOOD_URL, "food"), dead.lease())
+        self.assertIsNone(live.lease())
+        self.assertEqual(0, live.recover())
+
+        sleep(0.1)
+        self.assertEqual(1, live.recover())
+        self.assertEqual(1, live.recovered)
+        self.assertEqual((FOOD_URL, "food"), live.lease())
+
+        # the process whose lease expired no longer holds the job
+        self.assertFalse(dead.ack(FOOD_URL))
+        self.assertFalse(live.drained())
+        self.assertTrue(live.ack(FOOD_URL))
+        self.assertTrue(live.drained())
+
+    def test_concurrent_leases(self):
+        urls = ["https://www.chewy.com/food-{0}/dp/{0}".format(i) for i in range(40)]
+        self.new_queue("a").put([(url, "food", 2) for url in urls])
+        leased = []
+
+        def lease_all(owner):
+            work_queue = self.new_queue(owner)
+            while True:
+                job = work_queue.lease()
+                if job is None:
+                    return
+                leased.append(job[0])
+                work_queue.ack(job[0])
+
+        threads = [threading.Thread(target=lease_all, args=("worker-{}".format(i),)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(urls), sorted(leased))
+        self.assertTrue(self.new_queue("a").drained())
+
+
+class TestSqlWorkQueue(WorkQueueTests, TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "queue.sqlite")
+        self.queues = []
+
+    def tearDown(self) -> None:
+        for work_queue in self.queues:
+            work_queue.engine.dispose()
+        self.dir.cleanup()
+
+    def new_queue(self, owner, lease_seconds=300.0):
+        work_queue = SqlWorkQueue(self.path, lease_seconds=lease_seconds, owner=owner)
+        self.queues.append(work_queue)
+        return work_queue
+
+
+class TestRedisWorkQueue(WorkQueueTests, TestCase):
+
+    def setUp(self) -> None:
+        self.client = FakeRedis()
+
+    def new_queue(self, owner, lease_seconds=300.0):
+        return RedisWorkQueue(self.client, lease_seconds=lease_seconds, owner=owner)
+
+
+class TestSharedJobScheduler(TestCase):
+
+    @staticmethod
+    def search(url):
+        pass
+
+    @staticmethod
+    def food(url):
+        pass
+
+    @staticmethod
+    def follow_up(url):
+        pass
+
+    def new_scheduler(self, work_queue):
+        kinds = {"search": self.search, "food": self.food}
+        classes = {self.search: "search", self.food: "food", self.follow_up: "follow_up"}
+        return SharedJobScheduler(work_queue, kinds, lambda job: classes[job[1]], ["follow_up", "search", "food"],
+                                  poll_interval=0.01, recover_interval=0)
+
+    def test_jobs_shared_between_processes(self):
+        client = FakeRedis()
+        first_queue = RedisWorkQueue(client, owner="first")
+        second_queue = RedisWorkQueue(client, owner="second")
+        first = self.new_scheduler(first_queue)
+        second = self.new_scheduler(second_queue)
+
+        # shared jobs go to the work queue, follow-up jobs stay local
+        first.add_source([(FOOD_URL, self.food), (SEARCH_URL, self.search)])
+        first.put((SEARCH_URL, self.follow_up))
+        self.assertEqual(3, first.qsize())
+        self.assertEqual(2, second.qsize())
+
+        self.assertEqual((SEARCH_URL, self.follow_up), first.get())
+        job = second.get()
+        self.assertEqual((SEARCH_URL, self.search), job)
+        second_queue.ack(job[0])
+        second.task_done(job)
+        first.task_done()
+
+        # join only returns once the other process has finished the last job
+        joined = threading.Event()
+        thread = threading.Thread(target=lambda: (first.join(), joined.set()))
+        thread.start()
+        job = second.get()
+        self.assertEqual((FOOD_URL, self.food), job)
+        self.assertFalse(joined.wait(0.05))
+        second_queue.ack(job[0])
+        second.task_done(job)
+        thread.join(1)
+        self.assertTrue(joined.is_set())
+
+        self.assertRaises(queue.Empty, second.get, timeout=0.05)
+        first.put(None)
+        self.assertIsNone(first.get())
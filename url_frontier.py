@@ -0,0 +1,52 @@
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+
+def canonical_url(url: str) -> str:
+    """
+    canonicalize a url so different links to the same page compare equal
+
+    Scheme and host are lowercased and fragments dropped. Food pages are keyed by the path up to and including /dp -
+    the number after /dp/ only selects a size of the product, and query strings only carry tracking parameters
+    :param url: url to canonicalize
+    :return: canonical form of the url
+    """
+    scheme, netloc, path, query, fragment = urlsplit(url.strip())
+    if "/dp/" in path:
+        path = path[:path.index("/dp/") + len("/dp")]
+        query = ""
+    return urlunsplit((scheme.lower(), netloc.lower(), path, query, ""))
+
+
+class CrawlFrontier:
+    """
+    Thread-safe record of every page enqueued during a scrape, used to drop links to pages that have already been
+    enqueued before they reach the scrape queue
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seen = set()
+        self.duplicates: int = 0
+
+    def add(self, url: str) -> bool:
+        """
+        record a page as enqueued
+        :param url: url of the page
+        :return: True if the page is new to the frontier, False if it is a duplicate
+        """
+        key = canonical_url(url)
+        with self.lock:
+            if key in self.seen:
+                self.duplicates += 1
+                return False
+            self.seen.add(key)
+            return True
+
+    def clear(self) -> None:
+        """
+        forget every page enqueued, i.e. before starting a new scrape
+        """
+        with self.lock:
+            self.seen.clear()
+            self.duplicates = 0
@@ -0,0 +1,287 @@
+import hashlib
+import os
+import random
+import socket
+import threading
+import uuid
+from time import time
+
+import sqlalchemy as sa
+
+from models import QueuedJob, database_engine
+from url_frontier import canonical_url
+
+
+def default_owner() -> str:
+    """
+    :return: name identifying this process among every process of a distributed crawl
+    """
+    return "{}-{}-{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])[-64:]
+
+
+class WorkQueue:
+    """
+    Base WorkQueue class - a queue of scraping jobs shared by the scraper processes of a distributed crawl, which may
+    run on different machines
+
+    A job is a page to scrape - its url, its kind ("search" or "food") and its priority (lower is leased first). Each
+    page is only queued once per crawl, however many processes find links to it. Processes lease jobs one at a time,
+    and acknowledge each once done - a job whose lease expires before it is acknowledged (i.e. because its process
+    died) is recovered, and handed out again. Jobs are handed out at least once, so a process that stalls for longer
+    than a lease may find its job has been done twice
+    """
+
+    def __init__(self, lease_seconds: float = 300.0, owner: str = None):
+        """
+        :param lease_seconds: number of seconds a job is leased for, before it can be recovered
+        :param owner: name identifying this process, defaults to its host name, process id and a random suffix
+        """
+        self.lease_seconds: float = lease_seconds
+        self.owner: str = owner if owner is not None else default_owner()
+        self.recovered: int = 0  # number of jobs this process recovered from expired leases
+
+    def put(self, jobs: list) -> int:
+        """
+        queue jobs, unless their page has already been queued this crawl
+        :param jobs: list of (url, kind, priority) tuples
+        :return: number of jobs queued
+        """
+        raise NotImplementedError
+
+    def lease(self):
+        """
+        lease the next job, to this process
+        :return: (url, kind) tuple of the job, or None if no job is waiting
+        """
+        raise NotImplementedError
+
+    def ack(self, url: str) -> bool:
+        """
+        record a job leased by this process as done
+        :param url: url of the job
+        :return: True if the job was done, False if this process no longer held its lease
+        """
+        raise NotImplementedError
+
+    def recover(self) -> int:
+        """
+        put jobs whose leases have expired back in the queue
+        :return: number of jobs recovered
+        """
+        raise NotImplementedError
+
+    def waiting(self) -> int:
+        """
+        :return: number of jobs waiting to be leased
+        """
+        raise NotImplementedError
+
+    def drained(self) -> bool:
+        """
+        :return: True if no jobs are waiting or leased, so every process has finished the crawl, otherwise False
+        """
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """
+        remove every job, and forget every page queued, to start a new crawl
+        """
+        raise NotImplementedError
+
+
+class SqlWorkQueue(WorkQueue):
+    """
+    WorkQueue kept in a table of the scraper's database (MySQL or SQLite), shared by every process scraping into it
+
+    A job is leased by a conditional update that only succeeds if the job is still waiting, so processes leasing at
+    once never get the same job - each tries a few of the oldest jobs of the highest priority waiting, in random order,
+    so they rarely race for the same row
+    """
+
+    def __init__(self, database: str, lease_seconds: float = 300.0, owner: str = None, candidates: int = 16):
+        """
+        :param database: database url, SQLite path or MySQL configuration file - see models.database_url
+        :param lease_seconds: number of seconds a job is leased for, before it can be recovered
+        :param owner: name identifying this process, defaults to its host name, process id and a random suffix
+        :param candidates: number of waiting jobs each lease picks from
+        """
+        super().__init__(lease_seconds, owner)
+        self.candidates: int = candidates
+        self.engine = database_engine(database)
+        QueuedJob.__table__.create(self.engine, checkfirst=True)
+        self.table = QueuedJob.__table__
+
+    @staticmethod
+    def url_key(url: str) -> str:
+        return hashlib.sha1(canonical_url(url).encode()).hexdigest()
+
+    def put(self, jobs: list) -> int:
+        rows = [{"url_key": self.url_key(url), "url": url, "kind": kind, "priority": priority, "state": "waiting"}
+                for url, kind, priority in jobs]
+        if not rows:
+            return 0
+        # pages already queued are skipped by the unique url_key
+        insert = self.table.insert().prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+        with self.engine.begin() as connection:
+            return connection.execute(insert, rows).rowcount
+
+    def lease(self):
+        table = self.table
+        for attempt in range(3):
+            with self.engine.begin() as connection:
+                candidates = connection.execute(
+                    sa.select([table.c.id, table.c.url, table.c.kind, table.c.priority])
+                    .where(table.c.state == "waiting").order_by(table.c.priority, table.c.id)
+                    .limit(self.candidates)).fetchall()
+            if not candidates:
+                return None
+            candidates = [row for row in candidates if row.priority == candidates[0].priority]
+            random.shuffle(candidates)
+            for job_id, url, kind, priority in candidates:
+                with self.engine.begin() as connection:
+                    leased = connection.execute(
+                        table.update().where(sa.and_(table.c.id == job_id, table.c.state == "waiting"))
+                        .values(state="leased", owner=self.owner, lease_expires=time() + self.lease_seconds))
+                if leased.rowcount == 1:
+                    return url, kind
+            # every candidate was leased by other processes first - try the next ones
+        return None
+
+    def ack(self, url: str) -> bool:
+        table = self.table
+        with self.engine.begin() as connection:
+            done = connection.execute(
+                table.update().where(sa.and_(table.c.url_key == self.url_key(url), table.c.state == "leased",
+                                             table.c.owner == self.owner))
+                .values(state="done", owner=None, lease_expires=None))
+        return done.rowcount == 1
+
+    def recover(self) -> int:
+        table = self.table
+        with self.engine.begin() as connection:
+            recovered = connection.execute(
+                table.update().where(sa.and_(table.c.state == "leased", table.c.lease_expires < time()))
+                .values(state="waiting", owner=None, lease_expires=None)).rowcount
+        self.recovered += recovered
+        return recovered
+
+    def waiting(self) -> int:
+        with self.engine.begin() as connection:
+            return connection.execute(sa.select([sa.func.count()]).select_from(self.table)
+                                      .where(self.table.c.state == "waiting")).scalar()
+
+    def drained(self) -> bool:
+        with self.engine.begin() as connection:
+            unfinished = connection.execute(sa.select([self.table.c.id])
+                                            .where(self.table.c.state.in_(["waiting", "leased"])).limit(1)).first()
+        return unfinished is None
+
+    def clear(self) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(self.table.delete())
+
+
+class RedisWorkQueue(WorkQueue):
+    """
+    WorkQueue kept in a Redis (or Redis-compatible) server, for crawls spread over more processes than the database
+    should take queries from
+
+    Pages queued are remembered in a set, and waiting jobs are kept in a list per priority. A job is leased by moving
+    it atomically from its waiting list to the list of leased jobs, and setting a key that expires with the lease -
+    recovery moves jobs whose key has expired back to the front of their waiting list. Each step is one command, so a
+    process dying between the two commands of a put or a recovery can lose that one job, until the next crawl
+    """
+
+    def __init__(self, client, prefix: str = "scraper", lease_seconds: float = 300.0, owner: str = None,
+                 levels: int = 4):
+        """
+        :param client: Redis client, i.e. redis.Redis(decode_responses=True) - see from_url
+        :param prefix: prefix of the keys of the queue, so several queues can share a server
+        :param lease_seconds: number of seconds a job is leased for, before it can be recovered
+        :param owner: name identifying this process, defaults to its host name, process id and a random suffix
+        :param levels: number of priorities jobs can have - jobs are leased from priority 0 first
+        """
+        super().__init__(lease_seconds, owner)
+        self.client = client
+        self.prefix: str = prefix
+        self.levels: int = levels
+        self.seen: str = prefix + ":seen"
+        self.leased: str = prefix + ":leased"
+
+        self.lock = threading.Lock()
+        self.leases = dict()  # url -> queued entry, of jobs leased by this process
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs):
+        """
+        :param url: url of the Redis server, i.e. "redis://localhost:6379/0"
+        :param kwargs: any other RedisWorkQueue options
+        :return: RedisWorkQueue on the server
+        """
+        try:
+            import redis
+        except ImportError:
+            raise Exception("The redis package is needed for a Redis work queue")
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _waiting_list(self, priority: int) -> str:
+        return "{}:waiting:{}".format(self.prefix, min(max(int(priority), 0), self.levels - 1))
+
+    def _lease_key(self, entry: str) -> str:
+        return "{}:lease:{}".format(self.prefix, entry)
+
+    def put(self, jobs: list) -> int:
+        queued = 0
+        for url, kind, priority in jobs:
+            if self.client.sadd(self.seen, canonical_url(url)):
+                # entries carry their priority, so recovered jobs go back to the right list
+                self.client.lpush(self._waiting_list(priority), "{} {} {}".format(priority, kind, url))
+                queued += 1
+        return queued
+
+    def lease(self):
+        for priority in range(self.levels):
+            entry = self.client.rpoplpush(self._waiting_list(priority), self.leased)
+            if entry is not None:
+                self.client.set(self._lease_key(entry), self.owner, px=int(self.lease_seconds * 1000))
+                priority, kind, url = entry.split(" ", 2)
+                with self.lock:
+                    self.leases[url] = entry
+                return url, kind
+        return None
+
+    def ack(self, url: str) -> bool:
+        with self.lock:
+            entry = self.leases.pop(url, None)
+        if entry is None:
+            return False
+        owner = self.client.get(self._lease_key(entry))
+        if owner is not None and owner != self.owner:
+            return False  # the lease expired, and the job was leased again by another process
+        self.client.delete(self._lease_key(entry))
+        return self.client.lrem(self.leased, 1, entry) > 0
+
+    def recover(self) -> int:
+        recovered = 0
+        for entry in self.client.lrange(self.leased, 0, -1):
+            if not self.client.exists(self._lease_key(entry)) and self.client.lrem(self.leased, 1, entry):
+                self.client.rpush(self._waiting_list(entry.split(" ", 1)[0]), entry)
+                recovered += 1
+        self.recovered += recovered
+        return recovered
+
+    def waiting(self) -> int:
+        return sum(self.client.llen(self._waiting_list(priority)) for priority in range(self.levels))
+
+    def drained(self) -> bool:
+        # count every list in one transaction, so a job moving between lists isn't missed
+        pipeline = self.client.pipeline()
+        pipeline.llen(self.leased)
+        for priority in range(self.levels):
+            pipeline.llen(self._waiting_list(priority))
+        return sum(pipeline.execute()) == 0
+
+    def clear(self) -> None:
+        self.client.delete(self.seen, self.leased, *[self._waiting_list(priority) for priority in range(self.levels)])
+        with self.lock:
+            self.leases.clear()